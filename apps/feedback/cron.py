@@ -1,13 +1,16 @@
 import datetime
 import random
+import time
 
 from django.conf import settings
 from django.db import transaction, models
 
 import cronjobs
+import swearwords
 
 import input
-from feedback.models import Opinion, extract_terms
+from feedback.models import (Opinion, OpinionCount, extract_terms,
+                             save_spooled, spool)
 
 
 DEFAULT_NUM_OPINIONS = 100
@@ -91,3 +94,59 @@ def populate(num_opinions=None, product='mobile', type=None, locale=None):
 
     models.signals.post_save.connect(extract_terms, sender=Opinion,
                                      dispatch_uid='extract_terms')
+
+
+@cronjobs.register
+def rebuild_opinion_counts():
+    """
+    Backfill the daily opinion counters (OpinionCount) from scratch. They are
+    kept up to date incrementally afterwards.
+    """
+    OpinionCount.objects.rebuild()
+
+
+@cronjobs.register
+def benchmark_swearwords(runs=2000):
+    """
+    Compare the swear word matcher with the equivalent alternation regex on
+    140 and 250 character feedback.  Usage: ``cron benchmark_swearwords [runs]``
+    """
+    start = time.time()
+    regex = swearwords.badword_re()
+    print 'regex compile    %6.1fms' % ((time.time() - start) * 1000)
+    start = time.time()
+    matcher = swearwords.Matcher(list(swearwords.WORDLIST))
+    print 'matcher build    %6.1fms' % ((time.time() - start) * 1000)
+
+    def feedback(length):
+        # One sample is shorter than that: string a few together.
+        text = sample()
+        while len(text) < length:
+            text += ' ' + sample()
+        return text[:length].lower()
+
+    for length in (140, 250):
+        texts = [feedback(length) for i in xrange(int(runs))]
+        for name, find in (('regex', regex.findall),
+                           ('matcher', matcher.find)):
+            start = time.time()
+            for text in texts:
+                find(text)
+            print '%-7s  %d chars  %6.1fus/call' % (
+                name, length, (time.time() - start) / len(texts) * 1e6)
+
+
+@cronjobs.register
+def drain_spool(interval=None):
+    """
+    Write spooled feedback (see settings.FEEDBACK_SPOOL) to the database.
+    With an ``interval`` (in seconds), keep draining every so often: that's
+    how it runs on each web head.  Whatever a crashed drain left behind is
+    replayed first.
+    """
+    while True:
+        spool.drain(save_spooled, settings.FEEDBACK_SPOOL_BATCH_SIZE,
+                    committed=Opinion.objects.announce)
+        if not interval:
+            return
+        time.sleep(float(interval))
@@ -1,4 +1,3 @@
-import datetime
 import urlparse
 
 from django import forms
@@ -10,9 +9,7 @@ from tower import ugettext as _, ugettext_lazy as _lazy
 
 from input import OPINION_PRAISE, OPINION_ISSUE, OPINION_IDEA
 from feedback.models import Opinion
-from feedback.validators import (validate_swearwords, validate_no_html,
-                                 validate_no_email, validate_no_urls,
-                                 validate_no_private_ips,
+from feedback.validators import (validate_content, validate_no_private_ips,
                                  ExtendedURLValidator)
 
 
@@ -79,19 +76,25 @@ class FeedbackForm(forms.Form):
     # Testpilot extension on Mobile.
     # Do not change unless you know what you are doing.
     # TODO @deprecated the id_* IDs used to be used by the extension.
-    manufacturer = forms.CharField(required=False, widget=forms.HiddenInput(
-        attrs={'class': 'manufacturer'}))
-    device = forms.CharField(required=False, widget=forms.HiddenInput(
-        attrs={'class': 'device'}))
+    manufacturer = forms.CharField(required=False, max_length=255,
+        widget=forms.HiddenInput(attrs={'class': 'manufacturer'}))
+    device = forms.CharField(required=False, max_length=255,
+        widget=forms.HiddenInput(attrs={'class': 'device'}))
+
+    def __init__(self, *args, **kwargs):
+        # The product the feedback is about, for duplicate detection.
+        self.product = kwargs.pop('product', None)
+        super(FeedbackForm, self).__init__(*args, **kwargs)
 
     def clean(self):
         # Ensure this is not a recent duplicate submission.
         if 'description' in self.cleaned_data:
-            dupes = Opinion.objects.filter(
-                description=self.cleaned_data['description'],
-                created__gte=(datetime.datetime.now() -
-                              datetime.timedelta(minutes=5)))[:1]
-            if dupes:
+            try:
+                type = int(self.cleaned_data.get('_type'))
+            except (TypeError, ValueError):
+                type = None
+            if Opinion.objects.is_duplicate(self.cleaned_data['description'],
+                                            self.product, type):
                 raise ValidationError(
                         _('We already got your feedback! Thanks.'))
 
@@ -107,8 +110,7 @@ class PraiseForm(FeedbackForm):
             attrs={'data-max-length': OPINION_PRAISE.max_length}),
         label=_lazy('Please describe what you liked.'),
         max_length=OPINION_PRAISE.max_length,
-        validators=[validate_swearwords, validate_no_html,
-                    validate_no_email, validate_no_urls],
+        validators=[validate_content],
         required=True
         )
     _type = forms.CharField(initial=OPINION_PRAISE.id,
@@ -124,8 +126,7 @@ class IssueForm(FeedbackForm):
             attrs={'data-max-length': OPINION_ISSUE.max_length}),
         label=_lazy('Please describe your problem below.'),
         max_length=OPINION_ISSUE.max_length,
-        validators=[validate_swearwords, validate_no_html,
-                    validate_no_email, validate_no_urls],
+        validators=[validate_content],
         required=True
         )
     _type = forms.CharField(initial=OPINION_ISSUE.id,
@@ -141,8 +142,7 @@ class IdeaForm(FeedbackForm):
             attrs={'data-max-length': OPINION_IDEA.max_length}),
         label=_lazy('Describe your idea below.'),
         max_length=OPINION_IDEA.max_length,
-        validators=[validate_swearwords, validate_no_html,
-                    validate_no_email, validate_no_urls],
+        validators=[validate_content],
         required=True
         )
     _type = forms.CharField(initial=OPINION_IDEA.id,
@@ -1,19 +1,28 @@
-from datetime import timedelta
+from calendar import timegm
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.db import models
-from django.db.models import Count, signals
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import Count, Sum, signals
+from django.dispatch import Signal
 
 import caching.base
 import commonware
 from elasticutils import es_required
+from product_details import product_details
 from pyes import djangoutils
 from pyes.exceptions import NotFoundException as PyesNotFoundException
 
 from feedback import query, utils
-from feedback.utils import ua_parse, extract_terms, smart_truncate
-from input import PRODUCT_IDS, OPINION_TYPES, OPINION_PRAISE, PLATFORMS
+from feedback.utils import (ua_parse, extract_terms, smart_truncate,
+                            index_locale, utc_day, INDEX_LOCALES)
+from input import (PRODUCT_IDS, OPINION_TYPES, OPINION_PRAISE, OPINION_ISSUE,
+                   OPINION_IDEA, OPINION_USAGE, PLATFORMS)
+from input.cachequeue import CacheQueue
 from input.models import ModelBase
+from input.spool import Spool
 from input.urlresolvers import reverse
 
 log = commonware.log.getLogger('feedback')
@@ -34,6 +43,69 @@ class OpinionManager(caching.base.CachingManager):
 
         return qs
 
+    def is_duplicate(self, description, product=None, type=None):
+        """
+        Whether the same feedback was submitted within the last
+        ``FEEDBACK_DEDUPE_WINDOW`` seconds.  Recent submissions are
+        remembered in the cache; should it have lost one, we fall back to
+        the (indexed) ``description_hash`` column.
+        """
+        hash = utils.description_hash(description, product, type)
+        if cache.get(dedupe_cache_key(hash)):
+            return True
+        since = (datetime.now() -
+                 timedelta(seconds=settings.FEEDBACK_DEDUPE_WINDOW))
+        return bool(self.no_cache().filter(description_hash=hash,
+                                           created__gte=since)[:1])
+
+    def insert_many(self, opinions, chunk_size=100, announce=True):
+        """
+        Save a list of new opinions with multi-row INSERTs.  Instead of the
+        per-opinion save signals, ``opinions_created`` is sent once for all
+        of them (see ``announce``).  The opinions get their ids assigned.
+
+        The ids of a multi-row INSERT are consecutive, starting at
+        LAST_INSERT_ID() (InnoDB's default auto-increment lock mode).
+        """
+        if not opinions:
+            return
+        now = datetime.now()
+        for opinion in opinions:
+            parse_user_agent(Opinion, opinion)
+            hash_description(Opinion, opinion)
+            opinion.created = opinion.created or now
+
+        fields = [f for f in Opinion._meta.local_fields
+                  if not isinstance(f, models.AutoField)]
+        row = '(%s)' % ', '.join(['%s'] * len(fields))
+        cursor = connection.cursor()
+        for i in xrange(0, len(opinions), chunk_size):
+            chunk = opinions[i:i + chunk_size]
+            cursor.execute('INSERT INTO %s (%s) VALUES %s' % (
+                Opinion._meta.db_table,
+                ', '.join(connection.ops.quote_name(f.column)
+                          for f in fields),
+                ', '.join([row] * len(chunk))),
+                [f.get_db_prep_save(getattr(o, f.attname),
+                                    connection=connection)
+                 for o in chunk for f in fields])
+            first = cursor.lastrowid
+            for offset, opinion in enumerate(chunk):
+                opinion.id = first + offset
+        OpinionCount.objects.add_opinions(opinions)
+        transaction.commit_unless_managed()
+
+        if announce:
+            self.announce(opinions)
+
+    def announce(self, opinions):
+        """
+        Send ``opinions_created`` for opinions saved by ``insert_many``.  Its
+        receivers queue background tasks reading the opinions, so inside a
+        transaction this has to wait until it's committed.
+        """
+        opinions_created.send(sender=Opinion, opinions=opinions)
+
     def between(self, date_start=None, date_end=None):
         ret = self.get_query_set()
         if date_start:
@@ -43,6 +115,24 @@ class OpinionManager(caching.base.CachingManager):
         return ret
 
 
+def opinion_document(values):
+    """
+    The ElasticSearch document for an opinion, given its field values (as
+    from ``djangoutils.get_values`` or ``Opinion.objects.values()``).
+    """
+    data = dict(values)
+    # ``_type`` is reserved in ElasticSearch.
+    data['type'] = data.pop('_type')
+    data['has_url'] = bool(data.get('url'))
+    data.pop('description_hash', None)
+    return data
+
+
+# Sent with a list of ``opinions`` saved by Opinion.objects.insert_many, once
+# they are committed.
+opinions_created = Signal(providing_args=['opinions'])
+
+
 class Opinion(ModelBase):
     """A single feedback item."""
     _type = models.PositiveSmallIntegerField(blank=True,
@@ -50,6 +140,10 @@ class Opinion(ModelBase):
 
     url = models.URLField(verify_exists=False, blank=True)
     description = models.TextField(blank=True)
+    # For duplicate detection (c.f. utils.description_hash); indexed together
+    # with ``created``.
+    description_hash = models.CharField(max_length=40, blank=True,
+                                        editable=False)
     terms = models.ManyToManyField('Term', related_name='used_in')
 
     user_agent = models.CharField(
@@ -109,22 +203,37 @@ class Opinion(ModelBase):
     def get_url_path(self):
         return reverse('opinion.detail', args=(self.id,))
 
+    def search_document(self):
+        """The opinion as indexed in ElasticSearch (c.f. search.elastic)."""
+        values = djangoutils.get_values(self)
+        values.setdefault('_type', self._type)
+        return opinion_document(values)
+
     @es_required
-    def update_index(self, es, bulk=False):
-        data = djangoutils.get_values(self)
+    def update_index(self, es, bulk=False, indexes=None):
+        """
+        Index the opinion into ``indexes`` (by default, the live index and
+        the one being rebuilt, if any: see ``search.elastic``).
+        """
+        from search.elastic import write_indexes
+        data = self.search_document()
         try:
-            es.index(data, settings.ES_INDEX, 'opinion', self.id, bulk=bulk)
+            for index in indexes or write_indexes():
+                es.index(data, index, 'opinion', self.id, bulk=bulk)
         except Exception, e:
             log.error("ElasticSearch errored for opinion (%s): %s" % (self, e))
         else:
             log.debug('Opinion %d added to search index.' % self.id)
 
     @es_required
-    def remove_from_index(self, es, bulk=False):
+    def remove_from_index(self, es, bulk=False, indexes=None):
+        from search.elastic import write_indexes
         try:
-            es.delete(settings.ES_INDEX, 'opinion', self.id, bulk=bulk)
-        except PyesNotFoundException:
-            pass
+            for index in indexes or write_indexes():
+                try:
+                    es.delete(index, 'opinion', self.id, bulk=bulk)
+                except PyesNotFoundException:
+                    pass
         except Exception, e:
             log.error("ElasticSearch error removing opinion (%s): %s" %
                       (self, e))
@@ -140,29 +249,369 @@ def parse_user_agent(sender, instance, **kw):
         instance.platform = parsed['platform']
 
 
-# TODO: add this to celery
+# Opinions waiting for term extraction, see feedback.tasks.
+term_queue = CacheQueue('feedback.terms', 'feedback.tasks.flush_term_queue',
+                        'TERM_BATCH_SIZE', 'TERM_BATCH_MS')
+
+
 def extract_terms(sender, instance, **kw):
-    if instance.terms.all() or settings.DISABLE_TERMS:
+    """Queue the opinion for term extraction."""
+    if settings.DISABLE_TERMS:
+        return
+    term_queue.push(instance.id)
+
+
+def extract_terms_many(sender, opinions, **kw):
+    if settings.DISABLE_TERMS:
+        return
+    term_queue.push_many(o.id for o in opinions)
+
+
+def add_terms(opinion_ids):
+    """
+    Extract the terms of a batch of opinions and store them, in a fixed
+    number of queries: one insert for all new terms and one for all the
+    opinion-term links.  Opinions that already have terms are skipped.
+    """
+    ids = list(opinion_ids)
+    if not ids:
+        return
+    field = Opinion._meta.get_field('terms')
+    table = field.m2m_db_table()
+    opinion_col, term_col = field.m2m_column_name(), field.m2m_reverse_name()
+    placeholders = lambda n, p='%s': ', '.join([p] * n)
+    cursor = connection.cursor()
+
+    cursor.execute('SELECT DISTINCT %s FROM %s WHERE %s IN (%s)' % (
+        opinion_col, table, opinion_col, placeholders(len(ids))), ids)
+    done = set(row[0] for row in cursor.fetchall())
+
+    found = {}
+    for id, description in (Opinion.objects.no_cache()
+                            .filter(pk__in=[i for i in ids if i not in done])
+                            .values_list('id', 'description')):
+        terms = set(utils.extract_terms(description))
+        if terms:
+            found[id] = terms
+    words = set().union(*found.values())
+    if not words:
+        return
+
+    cursor.execute('INSERT IGNORE INTO %s (term, hidden) VALUES %s' % (
+        Term._meta.db_table, placeholders(len(words), '(%s, 0)')),
+        list(words))
+    term_ids = dict(Term.objects.no_cache().filter(term__in=words)
+                    .values_list('term', 'id'))
+    for word in words - set(term_ids):
+        # Stored differently, but equal to an existing term by collation.
+        existing = (Term.objects.no_cache().filter(term=word)
+                    .values_list('id', flat=True)[:1])
+        if existing:
+            term_ids[word] = existing[0]
+
+    links = set((id, term_ids[w]) for id, terms in found.items()
+                for w in terms if w in term_ids)
+    if not links:
         return
-    terms = (t for t in utils.extract_terms(instance.description) if
-             len(t) >= settings.MIN_TERM_LENGTH)
-    for term in terms:
-        this_term, created = Term.objects.get_or_create(term=term)
-        instance.terms.add(this_term)
+    cursor.execute('INSERT IGNORE INTO %s (%s, %s) VALUES %s' % (
+        table, opinion_col, term_col, placeholders(len(links), '(%s, %s)')),
+        [value for link in links for value in link])
+    transaction.commit_unless_managed()
+
 
 def post_to_elastic(sender, instance, **kw):
-    """Asynchronously update the opinion in ElasticSearch."""
-    from search import tasks
-    tasks.add_to_index.delay([instance.id])
+    """Queue the opinion for (re)indexing in ElasticSearch."""
+    from search import indexqueue
+    indexqueue.enqueue(indexqueue.INDEX, instance.id)
+
+
+def unindex_opinion(sender, instance, **kw):
+    """Queue the opinion for removal from ElasticSearch."""
+    from search import indexqueue
+    indexqueue.enqueue(indexqueue.DELETE, instance.id)
+
+
+def post_many_to_elastic(sender, opinions, **kw):
+    from search import indexqueue
+    indexqueue.enqueue_many(indexqueue.INDEX, [o.id for o in opinions])
 
 signals.pre_save.connect(parse_user_agent, sender=Opinion)
 signals.post_save.connect(extract_terms, sender=Opinion,
                           dispatch_uid='extract_terms')
+opinions_created.connect(extract_terms_many, sender=Opinion,
+                         dispatch_uid='extract_terms')
 signals.post_save.connect(post_to_elastic, sender=Opinion)
-
-unindex_opinion = lambda instance, **kwargs: instance.remove_from_index()
+opinions_created.connect(post_many_to_elastic, sender=Opinion)
 signals.post_delete.connect(unindex_opinion, sender=Opinion)
 
+
+def hash_description(sender, instance, **kw):
+    instance.description_hash = utils.description_hash(
+        instance.description, instance.product, instance._type)
+
+
+def dedupe_cache_key(hash):
+    return '%sopinion:dedupe:%s' % (settings.CACHE_PREFIX, hash)
+
+
+def remember_opinion(sender, instance, created=False, **kw):
+    """Remember new feedback for duplicate detection."""
+    if created:
+        cache.set(dedupe_cache_key(instance.description_hash), 1,
+                  settings.FEEDBACK_DEDUPE_WINDOW)
+
+
+def remember_opinions(sender, opinions, **kw):
+    cache.set_many(dict((dedupe_cache_key(o.description_hash), 1)
+                        for o in opinions),
+                   settings.FEEDBACK_DEDUPE_WINDOW)
+
+signals.pre_save.connect(hash_description, sender=Opinion,
+                         dispatch_uid='hash_description')
+signals.post_save.connect(remember_opinion, sender=Opinion,
+                          dispatch_uid='remember_opinion')
+opinions_created.connect(remember_opinions, sender=Opinion,
+                         dispatch_uid='remember_opinion')
+
+
+# Write-behind spool of new opinions, see settings.FEEDBACK_SPOOL.
+spool = Spool('feedback.spool', settings.FEEDBACK_SPOOL_DIR)
+
+
+def spool_opinion(opinion):
+    """Spool a new opinion for ``save_spooled`` instead of saving it."""
+    parse_user_agent(Opinion, opinion)
+    hash_description(Opinion, opinion)
+    spool.append({'type': opinion._type, 'url': opinion.url,
+                  'description': opinion.description,
+                  'user_agent': opinion.user_agent, 'locale': opinion.locale,
+                  'manufacturer': opinion.manufacturer,
+                  'device': opinion.device,
+                  'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+    # It isn't in the database yet, but it counts as a duplicate already.
+    cache.set(dedupe_cache_key(opinion.description_hash), 1,
+              settings.FEEDBACK_DEDUPE_WINDOW)
+
+
+def save_spooled(records):
+    """
+    Save opinions spooled by ``spool_opinion``.  Returns them, to be
+    announced once the spool drain committed them.
+    """
+    opinions = [Opinion(
+        _type=r['type'], url=r['url'], description=r['description'],
+        user_agent=r['user_agent'], locale=r['locale'],
+        manufacturer=r['manufacturer'], device=r['device'],
+        created=datetime.strptime(r['created'], '%Y-%m-%d %H:%M:%S'))
+        for r in records]
+    Opinion.objects.insert_many(opinions, announce=False)
+    return opinions
+
+
+def opinion_cache_key(pk):
+    """Cache key of a single hydrated opinion, c.f. search.client.hydrate."""
+    return '%sopinion:%s' % (settings.CACHE_PREFIX, pk)
+
+
+def uncache_opinion(sender, instance, **kw):
+    cache.delete(opinion_cache_key(instance.id))
+
+signals.post_save.connect(uncache_opinion, sender=Opinion,
+                          dispatch_uid='uncache_opinion')
+signals.post_delete.connect(uncache_opinion, sender=Opinion,
+                            dispatch_uid='uncache_opinion')
+
+
+# The counters' day and locale of an opinion in SQL, c.f. utc_day and
+# index_locale.
+COUNT_DAY_SQL = ("DATE('1970-01-01') + "
+                 "INTERVAL UNIX_TIMESTAMP(created) DIV 86400 DAY")
+COUNT_LOCALE_SQL = ("IF(locale IN (%s), locale, "
+                    "SUBSTRING_INDEX(locale, '-', 1))" %
+                    ', '.join("'%s'" % l for l in INDEX_LOCALES))
+
+
+class OpinionCountManager(models.Manager):
+    def add(self, dimensions, delta=1):
+        """Atomically add ``delta`` to the counter for ``dimensions``."""
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO feedback_opinioncount '
+            '(day, type, product, version, platform, locale, count) '
+            'VALUES (%s, %s, %s, %s, %s, %s, %s) '
+            'ON DUPLICATE KEY UPDATE count = count + VALUES(count)',
+            list(dimensions) + [delta])
+        transaction.commit_unless_managed()
+
+    def add_opinions(self, opinions):
+        """Count new opinions, with one update per counter."""
+        counts = defaultdict(int)
+        for opinion in opinions:
+            counts[_count_dimensions(opinion)] += 1
+        for dimensions, count in counts.items():
+            self.add(dimensions, count)
+
+    def rebuild(self):
+        """Recount everything from the opinions table."""
+        cursor = connection.cursor()
+        cursor.execute('DELETE FROM feedback_opinioncount')
+        cursor.execute(
+            'INSERT INTO feedback_opinioncount '
+            '(day, type, product, version, platform, locale, count) '
+            'SELECT %(day)s, type, product, version, platform, %(locale)s, '
+            '       COUNT(*) '
+            'FROM feedback_opinion '
+            'GROUP BY %(day)s, type, product, version, platform, %(locale)s'
+            % dict(day=COUNT_DAY_SQL, locale=COUNT_LOCALE_SQL))
+        transaction.commit_unless_managed()
+
+    def between(self, date_start, date_end, type=None, product=None,
+                version=None, platform=None, locale=None, **kwargs):
+        """
+        Counters for a date range, restricted like a dashboard search.
+        'unknown' platforms and locales are the empty ones.  Like the search
+        index, this only covers OPINION_USAGE types.
+        """
+        # The (local) dates as UTC days, c.f. utc_day.
+        start = utc_day(datetime(*date_start.timetuple()[:3]))
+        end = utc_day(datetime(*date_end.timetuple()[:3]) +
+                      timedelta(days=1, seconds=-1))
+        qs = self.filter(day__gte=start, day__lte=end,
+                         _type__in=[t.id for t in OPINION_USAGE])
+        if type:
+            qs = qs.filter(_type=type)
+        if product:
+            qs = qs.filter(product=product)
+        if version:
+            qs = qs.filter(version=version)
+        if platform:
+            qs = qs.filter(platform=('' if platform.lower() == 'unknown'
+                                     else platform))
+        if locale:
+            qs = qs.filter(locale=('' if locale.lower() == 'unknown'
+                                   else locale))
+        return qs
+
+    def metas(self, fields, date_start, date_end, **kwargs):
+        """
+        Dashboard aggregates (``type``, ``locale``, ``platform``,
+        ``day_sentiment``) in the format search.client.Client returns them.
+        """
+        qs = self.between(date_start, date_end, **kwargs)
+        metas = {}
+
+        if 'type' in fields:
+            rows = qs.values('_type').annotate(cnt=Sum('count'))
+            metas['type'] = [dict(type=r['_type'], count=r['cnt'])
+                             for r in rows]
+
+        if 'locale' in fields:
+            metas['locale'] = self._facet(
+                qs, 'locale',
+                lambda l: l if l in product_details.languages else None)
+
+        if 'platform' in fields:
+            metas['platform'] = self._facet(
+                qs, 'platform', lambda p: p if p in PLATFORMS else None)
+
+        if 'day_sentiment' in fields:
+            names = {OPINION_PRAISE.id: 'praise', OPINION_ISSUE.id: 'issue',
+                     OPINION_IDEA.id: 'idea'}
+            daily = dict((name, []) for name in names.values())
+            rows = (qs.values('day', '_type').annotate(cnt=Sum('count'))
+                    .order_by('day'))
+            for r in rows:
+                if r['_type'] in names:
+                    daily[names[r['_type']]].append(
+                        (timegm(r['day'].timetuple()), r['cnt']))
+            metas['day_sentiment'] = daily
+
+        return metas
+
+    def _facet(self, qs, field, trans=lambda x: x or None):
+        counts = {}
+        for r in qs.values(field).annotate(cnt=Sum('count')):
+            key = trans(r[field])
+            counts[key] = counts.get(key, 0) + r['cnt']
+        return [{field: key, 'count': cnt} for key, cnt in
+                sorted(counts.items(), key=lambda x: x[1], reverse=True)]
+
+
+class OpinionCount(models.Model):
+    """
+    Daily number of opinions per type, product, version, platform and locale.
+    Maintained incrementally from Opinion saves and deletes, so dashboard
+    aggregates for any date range don't need to touch the opinions.
+
+    Days and locales are those of the search index: UTC days, and locales
+    collapsed to their language (c.f. utc_day and index_locale), so the
+    counters and search facets agree.
+    """
+    day = models.DateField()
+    _type = models.PositiveSmallIntegerField(db_column='type')
+    product = models.PositiveSmallIntegerField()
+    version = models.CharField(max_length=30)
+    platform = models.CharField(max_length=30)
+    locale = models.CharField(max_length=30, blank=True)
+    count = models.IntegerField(default=0)
+
+    objects = OpinionCountManager()
+
+    class Meta:
+        unique_together = ('day', '_type', 'product', 'version', 'platform',
+                           'locale')
+
+
+def _count_dimensions(opinion):
+    return (utc_day(opinion.created), opinion._type, opinion.product,
+            opinion.version, opinion.platform, index_locale(opinion.locale))
+
+
+def remember_count_dimensions(sender, instance, **kw):
+    """Remember the counter dimensions of an opinion as it was loaded."""
+    instance._old_count_dimensions = (
+        _count_dimensions(instance) if instance.id and instance.created
+        else None)
+
+
+def find_count_dimensions(sender, instance, raw=False, **kw):
+    """
+    Look up the old counter dimensions of an opinion that didn't go through
+    remember_count_dimensions (e.g. one unpickled from an older cache entry).
+    """
+    if (instance.id and not raw and
+        not hasattr(instance, '_old_count_dimensions')):
+        try:
+            old = Opinion.objects.no_cache().get(pk=instance.id)
+        except Opinion.DoesNotExist:
+            instance._old_count_dimensions = None
+        else:
+            instance._old_count_dimensions = _count_dimensions(old)
+
+
+def count_opinion(sender, instance, created, **kw):
+    new = _count_dimensions(instance)
+    old = getattr(instance, '_old_count_dimensions', None)
+    if created:
+        OpinionCount.objects.add(new)
+    elif old and old != new:
+        OpinionCount.objects.add(old, -1)
+        OpinionCount.objects.add(new)
+    instance._old_count_dimensions = new
+
+
+def uncount_opinion(sender, instance, **kw):
+    OpinionCount.objects.add(_count_dimensions(instance), -1)
+
+signals.post_init.connect(remember_count_dimensions, sender=Opinion,
+                          dispatch_uid='remember_count_dimensions')
+signals.pre_save.connect(find_count_dimensions, sender=Opinion,
+                         dispatch_uid='find_count_dimensions')
+signals.post_save.connect(count_opinion, sender=Opinion,
+                          dispatch_uid='count_opinion')
+signals.post_delete.connect(uncount_opinion, sender=Opinion,
+                            dispatch_uid='uncount_opinion')
+
 # post_Save for POST to metrics
 
 class TermManager(models.Manager):
@@ -0,0 +1,9 @@
+from celeryutils import task
+
+from feedback.models import add_terms, term_queue
+
+
+@task
+def flush_term_queue(**kw):
+    """Extract terms of the queued opinions (see feedback.models)."""
+    term_queue.flush(lambda items: add_terms(items.keys()))
@@ -4,7 +4,8 @@ from django import http
 from nose.tools import eq_
 
 from input import FIREFOX, MOBILE
-from feedback.utils import detect_language, ua_parse, smart_truncate
+from feedback.utils import (detect_language, ua_parse, ua_parse_cache,
+                            smart_truncate)
 
 
 def test_ua_parse():
@@ -62,6 +63,26 @@ def test_ua_parse():
         else:
             assert parsed is None
 
+
+def test_ua_parse_outdated():
+    ua = ('Mozilla/5.0 (Windows; U; Windows NT 6.1; en-US; rv:1.9.2.4) '
+          'Gecko/20100611 Firefox/%s')
+    assert ua_parse(ua % '3.6.4')['outdated']
+    assert not ua_parse(ua % FIREFOX.min_version)['outdated']
+
+
+def test_ua_parse_cache():
+    ua_parse_cache.clear()
+    ua = 'Mozilla/5.0 (Android; Linux armv71) Gecko/20100924 Fennec/4.0'
+    hits = ua_parse_cache.hits
+    eq_(ua_parse(ua), ua_parse(ua))
+    eq_(ua_parse_cache.hits, hits + 1)
+    # Failures are remembered, too.
+    ua_parse('Bogus')
+    ua_parse('Bogus')
+    eq_(ua_parse_cache.hits, hits + 2)
+
+
 def test_detect_language():
     """Check Accept-Language matching for feedback submission."""
     patterns = (
@@ -1,13 +1,19 @@
+import json
+import shutil
+import tempfile
 from datetime import datetime
 
 from django.conf import settings
 
+from mock import patch
 from nose.tools import eq_
 from pyquery import PyQuery as pq
 
 from input import FIREFOX, OPINION_PRAISE, OPINION_ISSUE
+from input.spool import Spool
 from input.tests import ViewTestCase, enforce_ua
 from input.urlresolvers import reverse
+from feedback.cron import drain_spool
 from feedback.models import Opinion
 
 
@@ -169,3 +175,122 @@ class BetaViewTests(ViewTestCase):
                             HTTP_USER_AGENT=(self.FX_UA % '20.0b2'),
                             follow=True)
         eq_(r.status_code, 200)
+
+
+class BulkViewTests(ViewTestCase):
+    """Tests for the bulk feedback endpoint."""
+
+    fixtures = ['feedback/opinions']
+    FX_UA = BetaViewTests.FX_UA
+
+    def _post(self, *items):
+        r = self.client.post(
+            reverse('feedback.bulk'),
+            '\n'.join(i if isinstance(i, str) else json.dumps(i)
+                      for i in items),
+            content_type='application/x-json-lines',
+            HTTP_USER_AGENT=(self.FX_UA % '20.0b2'))
+        eq_(r.status_code, 200)
+        return [json.loads(l) for l in r.content.splitlines()]
+
+    def test_get(self):
+        r = self.client.get(reverse('feedback.bulk'))
+        eq_(r.status_code, 405)
+
+    def test_bulk(self):
+        """Valid items are saved, invalid ones reported, in order."""
+        count = Opinion.objects.no_cache().count()
+        results = self._post(
+            {'type': 'praise', 'description': 'Bulk praise.'},
+            'not json',
+            {'type': 'nope', 'description': 'Bulk what?'},
+            {'type': 'issue', 'description': 'Bulk issue.',
+             'url': 'http://example.com/', 'add_url': True,
+             'locale': 'de'},
+            {'type': 'idea', 'description': ''},
+            {'type': 'praise', 'description': 'bulk  PRAISE.'})
+        eq_([r['status'] for r in results],
+            ['ok', 'error', 'error', 'ok', 'error', 'error'])
+        assert 'type' in results[2]['errors']
+        assert 'description' in results[4]['errors']
+        eq_(Opinion.objects.no_cache().count(), count + 2)
+
+        praise = Opinion.objects.no_cache().get(pk=results[0]['id'])
+        eq_(praise._type, OPINION_PRAISE.id)
+        eq_(praise.product, FIREFOX.id)
+        eq_(praise.version, '20.0b2')
+        issue = Opinion.objects.no_cache().get(pk=results[3]['id'])
+        eq_(issue.description, 'Bulk issue.')
+        eq_(issue.url, 'http://example.com/')
+        eq_(issue.locale, 'de')
+
+    def test_validation(self):
+        """Fields the form doesn't cover are checked per item, too."""
+        results = self._post(
+            {'type': 'praise', 'description': 'Bad locale.', 'locale': 'xx'},
+            {'type': 'praise', 'description': 'Long locale.',
+             'locale': 'de' * 100},
+            {'type': 'praise', 'description': 'Odd locale.', 'locale': [1]},
+            {'type': 'praise', 'description': 'Long UA.',
+             'user_agent': self.FX_UA % '20.0b2' + 'x' * 255},
+            {'type': 'praise', 'description': 'Long device.',
+             'device': 'x' * 256},
+            {'type': 'praise', 'description': 'Good locale.',
+             'locale': 'de-AT'})
+        eq_([r['status'] for r in results],
+            ['error', 'error', 'error', 'error', 'error', 'ok'])
+        for result, field in zip(results, ('locale', 'locale', 'locale',
+                                           'user_agent', 'device')):
+            assert field in result['errors'], result
+        eq_(Opinion.objects.no_cache().get(pk=results[5]['id']).locale, 'de')
+
+    def test_duplicates(self):
+        """Bulk items go through the duplicate check, too."""
+        eq_(self._post({'type': 'praise', 'description': 'Once.'})[0]
+            ['status'], 'ok')
+        eq_(self._post({'type': 'praise', 'description': 'Once.'})[0]
+            ['status'], 'error')
+
+    def test_too_many(self):
+        with patch.object(settings, 'BULK_FEEDBACK_MAX_ITEMS', 1):
+            r = self.client.post(
+                reverse('feedback.bulk'), '{}\n{}',
+                content_type='application/x-json-lines')
+        eq_(r.status_code, 400)
+
+
+class SpoolViewTests(ViewTestCase):
+    """Tests for feedback submission in write-behind mode."""
+
+    FX_UA = BetaViewTests.FX_UA
+
+    def setUp(self):
+        super(SpoolViewTests, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        spool = Spool('feedback.spool', self.directory)
+        self.patches = [patch.object(settings, 'FEEDBACK_SPOOL', True),
+                        patch('feedback.models.spool', spool),
+                        patch('feedback.cron.spool', spool)]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.directory)
+        super(SpoolViewTests, self).tearDown()
+
+    def test_spooled_submission(self):
+        count = Opinion.objects.no_cache().count()
+        r = self.client.post(
+            reverse('feedback'), {'description': 'Spooled!',
+                                  '_type': OPINION_ISSUE.id},
+            HTTP_USER_AGENT=(self.FX_UA % '20.0b2'))
+        eq_(r.status_code, 302)
+        eq_(Opinion.objects.no_cache().count(), count)
+
+        drain_spool()
+        latest = Opinion.objects.no_cache().order_by('-id')[0]
+        eq_(latest.description, 'Spooled!')
+        eq_(latest._type, OPINION_ISSUE.id)
+        eq_(latest.product, FIREFOX.id)
@@ -1,12 +1,17 @@
-from datetime import date
+from datetime import date, datetime
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
 
 from mock import patch
 from test_utils import eq_, TestCase
 
-from input import FIREFOX, WINDOWS_7
-from feedback.models import Opinion, Term
+from input import (FIREFOX, WINDOWS_7, OPINION_PRAISE, OPINION_ISSUE,
+                   OPINION_RATING, OPINION_USAGE)
+from feedback.models import (Opinion, OpinionCount, Term, add_terms,
+                             term_queue)
+from feedback.utils import utc_day
 from feedback.stats import frequent_terms
 
 
@@ -57,13 +62,148 @@ class TermTestCase(TestCase):
         eq_(unicode(t), u'Hello')
 
     @patch.object(settings._wrapped, 'DISABLE_TERMS', False)
-    def test_term_extraction(self):
+    @patch('feedback.tasks.flush_term_queue')
+    def test_term_extraction(self, flush_term_queue):
         """Make sure we create our terms."""
-        settings.DISABLE_TERMS = False
+        cache.clear()
         op = Opinion.objects.create(product=1, description='This is a test')
+        eq_(op.terms.count(), 0)
+        eq_(flush_term_queue.apply_async.call_count, 1)
+
+        term_queue.flush(lambda items: add_terms(items.keys()))
         terms = [term.term for term in op.terms.all()]
         eq_(terms, ['test'])
 
+    def test_add_terms_batch(self):
+        """Terms are shared between opinions and only added once."""
+        Term.objects.create(term='chocolate')
+        ops = [Opinion.objects.create(product=1, description=d) for d in
+               ('Chocolate milk', 'More chocolate please')]
+        add_terms([o.id for o in ops])
+        add_terms([o.id for o in ops])
+        eq_(Term.objects.filter(term='chocolate').count(), 1)
+        for o in ops:
+            assert 'chocolate' in [t.term for t in o.terms.all()]
+
+
+class DuplicateTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_is_duplicate(self):
+        o = Opinion.objects.create(product=FIREFOX.id,
+                                   _type=OPINION_PRAISE.id,
+                                   description='Fast  and shiny!')
+        dupe = lambda d, p=FIREFOX.id, t=OPINION_PRAISE.id: (
+            Opinion.objects.is_duplicate(d, p, t))
+        assert dupe('fast and shiny!')
+        assert not dupe('Fast and shiny!', t=OPINION_ISSUE.id)
+        assert not dupe('Slow and dull.')
+
+        # Without the cache, the database still knows.
+        cache.clear()
+        assert dupe('Fast and shiny!')
+
+        # Only recent submissions count.
+        Opinion.objects.filter(id=o.id).update(
+            created=datetime(2010, 1, 1))
+        assert not dupe('Fast and shiny!')
+
+
+class OpinionCountTestCase(TestCase):
+    fixtures = ['feedback/opinions']
+
+    def total(self, **kwargs):
+        return (OpinionCount.objects.filter(**kwargs)
+                .aggregate(total=Sum('count'))['total'] or 0)
+
+    def test_rebuild(self):
+        OpinionCount.objects.rebuild()
+        eq_(self.total(), Opinion.objects.count())
+
+    def test_incremental(self):
+        OpinionCount.objects.rebuild()
+        today = utc_day(datetime.now())
+        before = self.total(day=today)
+
+        op = Opinion.objects.create(product=FIREFOX.id, version='4.0',
+                                    platform='mac', description='Counted.')
+        eq_(self.total(day=today), before + 1)
+
+        # Moving an opinion to another day moves its count.
+        op.created = datetime(2010, 1, 1, 12)
+        op.save()
+        eq_(self.total(day=today), before)
+        eq_(self.total(day=date(2010, 1, 1)), 1)
+
+        op.delete()
+        eq_(self.total(day=date(2010, 1, 1)), 0)
+
+    def test_index_dimensions(self):
+        """Counters use the search index's UTC days and locales."""
+        created = datetime(2010, 1, 1, 23, 30)
+        for locale in ('de-DE', 'de', 'pt-BR'):
+            Opinion.objects.create(product=FIREFOX.id, version='4.0',
+                                   platform='mac', locale=locale,
+                                   created=created,
+                                   description='Counted %s.' % locale)
+        day = utc_day(created)
+        incremental = (self.total(day=day, locale='de'),
+                       self.total(day=day, locale='pt-BR'))
+        eq_(incremental, (2, 1))
+        eq_(self.total(locale='de-DE'), 0)
+
+        OpinionCount.objects.rebuild()
+        eq_((self.total(day=day, locale='de'),
+             self.total(day=day, locale='pt-BR')), incremental)
+
+    def test_reload(self):
+        """Loaded opinions know their old counter dimensions."""
+        op = Opinion.objects.create(product=FIREFOX.id, version='4.0',
+                                    platform='mac', description='Counted.')
+        op = Opinion.objects.no_cache().get(pk=op.id)
+        op.created = datetime(2010, 1, 1, 12)
+        op.save()
+        eq_(self.total(day=date(2010, 1, 1)), 1)
+
+    def test_unknown_locale(self):
+        """The search form's 'Unknown' locale means no locale."""
+        OpinionCount.objects.rebuild()
+        unknown = OpinionCount.objects.between(
+            date(2010, 1, 1), date.today(), locale='Unknown')
+        eq_(sum(c.count for c in unknown),
+            Opinion.objects.filter(locale='').count())
+
+    def test_metas(self):
+        OpinionCount.objects.rebuild()
+        metas = OpinionCount.objects.metas(
+            ('type', 'locale', 'day_sentiment'), date(2010, 1, 1),
+            date.today(), product=FIREFOX.id)
+        usage = Opinion.objects.filter(
+            product=FIREFOX.id, _type__in=[t.id for t in OPINION_USAGE])
+        eq_(sum(t['count'] for t in metas['type']), usage.count())
+        eq_(sum(l['count'] for l in metas['locale']), usage.count())
+        eq_(sum(c for _, c in metas['day_sentiment']['praise']),
+            Opinion.objects.filter(product=FIREFOX.id,
+                                   _type=OPINION_PRAISE.id).count())
+
+    def test_metas_like_search(self):
+        """No ratings, and only locales the search index knows."""
+        Opinion.objects.create(product=FIREFOX.id, version='4.0',
+                               platform='mac', locale='de-DE',
+                               _type=OPINION_RATING.id)
+        Opinion.objects.create(product=FIREFOX.id, version='4.0',
+                               platform='mac', locale='xx-YY',
+                               description='Counted.')
+        OpinionCount.objects.rebuild()
+        metas = OpinionCount.objects.metas(
+            ('type', 'locale'), date(2010, 1, 1), date.today(),
+            product=FIREFOX.id)
+        assert OPINION_RATING.id not in [t['type'] for t in metas['type']]
+        locales = [l['locale'] for l in metas['locale']]
+        assert 'de-DE' not in locales
+        assert 'xx' not in locales and 'xx-YY' not in locales
+
 
 @patch('django.db.models.query.QuerySet.filter')
 def test_opinion_manager_between(filter):
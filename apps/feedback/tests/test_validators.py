@@ -1,9 +1,13 @@
 from django.core.exceptions import ValidationError
 
+from nose.tools import eq_
 import test_utils
 
-from feedback.validators import (validate_no_urls, validate_no_private_ips,
+from feedback.validators import (validate_content, validate_no_email,
+                                 validate_no_html, validate_no_urls,
+                                 validate_no_private_ips, validate_swearwords,
                                  ExtendedURLValidator)
+from input import metrics
 
 
 class ValidatorTests(test_utils.TestCase):
@@ -53,3 +57,49 @@ class ValidatorTests(test_utils.TestCase):
                                   pattern[0])
             else:
                 validate_no_urls(pattern[0]) # Will fail if exception raised.
+
+
+class ContentValidatorTests(test_utils.TestCase):
+    def setUp(self):
+        metrics.get_sink().clear()
+
+    def messages(self, validators, text):
+        errors = []
+        for v in validators:
+            try:
+                v(text)
+            except ValidationError, e:
+                errors.extend(e.messages)
+        return errors
+
+    def test_same_as_separate_validators(self):
+        separate = (validate_swearwords, validate_no_html, validate_no_email,
+                    validate_no_urls)
+        for text in ('Firefox is fast.',
+                     'Shit, <b>this</b> crashes. Mail me@example.com or '
+                     'see http://example.com/',
+                     'www.example.com is <i>broken</i>',
+                     'a < b > c', 'me@localhost', 'example.com/~me',
+                     'damn www'):
+            eq_(self.messages([validate_content], text),
+                self.messages(separate, text), text)
+
+    def test_rules_are_skipped_and_timed(self):
+        validate_content('Firefox is fast')
+        stats = metrics.get_sink().stats
+        eq_(len(stats['feedback.validators.swearwords']), 1)
+        for rule in ('no_html', 'no_email', 'no_urls'):
+            assert 'feedback.validators.%s' % rule not in stats
+
+        self.assertRaises(ValidationError, validate_content, '<b>Hi</b>')
+        eq_(len(stats['feedback.validators.no_html']), 1)
+
+    def test_prose_skips_url_check(self):
+        """Plain sentences don't look like they might contain a URL."""
+        validate_content('Firefox works well with www. Thanks.')
+        assert 'feedback.validators.no_urls' not in metrics.get_sink().stats
+
+        self.assertRaises(ValidationError, validate_content,
+                          'Try www.example.com')
+        self.assertRaises(ValidationError, validate_content,
+                          'Visit example.com/~me')
@@ -1,15 +1,34 @@
 import re
+import time
+from datetime import datetime
 
 from django.conf import settings
-from django.utils.functional import memoize
-from django.utils.translation import to_locale
-from django.utils.translation.trans_real import parse_accept_lang_header
+from django.utils.hashcompat import sha_constructor
 
-from product_details import product_details
 from product_details.version_compare import Version
 from topia.termextract import extract
 
-from input import BROWSERS, PLATFORM_OTHER, PLATFORM_PATTERNS
+from input import (FIREFOX, MOBILE, PLATFORM_OTHER, PLATFORM_PATTERNS,
+                   UA_NAMES_FIREFOX)
+from input.urlresolvers import negotiate_language
+from input.utils import LRUCache
+
+
+# Browser, version and platform in one match.  The platform is the first
+# of PLATFORM_PATTERNS found anywhere in the string (a lookahead each, tried
+# in order); the browser is the last "<name>/<version>" in it (greedy .*).
+UA_RE = re.compile(
+    r'^(?:%s)?Mozilla.*(?P<browser>%s)/(?P<version>[^\s]*)(?P<rest>.*)$' % (
+        '|'.join(r'(?=[\s\S]*?(?P<platform%d>%s))' % (i, re.escape(pattern))
+                 for i, (pattern, short) in enumerate(PLATFORM_PATTERNS)),
+        '|'.join(UA_NAMES_FIREFOX)))
+
+# Parsed minimum versions, c.f. feedback.views.enforce_ua.
+MIN_VERSIONS = dict((browser, Version(browser.min_version)) for
+                    browser in (FIREFOX, MOBILE))
+
+_missing = object()
+ua_parse_cache = LRUCache(settings.UA_PARSE_CACHE_SIZE)
 
 
 def ua_parse(ua):
@@ -19,45 +38,50 @@ def ua_parse(ua):
     returns {
         browser: .FIREFOX or .MOBILE,
         version: '3.6b4' or similar,
+        outdated: whether version is below the browser's min_version,
         platform: one of ('mac', 'win', 'android', 'maemo', 'linux', 'other'),
-        locale: locale code matching locale_details, else None
         }
     or None if detection failed.
-    """
 
+    Results are kept in ``ua_parse_cache``, an LRU cache.
+    """
     if not ua:
         return None
 
-    # Detect browser
-    detected = {}
-    for browser in BROWSERS:
-        match = re.match(browser[1], ua)
-        if match:
-            try:
-                version = Version(match.group(2))
-            except:
-                # Unable to parse version? No dice.
-                return None
-            detected = {
-                'browser': browser[0],
-                'version': str(version),
-            }
-            break
+    detected = ua_parse_cache.get(ua, _missing)
+    if detected is _missing:
+        detected = _ua_parse(ua)
+        ua_parse_cache.set(ua, detected)
+    return detected
+
+
+def _ua_parse(ua):
+    match = UA_RE.match(ua)
     # Browser not recognized? Bail.
-    if not detected:
+    if not match:
+        return None
+
+    # Fennec is Firefox too: it's mobile if it comes last.
+    browser = (MOBILE if match.group('browser') == 'Fennec' and
+               not match.group('rest') else FIREFOX)
+    try:
+        version = Version(match.group('version'))
+    except:
+        # Unable to parse version? No dice.
         return None
 
-    # Detect Platform
     platform = PLATFORM_OTHER.short
-    for pattern in PLATFORM_PATTERNS:
-        if ua.find(pattern[0]) >= 0:
-            platform = pattern[1]
+    for i, (pattern, short) in enumerate(PLATFORM_PATTERNS):
+        if match.group('platform%d' % i):
+            platform = short
             break
-    detected['platform'] = platform
 
-    return detected
-_ua_parse_cache = {}
-ua_parse = memoize(ua_parse, _ua_parse_cache, 1)
+    return {
+        'browser': browser,
+        'version': str(version),
+        'outdated': version < MIN_VERSIONS[browser],
+        'platform': platform,
+    }
 
 
 def detect_language(request):
@@ -67,19 +91,44 @@ def detect_language(request):
     accept = request.META.get('HTTP_ACCEPT_LANGUAGE')
     if not accept:
         return ''
+    return negotiate_language(accept)[1]
+
 
-    ranked_languages = parse_accept_lang_header(accept)
-    for lang, q in ranked_languages:
-        locale = to_locale(lang).replace('_', '-')
-        if locale in product_details.languages:
-            return locale
-        shortened_locale = locale.split('-')[0]
-        if (shortened_locale != locale and
-            shortened_locale in product_details.languages):
-            return shortened_locale
+# Locales the search index keeps as they are; any other locale is indexed by
+# its language only.  Keep in sync with LOCALE in configs/sphinx/sphinx.conf.
+INDEX_LOCALES = ('zh-TW', 'pa-IN', 'ne-NP', 'en-GB', 'bn-IN', 'en-NZ', 'pt-BR',
+                 'nb-NO', 'gu-IN', 'zh-CN', 'tt-RU', 'fur-IT', 'pt-PT',
+                 'nn-NO', 'fy-NL', 'en-CA', 'fj-FJ', 'en-US', 'en-ZA',
+                 'bn-BD', 'sv-SE', 'en-AU', 'hy-AM')
 
-    # No dice.
-    return ''
+
+def index_locale(locale):
+    """The locale as the search index files it, e.g. 'de-DE' -> 'de'."""
+    if locale in INDEX_LOCALES:
+        return locale
+    return locale.split('-', 1)[0]
+
+
+def utc_day(dt):
+    """
+    The UTC day of a (local) datetime.  The search index buckets opinions by
+    UTC day, too (``day_sentiment``).
+    """
+    return datetime.utcfromtimestamp(time.mktime(dt.timetuple())).date()
+
+
+_extractor = None
+
+
+def get_extractor():
+    """One term extractor (and POS tagger) per process: they're costly."""
+    global _extractor
+    if _extractor is None:
+        _extractor = extract.TermExtractor()
+        # Use permissive filter to find all possibly relevant terms in short
+        # texts.
+        _extractor.filter = extract.permissiveFilter
+    return _extractor
 
 
 def extract_terms(text):
@@ -87,10 +136,7 @@ def extract_terms(text):
     Use topia.termextract to perform a simple tag extraction from
     user comments.
     """
-    extractor = extract.TermExtractor()
-    # Use permissive filter to find all possibly relevant terms in short texts.
-    extractor.filter = extract.permissiveFilter
-    terms = extractor(text)
+    terms = get_extractor()(text)
 
     # Collect terms in lower case, but only the ones that consist of single
     # words (t[2] == 1), and are at most 25 chars long.
@@ -98,6 +144,16 @@ def extract_terms(text):
             settings.MIN_TERM_LENGTH <= len(t[0]) <= settings.MAX_TERM_LENGTH]
 
 
+def description_hash(description, product=None, type=None):
+    """
+    Identify a feedback text for duplicate detection: case and whitespace
+    don't matter, product and type do.
+    """
+    normalized = u' '.join(description.lower().split())
+    return sha_constructor(u'%s:%s:%s' % (product, type, normalized)
+                           .encode('utf-8')).hexdigest()
+
+
 def smart_truncate(content, length=100, suffix='...'):
     """Truncate text at word boundaries."""
     if len(content) <= length:
@@ -10,6 +10,8 @@ from tower import ugettext as _
 
 import swearwords
 
+from input import metrics
+
 
 # Simple email regex to keep people from submitting personal data.
 EMAIL_RE = re.compile(r'[^\s]+@[^\s]+\.[^\s]{2,6}')
@@ -71,6 +73,45 @@ def validate_no_urls(str):
               'similar personal data from the text, then try again. Thanks!'))
 
 
+class ContentValidator(object):
+    """
+    Run several validators over a text, collecting all their errors in
+    order, like a form field does with its list of validators.
+
+    ``rules`` are ``(name, validator, may_fail)``: ``may_fail(value)`` is a
+    cheap substring test telling whether the validator can fail at all, so
+    that the regexes only run on texts that might match.  Each rule that runs
+    is timed as ``feedback.validators.<name>``.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def __call__(self, value):
+        errors = []
+        for name, validator, may_fail in self.rules:
+            if may_fail and not may_fail(value):
+                continue
+            with metrics.timer('feedback.validators.%s' % name):
+                try:
+                    validator(value)
+                except ValidationError, e:
+                    errors.extend(e.messages)
+        if errors:
+            raise ValidationError(errors)
+
+
+# The feedback text checks, in the order their messages are shown.
+validate_content = ContentValidator((
+    ('swearwords', validate_swearwords, None),
+    # strip_tags() only removes something from <...>.
+    ('no_html', validate_no_html, lambda v: '<' in v and '>' in v),
+    ('no_email', validate_no_email, lambda v: '@' in v and '.' in v),
+    # URL_RE needs '://', 'www.' or '.xx/'.
+    ('no_urls', validate_no_urls, lambda v: '/' in v or 'www.' in v),
+))
+
+
 class ExtendedURLValidator(validators.URLValidator):
     """URL validator that allows about: and chrome: URLs."""
     regex = re.compile(
@@ -1,3 +1,4 @@
+import json
 from functools import wraps
 
 from django import http
@@ -8,15 +9,21 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.vary import vary_on_headers
 
 import jingo
-from product_details.version_compare import Version
 from tower import ugettext as _
 
 import input
 from input.decorators import cache_page, forward_mobile
-from input.urlresolvers import reverse
+from input.urlresolvers import negotiate_language, reverse
 from feedback.forms import PraiseForm, IssueForm, IdeaForm
-from feedback.models import Opinion
-from feedback.utils import detect_language, ua_parse
+from feedback.models import Opinion, spool_opinion
+from feedback.utils import description_hash, detect_language, ua_parse
+
+FORMS = {input.OPINION_PRAISE.id: PraiseForm,
+         input.OPINION_ISSUE.id: IssueForm,
+         input.OPINION_IDEA.id: IdeaForm}
+
+UA_MAX_LENGTH = Opinion._meta.get_field('user_agent').max_length
+LOCALE_MAX_LENGTH = Opinion._meta.get_field('locale').max_length
 
 
 def enforce_ua(f):
@@ -43,10 +50,8 @@ def enforce_ua(f):
         if not settings.ENFORCE_USER_AGENT:
             return f(request, ua=ua, *args, **kwargs)
 
-        this_ver = Version(parsed['version'])
-        ref_ver = Version(parsed['browser'].min_version)
         # Check for outdated release.
-        if this_ver < ref_ver:
+        if parsed['outdated']:
             return http.HttpResponseRedirect(reverse('feedback.download'))
 
         # If we made it here, it's a valid version.
@@ -64,13 +69,15 @@ def feedback(request, ua):
 
     if request.method == 'POST':
         typ = int(request.POST.get('_type'))
+        product = ua_parse(ua)['browser'].id
 
         if typ == input.OPINION_PRAISE.id:
-            form = PraiseForm(request.POST, auto_id='happy-%s')
+            form = PraiseForm(request.POST, auto_id='happy-%s',
+                              product=product)
         elif typ == input.OPINION_ISSUE.id:
-            form = IssueForm(request.POST, auto_id='sad-%s')
+            form = IssueForm(request.POST, auto_id='sad-%s', product=product)
         else:
-            form = IdeaForm(request.POST, auto_id='idea-%s')
+            form = IdeaForm(request.POST, auto_id='idea-%s', product=product)
 
         if form.is_valid():
             request.session['previous_opinion'] = save_opinion_from_form(
@@ -132,9 +139,127 @@ def opinion_detail(request, id):
     return jingo.render(request, template, {'opinion': o})
 
 
+@never_cache
+@csrf_exempt
+def bulk(request):
+    """
+    Receive a batch of feedback as JSON lines, one opinion per line:
+
+        {"type": "praise", "description": "...", "url": "...",
+         "user_agent": "...", "locale": "de"}
+
+    ``type`` is one of praise, issue and idea; ``url``, ``add_url``,
+    ``manufacturer`` and ``device`` are optional, like in the feedback form.
+    ``user_agent`` and ``locale`` default to those of the request; a
+    ``locale`` is matched to the locales we know like an Accept-Language
+    header.
+
+    Each item is validated like a form submission; the valid ones are saved
+    all at once.  The response has one JSON line per item, in order:
+    ``{"status": "ok", "id": 123}`` or ``{"status": "error", "errors": {...}}``.
+    """
+    if request.method != 'POST':
+        return http.HttpResponseNotAllowed(['POST'])
+
+    lines = [l for l in request.raw_post_data.splitlines() if l.strip()]
+    if len(lines) > settings.BULK_FEEDBACK_MAX_ITEMS:
+        return http.HttpResponseBadRequest(
+            'At most %d items per request.' % settings.BULK_FEEDBACK_MAX_ITEMS)
+
+    types = dict((t.short, t.id) for t in input.OPINION_TYPES.values())
+    request_ua = request.META.get('HTTP_USER_AGENT')
+    request_locale = detect_language(request)
+
+    results, opinions, seen = [], [], set()
+    for line in lines:
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError
+        except ValueError:
+            results.append({'status': 'error',
+                            'errors': {'__all__': [_('Invalid JSON.')]}})
+            continue
+
+        error = lambda field, msg: results.append(
+            {'status': 'error', 'errors': {field: [msg]}})
+
+        type = types.get(item.get('type'))
+        if not type:
+            error('type', _('Unknown feedback type.'))
+            continue
+
+        ua = item.get('user_agent') or request_ua or ''
+        if not isinstance(ua, basestring) or len(ua) > UA_MAX_LENGTH:
+            error('user_agent', _('Invalid user agent.'))
+            continue
+        parsed = ua_parse(ua)
+        if not parsed:
+            error('user_agent', _('Unknown user agent.'))
+            continue
+        if settings.ENFORCE_USER_AGENT and parsed['outdated']:
+            error('user_agent', _('Outdated version.'))
+            continue
+
+        # Locales are negotiated like the Accept-Language header of a form
+        # submission.
+        locale = item.get('locale')
+        if not locale:
+            locale = request_locale
+        else:
+            if (isinstance(locale, basestring) and
+                len(locale) <= LOCALE_MAX_LENGTH):
+                locale = negotiate_language(locale)[1]
+            else:
+                locale = ''
+            if not locale:
+                error('locale', _('Unknown locale.'))
+                continue
+
+        product = parsed['browser'].id
+        data = dict((k, item[k]) for k in
+                    ('description', 'url', 'add_url', 'manufacturer',
+                     'device') if item.get(k) is not None)
+        data['_type'] = type
+        form = FORMS[type](data, product=product)
+        if not form.is_valid():
+            results.append({'status': 'error', 'errors': dict(
+                (k, map(unicode, v)) for k, v in form.errors.items())})
+            continue
+
+        # Duplicates within the batch aren't in the dedupe cache yet.
+        hash = description_hash(form.cleaned_data['description'], product,
+                                type)
+        if hash in seen:
+            error('__all__', _('We already got your feedback! Thanks.'))
+            continue
+        seen.add(hash)
+
+        opinion = opinion_from_form(type, ua, locale, form)
+        opinions.append(opinion)
+        results.append(opinion)
+
+    Opinion.objects.insert_many(opinions)
+
+    response = '\n'.join(
+        json.dumps({'status': 'ok', 'id': r.id} if isinstance(r, Opinion)
+                   else r) for r in results)
+    return http.HttpResponse(response + '\n',
+                             content_type='application/x-json-lines')
+
+
 def save_opinion_from_form(request, type, ua, form):
     """Given a (valid) form and feedback type, save it to the DB."""
-    locale = detect_language(request)
+    opinion = opinion_from_form(type, ua, detect_language(request), form)
+    if settings.FEEDBACK_SPOOL:
+        spool_opinion(opinion)
+    else:
+        opinion.save()
+    return opinion
+
+
+def opinion_from_form(type, ua, locale, form):
+    """Given a (valid) form and feedback type, build an unsaved opinion."""
 
     # Remove URL if checkbox disabled or no URL submitted. Broken Website
     # report does not have the option to disable URL submission.
@@ -153,6 +278,5 @@ def save_opinion_from_form(request, type, ua, form):
         user_agent=ua, locale=locale,
         manufacturer=form.cleaned_data['manufacturer'],
         device=form.cleaned_data['device'])
-    opinion.save()
 
     return opinion
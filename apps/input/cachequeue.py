@@ -0,0 +1,169 @@
+"""
+Coalescing work queues shared through the cache.
+
+``CacheQueue.push(key, value)`` queues ``value`` for ``key``; a celery task
+later takes everything queued at once with ``CacheQueue.flush``.  The task is
+started once ``batch_size`` items are waiting or ``delay_ms`` milliseconds
+after the first one came in, whatever happens first.  Keys pushed several
+times in between are only handed over once, with their latest value.
+
+A queue is a ring of cache keys: ``tail`` counts the items ever queued,
+``head`` the ones already flushed, and item ``n`` lives at ``item:n``.  It
+needs a cache shared by all web heads and celery workers, i.e. memcached.
+
+A push claims its item numbers (incr'ing the tail) before it writes the
+items, and several web heads push at once: item ``n`` may still be missing
+while ``n + 1`` is there.  A flush stops at such a gap and leaves it for the
+next one, unless items pushed after it are older than WRITE_TIMEOUT: then
+the push of item ``n`` died (or ``n`` expired) and it's skipped.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.importlib import import_module
+
+import commonware.log
+
+from input import metrics
+
+log = commonware.log.getLogger('i.cachequeue')
+
+# Items that were never flushed eventually expire.
+ITEM_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 60
+# A push writes its items right after claiming them; if they aren't there
+# after this many seconds, they never will be.
+WRITE_TIMEOUT = 60
+
+
+class CacheQueue(object):
+
+    def __init__(self, name, task, batch_size, delay_ms):
+        """
+        ``task`` is the dotted path of the celery task flushing the queue,
+        ``batch_size`` and ``delay_ms`` are names of settings.
+        """
+        self.name = name
+        self.task = task
+        self.batch_size, self.delay_ms = batch_size, delay_ms
+
+        key = lambda k: '%s%s:%s' % (settings.CACHE_PREFIX, name, k)
+        self.HEAD, self.TAIL = key('head'), key('tail')
+        self.SCHEDULED, self.LOCK = key('scheduled'), key('lock')
+        self._item = lambda n: key('item:%d' % n)
+
+    def get_task(self):
+        module, name = self.task.rsplit('.', 1)
+        return getattr(import_module(module), name)
+
+    def push(self, key, value=None):
+        self.push_many([key], value)
+
+    def push_many(self, keys, value=None):
+        """Queue ``value`` for each of ``keys``."""
+        keys = list(keys)
+        if not keys:
+            return
+        cache.add(self.TAIL, 0, 0)
+        cache.add(self.HEAD, 0, 0)
+        last = cache.incr(self.TAIL, len(keys))
+        first = last - len(keys) + 1
+        now = time.time()
+        cache.set_many(dict((self._item(first + i), (key, value, now))
+                            for i, key in enumerate(keys)), ITEM_TIMEOUT)
+
+        # First item since the last flush started?
+        self.schedule()
+        head = cache.get(self.HEAD) or 0
+        size = getattr(settings, self.batch_size)
+        if (last - head) // size > (first - 1 - head) // size:
+            # Another full batch: don't wait.  Whatever a running flush
+            # leaves behind is picked up by the scheduled one.
+            self.get_task().delay()
+
+    def schedule(self):
+        """Flush in ``delay_ms``, unless that's already scheduled."""
+        if cache.add(self.SCHEDULED, 1, ITEM_TIMEOUT):
+            self.get_task().apply_async(
+                countdown=getattr(settings, self.delay_ms) / 1000.0)
+
+    def pending(self):
+        """
+        Read the queued items.  Returns ``(items, head)``: ``items`` maps
+        keys to ``(value, enqueued)`` (the latest value and the earliest
+        time) and ``head`` is how far the queue can be marked as flushed.
+        """
+        head = cache.get(self.HEAD) or 0
+        tail = cache.get(self.TAIL) or 0
+        if tail <= head:
+            return {}, head
+
+        numbers = range(head + 1, tail + 1)
+        found = cache.get_many([self._item(n) for n in numbers])
+
+        # For each item, when the oldest of the items after it was pushed.
+        # Those claimed their numbers later, so a missing item has been
+        # missing at least that long.
+        pushed_after = {}
+        oldest = None
+        for n in reversed(numbers):
+            pushed_after[n] = oldest
+            item = found.get(self._item(n))
+            if item is not None:
+                oldest = item[2] if oldest is None else min(oldest, item[2])
+
+        items = {}
+        flushed = head
+        now = time.time()
+        for n in numbers:
+            item = found.get(self._item(n))
+            if item is None:
+                if (pushed_after[n] is None or
+                    now - pushed_after[n] < WRITE_TIMEOUT):
+                    # Pushed but not written yet: stop here, so it isn't
+                    # skipped when it shows up.
+                    break
+                log.warning('Skipping lost item %d of %s.' % (n, self.name))
+                flushed = n
+                continue
+            key, value, enqueued = item
+            first = items.get(key, (None, enqueued))[1]
+            items[key] = (value, min(first, enqueued))
+            flushed = n
+
+        return items, flushed
+
+    def flush(self, handler):
+        """
+        Hand all queued items to ``handler(items)`` (``items`` as from
+        ``pending``) and drop them once it returned.  Returns how many items
+        were handled.  Size and queueing latency of each flush go to metrics.
+        """
+        if not cache.add(self.LOCK, 1, LOCK_TIMEOUT):
+            # Another flush is running; it (or the next one) gets our items.
+            return 0
+        try:
+            cache.delete(self.SCHEDULED)
+            items, head = self.pending()
+            if items:
+                handler(items)
+
+            old = cache.get(self.HEAD) or 0
+            cache.set(self.HEAD, head, 0)
+            cache.delete_many([self._item(n) for n in
+                               xrange(old + 1, head + 1)])
+            if head < (cache.get(self.TAIL) or 0):
+                # Stopped at a gap: come back for the rest.
+                self.schedule()
+            if not items:
+                return 0
+
+            oldest = min(enqueued for _, enqueued in items.values())
+            metrics.histogram('%s.flush_size' % self.name, len(items))
+            metrics.timing('%s.latency' % self.name,
+                           (time.time() - oldest) * 1000)
+            log.debug('Flushed %d items from %s.' % (len(items), self.name))
+            return len(items)
+        finally:
+            cache.delete(self.LOCK)
@@ -1,12 +1,18 @@
 import logging
 import os
+import random
+import time
 import urllib2
 
 from django.conf import settings
 from django.contrib.sites.models import Site
 
+from django.utils.translation.trans_real import parse_accept_lang_header
+
 import cronjobs
 
+from input import urlresolvers
+
 log = logging.getLogger('reporter')
 
 @cronjobs.register
@@ -49,3 +55,54 @@ def set_domains(desktop_domain, mobile_domain):
         site.name = domain
         site.save()
         log.debug('Changed site %d domain to %s' % (id, domain))
+
+
+# Accept-Language headers as sent by Firefox builds, most common first.
+ACCEPT_LANGUAGES = [
+    'en-us,en;q=0.5', 'de-de,de;q=0.8,en-us;q=0.5,en;q=0.3',
+    'fr,fr-fr;q=0.8,en-us;q=0.5,en;q=0.3', 'es-es,es;q=0.8,en-us;q=0.5,en;q=0.3',
+    'ru-ru,ru;q=0.8,en-us;q=0.5,en;q=0.3', 'en-gb,en;q=0.5',
+    'ja,en-us;q=0.7,en;q=0.3', 'pl,en-us;q=0.7,en;q=0.3',
+    'pt-br,pt;q=0.8,en-us;q=0.5,en;q=0.3', 'it-it,it;q=0.8,en-us;q=0.5,en;q=0.3',
+    'zh-cn,zh;q=0.5', 'nl,en-us;q=0.7,en;q=0.3', 'zh-tw,en-us;q=0.7,en;q=0.3',
+    'cs,en-us;q=0.7,en;q=0.3', 'es-ar,es;q=0.8,en-us;q=0.5,en;q=0.3',
+    'hu-hu,hu;q=0.8,en-us;q=0.5,en;q=0.3', 'sv-se,sv;q=0.8,en-us;q=0.5,en;q=0.3',
+    'tr-tr,tr;q=0.8,en-us;q=0.5,en;q=0.3', 'ko-kr,ko;q=0.8,en-us;q=0.5,en;q=0.3',
+    'en-us,en;q=0.8,de-de;q=0.5,de;q=0.3', 'fi-fi,fi;q=0.8,en-us;q=0.5,en;q=0.3',
+    'da,en-us;q=0.7,en;q=0.3', 'en', 'xx-yy,en;q=0.1', '',
+]
+
+
+def _negotiate_uncached(accept):
+    """What a request used to do: parse the header twice, match each."""
+    return (urlresolvers._url_locale(parse_accept_lang_header(accept)),
+            urlresolvers._feedback_locale(parse_accept_lang_header(accept)))
+
+
+@cronjobs.register
+def benchmark_accept_language(runs=100000):
+    """
+    Compare cached Accept-Language negotiation with parsing every header.
+    The headers are drawn from ACCEPT_LANGUAGES with a Zipf-like skew.
+    Usage: ``cron benchmark_accept_language [runs]``
+    """
+    weights = [1.0 / (i + 1) for i in xrange(len(ACCEPT_LANGUAGES))]
+    total = sum(weights)
+    headers = []
+    for i in xrange(int(runs)):
+        x = random.random() * total
+        for header, weight in zip(ACCEPT_LANGUAGES, weights):
+            x -= weight
+            if x <= 0:
+                break
+        headers.append(header)
+
+    urlresolvers.negotiate_cache.clear()
+    for name, negotiate in (('uncached', _negotiate_uncached),
+                            ('cached', urlresolvers.negotiate_language)):
+        start = time.time()
+        for header in headers:
+            negotiate(header)
+        print '%-8s  %6.1fus/request' % (
+            name, (time.time() - start) / len(headers) * 1e6)
+    print 'hit rate  %5.1f%%' % (urlresolvers.negotiate_cache.hit_rate * 100)
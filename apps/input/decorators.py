@@ -9,6 +9,8 @@ from django.utils.hashcompat import md5_constructor
 
 from view_cache_utils import cache_page_with_prefix
 
+from input import urlresolvers
+
 
 # Known mobile device patterns. Excludes iPad because it's big enough to show
 # the desktop dashboard.
@@ -16,6 +18,11 @@ MOBILE_DEVICE_PATTERN = re.compile(
     r'^Mozilla.*(Fennec|Android|Maemo|iPhone|iPod)')
 
 
+def get_site_id(request):
+    """The site ID picked by MobileSiteMiddleware for ``request``."""
+    return getattr(request, 'site_id', urlresolvers.get_site_id())
+
+
 def cache_page(cache_timeout=None, use_get=False, **kwargs):
     """
     Cache an entire page with a cache prefix based on the Site ID and
@@ -31,7 +38,7 @@ def cache_page(cache_timeout=None, use_get=False, **kwargs):
         cache_timeout = settings.CACHE_DEFAULT_PERIOD
 
     def key_prefix(request):
-        prefix = '%ss%d:' % (settings.CACHE_PREFIX, settings.SITE_ID)
+        prefix = '%ss%d:' % (settings.CACHE_PREFIX, get_site_id(request))
         if use_get:
             prefix += md5_constructor(str(request.GET)).hexdigest()
         return prefix
@@ -86,7 +93,7 @@ def forward_mobile(f):
 
     @wraps(f)
     def wrapped(request, *args, **kwargs):
-        if (settings.SITE_ID == settings.DESKTOP_SITE_ID and
+        if (get_site_id(request) == settings.DESKTOP_SITE_ID and
             MOBILE_DEVICE_PATTERN.search(
                 request.META.get('HTTP_USER_AGENT', ''))):
             mobile_site = Site.objects.get(id=settings.MOBILE_SITE_ID)
@@ -143,10 +143,15 @@ def pager(context):
     page = context.get('page')
     if page:
         url = context['request'].META['PATH_INFO']
-        if page.has_previous():
+        # Prefer (constant cost) cursors where the result set provides them.
+        if context.get('prev_cursor'):
+            prev_url = urlparams(url, cursor=context['prev_cursor'])
+        elif page.has_previous():
             prev_url = urlparams(url, page=page.previous_page_number())
 
-        if page.has_next():
+        if context.get('next_cursor'):
+            next_url = urlparams(url, cursor=context['next_cursor'])
+        elif page.has_next():
             next_url = urlparams(url, page=page.next_page_number())
 
     return new_context(**locals())
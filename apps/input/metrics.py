@@ -0,0 +1,99 @@
+"""
+Counters, gauges and timings in statsd format.
+
+Where the metrics go is up to ``settings.METRICS_BACKEND``:
+
+* ``input.metrics.NullSink`` drops everything (the default),
+* ``input.metrics.LocalSink`` keeps them in memory (for tests),
+* ``input.metrics.StatsdSink`` sends them to ``STATSD_HOST:STATSD_PORT``
+  over UDP.
+"""
+import socket
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.importlib import import_module
+
+
+class NullSink(object):
+    """Ignore all metrics."""
+
+    def send(self, name, value, kind):
+        pass
+
+
+class LocalSink(object):
+    """Keep metrics in memory: ``sink.stats[name]`` is a list of values."""
+
+    def __init__(self):
+        self.stats = defaultdict(list)
+
+    def send(self, name, value, kind):
+        self.stats[name].append(value)
+
+    def clear(self):
+        self.stats.clear()
+
+
+class StatsdSink(object):
+    """Fire-and-forget statsd packets over UDP."""
+
+    def __init__(self, host=None, port=None, prefix=None):
+        self.addr = (host or settings.STATSD_HOST,
+                     port or settings.STATSD_PORT)
+        self.prefix = prefix if prefix is not None else settings.STATSD_PREFIX
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, name, value, kind):
+        packet = '%s%s:%s|%s' % (self.prefix, name, value, kind)
+        try:
+            self.sock.sendto(packet, self.addr)
+        except socket.error:
+            pass
+
+
+_sink = None
+
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        module, cls = settings.METRICS_BACKEND.rsplit('.', 1)
+        _sink = getattr(import_module(module), cls)()
+    return _sink
+
+
+def incr(name, count=1):
+    get_sink().send(name, count, 'c')
+
+
+def gauge(name, value):
+    get_sink().send(name, value, 'g')
+
+
+def timing(name, ms):
+    """Record a duration in milliseconds."""
+    get_sink().send(name, int(ms), 'ms')
+
+
+def histogram(name, value):
+    """Record the distribution of a (non-time) value, e.g. result sizes."""
+    get_sink().send(name, value, 'h')
+
+
+@contextmanager
+def timer(name, timings=None):
+    """
+    Time the enclosed block as ``name``.  If given, the duration (in ms) is
+    also stored in the dict ``timings``.
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        ms = (time.time() - start) * 1000
+        timing(name, ms)
+        if timings is not None:
+            timings[name] = ms
@@ -61,8 +61,11 @@ class LocaleURLMiddleware(object):
 
 class MobileSiteMiddleware(object):
     """
-    Change the settings.SITE_ID to match the request.META['HTTP_HOST'].
-    Used to detect our Mobile site from the URL.
+    Pick the site ID matching request.META['HTTP_HOST'] and keep it in
+    request.site_id (and for the current thread, see
+    input.urlresolvers.get_site_id).  Used to detect our Mobile site from the
+    URL.  settings.SITE_ID is left alone, so threads don't step on each
+    other's toes.
     Borrowed from http://code.djangoproject.com/ticket/4438
 
     Also forwards known mobile devices to the mobile site.
@@ -80,12 +83,13 @@ class MobileSiteMiddleware(object):
             site_header = request.META.get('SITE_ID')
             if site_header in (settings.DESKTOP_SITE_ID,
                                settings.MOBILE_SITE_ID):
-                settings.SITE_ID = site_header
+                request.site_id = site_header
             else:
-                settings.SITE_ID = settings.DESKTOP_SITE_ID
+                request.site_id = settings.DESKTOP_SITE_ID
         else:
-            settings.SITE_ID = site.id
+            request.site_id = site.id
+        urlresolvers.set_site_id(request.site_id)
 
         # Keep mobile site status in request object
-        request.mobile_site = (settings.SITE_ID == settings.MOBILE_SITE_ID)
+        request.mobile_site = (request.site_id == settings.MOBILE_SITE_ID)
         request.default_prod = request.mobile_site and MOBILE or FIREFOX
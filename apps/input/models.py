@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import connection, models, transaction
 
 import caching.base
 
@@ -13,3 +13,27 @@ class ModelBase(caching.base.CachingMixin, models.Model):
 
     class Meta:
         abstract = True
+
+
+class SpoolCheckpointManager(models.Manager):
+    def offset(self, name):
+        """How far spool file ``name`` has been drained, in bytes."""
+        offsets = self.filter(name=name).values_list('offset', flat=True)
+        return offsets[0] if offsets else 0
+
+    def save_offset(self, name, offset):
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO input_spoolcheckpoint (name, `offset`) '
+            'VALUES (%s, %s) '
+            'ON DUPLICATE KEY UPDATE `offset` = VALUES(`offset`)',
+            [name, offset])
+        transaction.commit_unless_managed()
+
+
+class SpoolCheckpoint(models.Model):
+    """How far a write-behind spool file was drained (see input.spool)."""
+    name = models.CharField(max_length=255, unique=True)
+    offset = models.PositiveIntegerField(default=0)
+
+    objects = SpoolCheckpointManager()
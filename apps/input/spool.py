@@ -0,0 +1,196 @@
+"""
+Durable local write-behind spools.
+
+``Spool.append(record)`` writes a record to an append-only file and fsyncs
+it; that's all a request has to wait for.  ``Spool.drain(handler)`` (run by
+a long-lived process on the same host) later hands the records to
+``handler`` in groups, e.g. to write them to the database.
+
+A spool is a directory.  Records are appended to ``current`` as JSON lines
+under an exclusive ``flock``.  A drain first renames ``current`` to a
+timestamped batch file (holding the lock, so no write gets lost), then works
+through all batch files in order.  For every group, the handler and the new
+file offset (a ``SpoolCheckpoint`` row) are committed in one transaction: a
+drain that dies resumes exactly after the last group written, so nothing is
+written twice.  Batch files left over by a crash are picked up by the next
+drain, which is why a drainer replays everything when it starts.
+"""
+import fcntl
+import json
+import os
+import time
+
+from django.db import transaction
+
+import commonware.log
+
+from input import metrics
+from input.models import SpoolCheckpoint
+
+log = commonware.log.getLogger('i.spool')
+
+BATCH_PREFIX = 'batch-'
+
+
+class Spool(object):
+
+    def __init__(self, name, directory):
+        """``name`` prefixes the checkpoints and metrics of the spool."""
+        self.name = name
+        self.directory = directory
+        self.current = os.path.join(directory, 'current')
+
+    def _open(self, path, mode):
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Somebody else was faster.
+                pass
+        return open(path, mode)
+
+    def append(self, record):
+        """Durably add ``record`` (anything JSON can encode) to the spool."""
+        line = json.dumps([time.time(), record]) + '\n'
+        while True:
+            f = self._open(self.current, 'a+')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    rotated = (os.fstat(f.fileno()).st_ino !=
+                               os.stat(self.current).st_ino)
+                except OSError:
+                    rotated = True
+                if rotated:
+                    # A drain took the file away while we were waiting.
+                    continue
+                prefix = ''
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != '\n':
+                        # A writer died in the middle of a record: end that
+                        # line, so ours isn't glued to it.
+                        prefix = '\n'
+                    f.seek(0, os.SEEK_END)
+                f.write(prefix + line)
+                f.flush()
+                os.fsync(f.fileno())
+                return
+            finally:
+                # Releases the lock, too.
+                f.close()
+
+    def rotate(self):
+        """Move ``current`` to a new batch file.  Returns its path or None."""
+        if not os.path.exists(self.current):
+            return None
+        f = self._open(self.current, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            path = os.path.join(self.directory, '%s%017.6f' % (
+                BATCH_PREFIX, time.time()))
+            os.rename(self.current, path)
+            return path
+        finally:
+            f.close()
+
+    def batches(self):
+        """Paths of the batch files waiting to be drained, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return [os.path.join(self.directory, name) for name in
+                sorted(os.listdir(self.directory))
+                if name.startswith(BATCH_PREFIX)]
+
+    def _checkpoint(self, path):
+        return '%s:%s' % (self.name, os.path.basename(path))
+
+    def depth(self):
+        """Number of records not drained yet."""
+        count = 0
+        for path in self.batches() + [self.current]:
+            try:
+                f = open(path)
+            except IOError:
+                continue
+            with f:
+                if path != self.current:
+                    f.seek(SpoolCheckpoint.objects.offset(
+                        self._checkpoint(path)))
+                count += sum(1 for line in f if line.endswith('\n'))
+        return count
+
+    def _groups(self, path, size):
+        """Yield ``(records, offset)`` for groups of up to ``size`` records
+        from the checkpoint on; ``offset`` is where the group ends."""
+        with open(path) as f:
+            offset = SpoolCheckpoint.objects.offset(self._checkpoint(path))
+            f.seek(offset)
+            group = []
+            for line in f:
+                offset += len(line)
+                if not line.endswith('\n'):
+                    # Only a crash in the middle of a write leaves this.
+                    log.error('Dropping incomplete record in %s.' % path)
+                    continue
+                try:
+                    group.append(json.loads(line))
+                except ValueError:
+                    log.error('Dropping corrupt record in %s.' % path)
+                    continue
+                if len(group) >= size:
+                    yield group, offset
+                    group = []
+            yield group, offset
+
+    def drain(self, handler, size=100, committed=None):
+        """
+        Hand all spooled records to ``handler(records)``, ``size`` at a time,
+        each group in its own transaction.  Once a group is committed, what
+        the handler returned goes to ``committed`` (e.g. to queue tasks
+        reading what was written).  Returns the number of records drained,
+        or None if another drain of this spool is running.
+        """
+        lock = self._open(os.path.join(self.directory, 'drain.lock'), 'a')
+        try:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                return None
+
+            metrics.gauge('%s.depth' % self.name, self.depth())
+            self.rotate()
+            drained = 0
+            for path in self.batches():
+                name = self._checkpoint(path)
+                for group, offset in self._groups(path, size):
+                    result = self._save(handler, group, name, offset)
+                    if group:
+                        if committed:
+                            committed(result)
+                        drained += len(group)
+                        oldest = min(spooled for spooled, _ in group)
+                        metrics.timing('%s.lag' % self.name,
+                                       (time.time() - oldest) * 1000)
+                # Remove the file first: a checkpoint without its file is
+                # harmless, a file without its checkpoint would be replayed.
+                os.remove(path)
+                SpoolCheckpoint.objects.filter(name=name).delete()
+
+            metrics.gauge('%s.depth' % self.name, self.depth())
+            if drained:
+                log.info('Drained %d records from %s.' % (drained, self.name))
+            return drained
+        finally:
+            lock.close()
+
+    @transaction.commit_on_success
+    def _save(self, handler, group, name, offset):
+        result = None
+        if group:
+            result = handler([record for _, record in group])
+        SpoolCheckpoint.objects.save_offset(name, offset)
+        return result
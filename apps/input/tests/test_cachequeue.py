@@ -0,0 +1,120 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from mock import Mock, patch
+from nose.tools import eq_
+import test_utils
+
+from input import cachequeue, metrics
+from input.cachequeue import CacheQueue
+
+task = Mock()
+
+
+@patch.object(settings, 'TEST_BATCH_SIZE', 3, create=True)
+@patch.object(settings, 'TEST_BATCH_MS', 2000, create=True)
+class CacheQueueTest(test_utils.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.get_sink().clear()
+        task.reset_mock()
+        self.queue = CacheQueue('test.queue', __name__ + '.task',
+                                'TEST_BATCH_SIZE', 'TEST_BATCH_MS')
+
+    def test_flush_is_scheduled_once(self):
+        self.queue.push(1)
+        self.queue.push(2)
+        eq_(task.apply_async.call_count, 1)
+        task.apply_async.assert_called_with(countdown=2.0)
+        assert not task.delay.called
+
+    def test_full_batch_flushes_now(self):
+        for key in (1, 2, 3):
+            self.queue.push(key)
+        eq_(task.delay.call_count, 1)
+
+    def test_push_many(self):
+        self.queue.push_many([1, 2, 3, 4], 'a')
+        eq_(task.delay.call_count, 1)
+        eq_(sorted(self.queue.pending()[0].keys()), [1, 2, 3, 4])
+        self.queue.push_many([5, 6])
+        eq_(task.delay.call_count, 2)
+        eq_(task.apply_async.call_count, 1)
+
+    def test_items_are_coalesced(self):
+        self.queue.push(1, 'a')
+        self.queue.push(2, 'a')
+        self.queue.push(1, 'b')
+        items, head = self.queue.pending()
+        eq_(head, 3)
+        eq_(dict((k, v) for k, (v, _) in items.items()), {1: 'b', 2: 'a'})
+
+    def test_trailing_gap_is_kept(self):
+        self.queue.push(1)
+        # An item whose slot isn't written yet.
+        cache.incr(self.queue.TAIL)
+        eq_(self.queue.pending()[1], 1)
+
+    def test_gap_waits_for_slow_push(self):
+        """Items pushed after one that isn't written yet wait for it."""
+        self.queue.push(1)
+        # Another web head claimed item 2 but hasn't written it yet.
+        cache.incr(self.queue.TAIL)
+        self.queue.push(3)
+        items, head = self.queue.pending()
+        eq_(sorted(items.keys()), [1])
+        eq_(head, 1)
+
+        cache.set(self.queue._item(2), (2, None, time.time()))
+        items, head = self.queue.pending()
+        eq_(sorted(items.keys()), [1, 2, 3])
+        eq_(head, 3)
+
+    def test_flush_stopped_at_gap_is_rescheduled(self):
+        self.queue.push(1)
+        cache.incr(self.queue.TAIL)
+        self.queue.push(3)
+        task.reset_mock()
+        eq_(self.queue.flush(Mock()), 1)
+        eq_(task.apply_async.call_count, 1)
+
+    def test_lost_item_is_skipped(self):
+        """A gap older than WRITE_TIMEOUT won't be filled in anymore."""
+        self.queue.push(1)
+        cache.incr(self.queue.TAIL)
+        self.queue.push(3)
+        later = time.time() + cachequeue.WRITE_TIMEOUT + 1
+        with patch('input.cachequeue.time.time', Mock(return_value=later)):
+            items, head = self.queue.pending()
+        eq_(sorted(items.keys()), [1, 3])
+        eq_(head, 3)
+
+    def test_flush(self):
+        self.queue.push(1)
+        self.queue.push(2)
+        handler = Mock()
+        eq_(self.queue.flush(handler), 2)
+        eq_(sorted(handler.call_args[0][0].keys()), [1, 2])
+        stats = metrics.get_sink().stats
+        eq_(stats['test.queue.flush_size'], [2])
+        eq_(len(stats['test.queue.latency']), 1)
+
+        # Nothing left.
+        eq_(self.queue.pending(), ({}, 2))
+        eq_(self.queue.flush(handler), 0)
+        eq_(handler.call_count, 1)
+
+    def test_failed_flush_keeps_items(self):
+        self.queue.push(1)
+        handler = Mock(side_effect=ValueError)
+        self.assertRaises(ValueError, self.queue.flush, handler)
+        eq_(len(self.queue.pending()[0]), 1)
+
+    def test_flush_is_locked(self):
+        self.queue.push(1)
+        cache.add(self.queue.LOCK, 1)
+        eq_(self.queue.flush(Mock()), 0)
+        eq_(len(self.queue.pending()[0]), 1)
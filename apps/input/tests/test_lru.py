@@ -0,0 +1,26 @@
+from nose.tools import eq_
+
+from input.utils import LRUCache
+
+
+def test_lru_cache():
+    c = LRUCache(2)
+    c.set('a', 1)
+    c.set('b', 2)
+    eq_(c.get('a'), 1)
+    # 'b' is the least recently used now.
+    c.set('c', 3)
+    eq_(c.get('b'), None)
+    eq_(c.get('a'), 1)
+    eq_(c.get('c'), 3)
+    eq_(len(c), 2)
+
+
+def test_lru_cache_stats():
+    c = LRUCache(10)
+    eq_(c.hit_rate, 0)
+    c.set('a', None)
+    c.get('a', 'x')
+    c.get('b', 'x')
+    eq_((c.hits, c.misses), (1, 1))
+    eq_(c.hit_rate, .5)
@@ -0,0 +1,30 @@
+from mock import patch
+from nose.tools import eq_
+
+from input import metrics
+
+
+@patch('input.metrics._sink', metrics.LocalSink())
+def test_local_sink():
+    metrics.incr('foo')
+    metrics.incr('foo', 2)
+    metrics.timing('bar', 12.7)
+    eq_(metrics.get_sink().stats['foo'], [1, 2])
+    eq_(metrics.get_sink().stats['bar'], [12])
+
+
+@patch('input.metrics._sink', metrics.LocalSink())
+def test_timer():
+    timings = {}
+    with metrics.timer('block', timings):
+        pass
+    eq_(len(metrics.get_sink().stats['block']), 1)
+    assert 'block' in timings
+
+
+def test_statsd_packets():
+    sink = metrics.StatsdSink('127.0.0.1', 8125, 'input.')
+    with patch.object(sink, 'sock') as sock:
+        sink.send('search.query', 15, 'ms')
+    sock.sendto.assert_called_with('input.search.query:15|ms',
+                                   ('127.0.0.1', 8125))
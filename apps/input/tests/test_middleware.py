@@ -4,6 +4,7 @@ from mock import Mock, patch
 from test_utils import eq_
 
 from input import urlresolvers
+from input.middleware import MobileSiteMiddleware
 from input.tests import InputTestCase
 from input.urlresolvers import reverse
 
@@ -39,8 +40,11 @@ class MiddlewareTests(InputTestCase):
     def test_mobilesite_nohost(self):
         """Make sure we serve the desktop site if there's no HTTP_HOST set."""
         # This won't contain HTTP_HOST. Must not fail.
-        self.client.get('/')
-        eq_(settings.SITE_ID, settings.DESKTOP_SITE_ID)
+        request = self.factory.get('/')
+        request.META.pop('HTTP_HOST', None)
+        MobileSiteMiddleware().process_request(request)
+        eq_(request.site_id, settings.DESKTOP_SITE_ID)
+        eq_(urlresolvers.get_site_id(), settings.DESKTOP_SITE_ID)
 
     @patch('django.contrib.sites.models.Site.objects.get')
     def test_mobilesite_detection(self, mock):
@@ -51,10 +55,15 @@ class MiddlewareTests(InputTestCase):
             return FakeSite()
         mock.side_effect = side_effect
 
-        # Get the front page. Since we mocked the Site model, the URL we
-        # pass here does not matter.
-        self.client.get('/', HTTP_HOST='m.example.com')
-        eq_(settings.SITE_ID, settings.MOBILE_SITE_ID)
+        # Since we mocked the Site model, the URL we pass here does not
+        # matter.
+        request = self.factory.get('/', HTTP_HOST='m.example.com')
+        MobileSiteMiddleware().process_request(request)
+        eq_(request.site_id, settings.MOBILE_SITE_ID)
+        assert request.mobile_site
+        eq_(urlresolvers.get_site_id(), settings.MOBILE_SITE_ID)
+        # The process-wide setting is left alone.
+        eq_(settings.SITE_ID, settings.DESKTOP_SITE_ID)
 
     def test_redirect_with_querystring(self):
         r = self.client.get('/?foo=bar')
@@ -96,3 +105,14 @@ class MiddlewareTests(InputTestCase):
         request.GET = dict(lang='en-US')
         p = urlresolvers.Prefixer(request)
         eq_(p.get_language(), 'en-US')
+
+    def test_negotiate_language(self):
+        """URL and feedback locales are negotiated once per header."""
+        urlresolvers.negotiate_cache.clear()
+        hits = urlresolvers.negotiate_cache.hits
+        eq_(urlresolvers.negotiate_language('fr-FR,de-DE;q=0.5'),
+            ('fr', 'fr'))
+        eq_(urlresolvers.negotiate_language('fr-FR,de-DE;q=0.5'),
+            ('fr', 'fr'))
+        eq_(urlresolvers.negotiate_cache.hits, hits + 1)
+        eq_(urlresolvers.negotiate_language('German'), (None, ''))
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+
+from mock import Mock
+from nose.tools import eq_
+import test_utils
+
+from input import metrics
+from input.models import SpoolCheckpoint
+from input.spool import Spool
+
+
+class SpoolTest(test_utils.TestCase):
+
+    def setUp(self):
+        metrics.get_sink().clear()
+        self.directory = tempfile.mkdtemp()
+        self.spool = Spool('test.spool', self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_drain(self):
+        for n in range(5):
+            self.spool.append({'n': n})
+        eq_(self.spool.depth(), 5)
+
+        handler = Mock()
+        eq_(self.spool.drain(handler, size=2), 5)
+        eq_([c[0][0] for c in handler.call_args_list],
+            [[{'n': 0}, {'n': 1}], [{'n': 2}, {'n': 3}], [{'n': 4}]])
+        eq_(self.spool.depth(), 0)
+        eq_(self.spool.batches(), [])
+        eq_(SpoolCheckpoint.objects.count(), 0)
+
+        stats = metrics.get_sink().stats
+        eq_(stats['test.spool.depth'], [5, 0])
+        eq_(len(stats['test.spool.lag']), 3)
+
+    def test_committed(self):
+        """What the handler returns is passed on after the commit."""
+        for n in range(3):
+            self.spool.append(n)
+        committed = Mock()
+        self.spool.drain(lambda records: sum(records), size=2,
+                         committed=committed)
+        eq_([c[0][0] for c in committed.call_args_list], [1, 2])
+
+    def test_appends_during_drain(self):
+        """Records spooled after the rotation wait for the next drain."""
+        self.spool.append(1)
+        handler = Mock(side_effect=lambda records: self.spool.append(2))
+        eq_(self.spool.drain(handler), 1)
+        eq_(self.spool.depth(), 1)
+        eq_(self.spool.drain(Mock()), 1)
+
+    def test_crash_replay(self):
+        """A failed drain resumes after the last group written."""
+        for n in range(4):
+            self.spool.append(n)
+        written = []
+
+        def fail(records):
+            if written:
+                raise IOError
+            written.extend(records)
+        try:
+            self.spool.drain(fail, size=2)
+        except IOError:
+            pass
+        eq_(self.spool.depth(), 2)
+
+        handler = Mock()
+        eq_(self.spool.drain(handler, size=2), 2)
+        handler.assert_called_once_with([2, 3])
+        eq_(written, [0, 1])
+
+    def test_torn_record(self):
+        """A record cut short by a crash is dropped."""
+        self.spool.append(1)
+        with open(self.spool.current, 'a') as f:
+            f.write('[12')
+        handler = Mock()
+        eq_(self.spool.drain(handler), 1)
+        handler.assert_called_once_with([1])
+        assert not os.path.exists(self.spool.current)
+
+    def test_append_after_torn_record(self):
+        """Records appended after a torn one start on a line of their own."""
+        self.spool.append(1)
+        with open(self.spool.current, 'a') as f:
+            f.write('[12')
+        self.spool.append(2)
+        handler = Mock()
+        eq_(self.spool.drain(handler), 2)
+        handler.assert_called_once_with([1, 2])
@@ -2,9 +2,15 @@ from threading import local
 
 from django.conf import settings
 from django.core.urlresolvers import reverse as django_reverse
+from django.utils.translation import to_locale
 from django.utils.translation.trans_real import parse_accept_lang_header
 
-# Thread-local storage for URL prefixes. Access with (get|set)_url_prefix.
+from product_details import product_details
+
+from input.utils import LRUCache
+
+# Thread-local storage for URL prefixes and site IDs. Access with
+# (get|set)_url_prefix and (get|set)_site_id.
 _local = local()
 
 
@@ -18,6 +24,20 @@ def get_url_prefix():
     return getattr(_local, 'prefix', None)
 
 
+def set_site_id(site_id):
+    """Set the site ID (desktop or mobile) for the current thread."""
+    _local.site_id = site_id
+
+
+def get_site_id():
+    """
+    Get the site ID of the current thread's request.  Outside of requests
+    that's settings.SITE_ID, which is never changed: it's shared by all
+    threads of a process.
+    """
+    return getattr(_local, 'site_id', settings.SITE_ID)
+
+
 def clean_url_prefixes():
     """Purge prefix cache."""
     if hasattr(_local, 'prefix'):
@@ -47,6 +67,61 @@ def find_supported(lang):
             x.split('-', 1)[0] == lang.lower().split('-', 1)[0]]
 
 
+def _url_locale(ranked_languages):
+    ranked_languages = [(x.lower(), y) for x, y in ranked_languages]
+
+    # Do we support or remap their locale?
+    supported = [lang[0] for lang in ranked_languages if lang[0]
+                in settings.LANGUAGE_URL_MAP]
+
+    # Do we support a less specific locale? (xx-YY -> xx)
+    if not len(supported):
+        for lang in ranked_languages:
+            supported = find_supported(lang[0])
+            if supported:
+                break
+
+    if len(supported):
+        return settings.LANGUAGE_URL_MAP[supported[0].lower()]
+    return None
+
+
+def _feedback_locale(ranked_languages):
+    for lang, q in ranked_languages:
+        locale = to_locale(lang).replace('_', '-')
+        if locale in product_details.languages:
+            return locale
+        shortened_locale = locale.split('-')[0]
+        if (shortened_locale != locale and
+            shortened_locale in product_details.languages):
+            return shortened_locale
+
+    # No dice.
+    return ''
+
+
+# Distinct Accept-Language headers are few, so each process remembers what
+# it negotiated for the most recent ones.
+negotiate_cache = LRUCache(settings.ACCEPT_LANGUAGE_CACHE_SIZE)
+
+
+def negotiate_language(accept):
+    """
+    Match an Accept-Language header against the languages we support.
+    Returns ``(url_locale, feedback_locale)``: the site locale for URLs
+    (None if there's no match, see ``Prefixer.get_language``) and the locale
+    feedback is filed under ('' if there's no match, see
+    ``feedback.utils.detect_language``).
+    """
+    result = negotiate_cache.get(accept)
+    if result is None:
+        ranked_languages = parse_accept_lang_header(accept)
+        result = (_url_locale(ranked_languages),
+                  _feedback_locale(ranked_languages))
+        negotiate_cache.set(accept, result)
+    return result
+
+
 class Prefixer(object):
 
     def __init__(self, request):
@@ -84,24 +159,11 @@ class Prefixer(object):
             if lang in settings.LANGUAGE_URL_MAP:
                 return settings.LANGUAGE_URL_MAP[lang]
 
-        if self.request.META.get('HTTP_ACCEPT_LANGUAGE'):
-            ranked_languages = parse_accept_lang_header(
-                self.request.META['HTTP_ACCEPT_LANGUAGE'])
-            ranked_languages = [(x.lower(), y) for x, y in ranked_languages]
-
-            # Do we support or remap their locale?
-            supported = [lang[0] for lang in ranked_languages if lang[0]
-                        in settings.LANGUAGE_URL_MAP]
-
-            # Do we support a less specific locale? (xx-YY -> xx)
-            if not len(supported):
-                for lang in ranked_languages:
-                    supported = find_supported(lang[0])
-                    if supported:
-                        break
-
-            if len(supported):
-                return settings.LANGUAGE_URL_MAP[supported[0].lower()]
+        accept = self.request.META.get('HTTP_ACCEPT_LANGUAGE')
+        if accept:
+            lang = negotiate_language(accept)[0]
+            if lang:
+                return lang
 
         return settings.LANGUAGE_CODE
 
@@ -1,22 +1,63 @@
+import threading
 import zlib
 
 
-# TODO(davedash): liberate this
-def manual_order(qs, pks, pk_name='id'):
+crc32 = lambda x: zlib.crc32(x) & 0xffffffff
+
+
+class LRUCache(object):
     """
-    Given a query set and a list of primary keys, return a set of objects from
-    the query set in that exact order.
+    A mapping keeping only the ``maxsize`` most recently used entries, with
+    hit and miss counts.  Safe to share between threads.
     """
 
-    if not pks:
-        return qs.none()
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self.clear()
 
-    objects = qs.filter(id__in=pks).extra(
-            select={'_manual': 'FIELD(%s, %s)'
-                % (pk_name, ','.join(map(str, pks)))},
-            order_by=['_manual'])
+    def clear(self):
+        # Entries are links [prev, next, key, value] of a circular list,
+        # most recently used last.
+        self._data = {}
+        self._root = root = []
+        root[:] = [root, root, None, None]
 
-    return objects
+    def get(self, key, default=None):
+        with self._lock:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            # Move to the end.
+            prev, next = link[0], link[1]
+            prev[1], next[0] = next, prev
+            last = self._root[0]
+            last[1] = self._root[0] = link
+            link[0], link[1] = last, self._root
+            return link[3]
 
+    def set(self, key, value):
+        with self._lock:
+            link = self._data.get(key)
+            if link is not None:
+                link[3] = value
+                return
+            if len(self._data) >= self.maxsize:
+                # Drop the least recently used entry.
+                oldest = self._root[1]
+                self._root[1], oldest[1][0] = oldest[1], self._root
+                del self._data[oldest[2]]
+            last = self._root[0]
+            link = [last, self._root, key, value]
+            last[1] = self._root[0] = self._data[key] = link
 
-crc32 = lambda x: zlib.crc32(x) & 0xffffffff
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
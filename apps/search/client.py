@@ -1,36 +1,52 @@
+import base64
+import json
 import os
 import re
 import socket
 import time
+import uuid
 from calendar import timegm
 from collections import defaultdict
 from datetime import timedelta, date
 from operator import itemgetter
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
+from django.utils.importlib import import_module
 
 from product_details import product_details
 from tower import ugettext as _
 
-from input import (KNOWN_DEVICES, KNOWN_MANUFACTURERS, OPINION_PRAISE,
-                   OPINION_IDEA, PLATFORM_USAGE)
-from input.utils import crc32, manual_order
-from feedback.models import Opinion
+from input import OPINION_PRAISE, OPINION_IDEA, PLATFORMS
+from input import metrics
+from feedback.models import Opinion, opinion_cache_key
+from search import pool
+from search.models import attributes
+from search.shards import ShardedClient
+from search.sphinxql import SphinxQLClient
 
+import commonware.log
 import sphinxapi as sphinx
 
 
 SPHINX_HARD_LIMIT = 1000  # A hard limit that sphinx imposes.
+# Queries without a start date only look this far back.
+# TODO: We should allow infinite queries when we get hardware or ES
+DEFAULT_PERIOD = timedelta(days=60)
 
+log = commonware.log.getLogger('i.sphinx')
+slow_log = commonware.log.getLogger('i.search.slow')
 
-def collapsed(matches, trans, name):
+
+def collapsed(matches, decode, name):
     """
     Collapses aggregate matches into a list:
     [{name: 'foo', 'count': 1} ..., {name: 'foo2', 'count': 23}]
     """
     data = defaultdict(int)
     for result in matches:
-        data[trans.get(result['attrs'][name])] += result['attrs']['count']
+        data[decode(result['attrs'][name])] += result['attrs']['count']
 
     return [{name: key, 'count': val} for key, val in
             sorted(data.items(), key=itemgetter(1), reverse=True)]
@@ -54,7 +70,7 @@ def extract_filters(kwargs):
         metas['product'] = kwargs['product']
 
     if kwargs.get('version'):
-        filters['version'] = crc32(kwargs['version'])
+        filters['version'] = attributes.encode('version', kwargs['version'])
 
     if kwargs.get('type'):
         metas['type'] = kwargs['type']
@@ -63,18 +79,17 @@ def extract_filters(kwargs):
         val = kwargs.get(meta)
         if val and val.lower() == 'unknown':
             # In this situation 'unknown' usually means empty.
-            metas[meta] = crc32('')
+            metas[meta] = attributes.encode(meta, '')
         elif val:
-            metas[meta] = crc32(kwargs[meta])
+            metas[meta] = attributes.encode(meta, kwargs[meta])
 
     if kwargs.get('locale'):
-        if kwargs['locale'] == 'unknown':
-            filters['locale'] = crc32('')
+        if kwargs['locale'].lower() == 'unknown':
+            filters['locale'] = attributes.encode('locale', '')
         else:
-            filters['locale'] = crc32(kwargs['locale'])
+            filters['locale'] = attributes.encode('locale', kwargs['locale'])
 
-    # TODO: We should allow infinite queries when we get hardware or ES
-    many_days_ago = date.today() - timedelta(days=60)
+    many_days_ago = date.today() - DEFAULT_PERIOD
     start = time_as_int(kwargs.get('date_start') or many_days_ago,
                         utc=kwargs.get('utc'))
     end_date = (kwargs.get('date_end') or date.today()) + timedelta(days=1)
@@ -84,6 +99,125 @@ def extract_filters(kwargs):
     return (filters, ranges, metas)
 
 
+def _facet_generation():
+    """
+    Current facet cache generation.  Bumping it (on index rotation)
+    invalidates all cached facets at once.
+    """
+    key = settings.CACHE_PREFIX + 'search:facets:gen'
+    gen = cache.get(key)
+    if gen is None:
+        gen = int(time.time())
+        cache.add(key, gen, 0)
+    return gen
+
+
+def invalidate_facets():
+    """Forget all cached facet results, e.g. after the index was rotated."""
+    cache.set(settings.CACHE_PREFIX + 'search:facets:gen',
+              int(time.time() * 1000), 0)
+
+
+def facet_cache_key(term, filters, ranges, metas, meta):
+    """
+    Cache key for the facets of a query, built from the normalized output of
+    ``extract_filters`` plus the requested meta fields.
+    """
+    if isinstance(term, unicode):
+        term = term.encode('utf-8')
+    normalized = (term, sorted(filters.items()), sorted(ranges.items()),
+                  sorted(metas.items()), sorted(meta))
+    return '%ssearch:facets:%s:%s' % (
+        settings.CACHE_PREFIX, _facet_generation(),
+        md5_constructor(repr(normalized)).hexdigest())
+
+
+def result_cache_key(term, limit, offset, kwargs):
+    """Cache key for the complete results of a query."""
+    if isinstance(term, unicode):
+        term = term.encode('utf-8')
+    normalized = (settings.SEARCH_BACKEND, term, limit, offset,
+                  sorted(kwargs.items()))
+    return '%ssearch:results:%s' % (
+        settings.CACHE_PREFIX, md5_constructor(repr(normalized)).hexdigest())
+
+
+def _wait_for(key, timeout, interval=0.1):
+    """Poll the cache for ``key`` for up to ``timeout`` seconds."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        time.sleep(interval)
+        value = cache.get(key)
+        if value:
+            return value
+
+
+def hydrate(ids):
+    """
+    Turn a list of opinion ids into Opinions, in that order.
+
+    Opinions are multi-fetched from the cache; only the misses are loaded from
+    the database (in a single ``pk__in`` query) and cached for next time.
+    Ids that no longer exist are skipped.  Returns ``(opinions, stats)`` where
+    ``stats`` holds the number of cache hits and misses.
+    """
+    if not ids:
+        return [], dict(hits=0, misses=0)
+
+    keys = dict((opinion_cache_key(pk), pk) for pk in ids)
+    found = dict((keys[k], o) for k, o in cache.get_many(keys.keys()).items())
+    misses = [pk for pk in ids if pk not in found]
+
+    if misses:
+        fetched = Opinion.objects.no_cache().filter(pk__in=misses)
+        fetched = dict((o.id, o) for o in fetched)
+        cache.set_many(dict((opinion_cache_key(pk), o) for pk, o in
+                            fetched.items()), settings.CACHE_DEFAULT_PERIOD)
+        found.update(fetched)
+
+    opinions = [found[pk] for pk in ids if pk in found]
+    return opinions, dict(hits=len(ids) - len(misses), misses=len(misses))
+
+
+# Query modes, c.f. BaseClient.
+IDS_ONLY = 'ids_only'
+COUNT_ONLY = 'count_only'
+FACETS_ONLY = 'facets_only'
+
+# Cursor directions: NEXT pages to older opinions, PREV to newer ones.
+CURSOR_NEXT = 'n'
+CURSOR_PREV = 'p'
+
+# How long (in seconds) to wait for somebody else's refresh of a search result
+# that isn't cached at all, before running the query ourselves.
+RESULT_CACHE_WAIT = 3
+
+
+def encode_cursor(direction, created, id, count):
+    """
+    Opaque pagination cursor pointing at the opinion (created, id).
+
+    The cursor also carries the result count of the query it came from: past
+    a cursor, the backend only counts what's left.
+    """
+    return base64.urlsafe_b64encode('%s:%d:%d:%d' % (
+        direction, created, id, count))
+
+
+def decode_cursor(cursor):
+    """Return (direction, created, id, count) for a cursor, or None."""
+    if not cursor:
+        return None
+    try:
+        direction, created, id, count = base64.urlsafe_b64decode(
+            str(cursor)).split(':')
+        if direction not in (CURSOR_NEXT, CURSOR_PREV):
+            return None
+        return direction, int(created), int(id), int(count)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
 def time_as_int(date, utc=False):
     """
     Converts a date or datetime object to a unixtimestamp.  ``utc=True``
@@ -97,23 +231,209 @@ class SearchError(Exception):
     pass
 
 
-class Client(object):
+def get_client():
+    """A search client for the configured ``settings.SEARCH_BACKEND``."""
+    module, cls = settings.SEARCH_BACKEND.rsplit('.', 1)
+    return getattr(import_module(module), cls)()
 
-    def __init__(self):
-        self.sphinx = sphinx.SphinxClient()
 
-        if os.environ.get('DJANGO_ENVIRONMENT') == 'test':
-            self.sphinx.SetServer(settings.SPHINX_HOST,
-                                  settings.TEST_SPHINX_PORT)
-        else:  # pragma: nocover
-            self.sphinx.SetServer(settings.SPHINX_HOST, settings.SPHINX_PORT)
+class BaseClient(object):
+    """
+    Search backend interface.
+
+    ``query(term, limit, offset, **kwargs)`` takes the filters understood by
+    ``extract_filters`` (plus ``meta``, a list of fields to aggregate, and
+    ``cursor``) and returns a ``ResultSet`` of Opinions.  Aggregates end up in
+    ``self.meta``, the number of matches in ``self.total_found``.
+
+    ``mode`` asks for less than that, without touching the database:
 
-        self.index = 'opinions'
+    * ``IDS_ONLY``: a ResultSet of opinion ids,
+    * ``COUNT_ONLY``: just the number of matches,
+    * ``FACETS_ONLY``: just the ``meta`` dict (without a count).
+    """
+
+    def __init__(self):
         self.meta = {}
+        self.total_found = 0
+        self.hydration = dict(hits=0, misses=0)
+        self.cursor = None
+        # Milliseconds spent per step of the last query, c.f. metrics.timer.
+        self.timings = {}
+
+    def query(self, term, limit=20, offset=0, **kwargs):
+        """Submits formatted query, retrieves ids, returns Opinions."""
+        self.timings = {}
+        start = time.time()
+        try:
+            return self._query(term, limit, offset, **kwargs)
+        finally:
+            self.log_query(term, (time.time() - start) * 1000, kwargs)
+
+    def _query(self, term, limit=20, offset=0, **kwargs):
+        raise NotImplementedError
+
+    def cached_query(self, term, limit=20, offset=0, **kwargs):
+        """
+        ``query()`` behind a stale-while-revalidate result cache.
+
+        Once a cached result goes stale, the first worker to grab the refresh
+        lock re-runs the query; everybody else keeps getting the stale result
+        in the meantime instead of piling onto the search backend.  If the
+        refresh fails, the stale result is served for up to
+        ``SEARCH_RESULT_CACHE_GRACE`` seconds.
+        """
+        if not settings.SEARCH_RESULT_CACHE or kwargs.get('mode'):
+            return self.query(term, limit, offset, **kwargs)
+
+        key = result_cache_key(term, limit, offset, kwargs)
+        lock = key + ':lock'
+        entry = cache.get(key)
+        now = time.time()
+        # Results from before the last index rotation are stale, too.
+        generation = _facet_generation()
+
+        if (entry and now < entry['fresh_until'] and
+            entry['generation'] == generation):
+            return self._from_cache(entry)
+
+        # Our own token, so we only ever release our own lock.
+        token = uuid.uuid4().hex
+        if not cache.add(lock, token,
+                         settings.SEARCH_RESULT_CACHE_LOCK_TIMEOUT):
+            # Somebody else is on it.
+            if entry:
+                return self._from_cache(entry)
+            # Nothing to fall back on: give the refresh a moment to finish.
+            entry = _wait_for(key, RESULT_CACHE_WAIT)
+            if entry:
+                return self._from_cache(entry)
+            return self.query(term, limit, offset, **kwargs)
+
+        try:
+            try:
+                result = self.query(term, limit, offset, **kwargs)
+            except SearchError, e:
+                if entry and now < entry['stale_until']:
+                    log.warning('Serving stale search results: %s' % e)
+                    return self._from_cache(entry)
+                raise
+            if not isinstance(result, ResultSet):
+                return result
+            timeout = settings.SEARCH_RESULT_CACHE_TIMEOUT
+            grace = settings.SEARCH_RESULT_CACHE_GRACE
+            cache.set(key, dict(ids=[o.id for o in result],
+                                total=self.total_found, offset=result.offset,
+                                count=result.count,
+                                next_cursor=result.next_cursor,
+                                prev_cursor=result.prev_cursor,
+                                meta=self.meta, cursor=self.cursor,
+                                generation=generation,
+                                fresh_until=now + timeout,
+                                stale_until=now + timeout + grace),
+                      timeout + grace)
+            return result
+        finally:
+            # If our lock timed out, it may be somebody else's by now.
+            if cache.get(lock) == token:
+                cache.delete(lock)
+
+    def _from_cache(self, entry):
+        self.meta.update(entry['meta'])
+        self.total_found = entry['total']
+        self.cursor = entry['cursor']
+        opinions, self.hydration = hydrate(entry['ids'])
+        return ResultSet(opinions, entry['total'], entry['offset'],
+                         count=entry.get('count'), next_cursor=entry['next_cursor'],
+                         prev_cursor=entry['prev_cursor'])
+
+    def log_query(self, term, ms, kwargs):
+        """Record the total query time; log the whole query if it was slow."""
+        metrics.timing('search.query', ms)
+        self.timings['search.query'] = ms
+        if ms < settings.SEARCH_SLOW_QUERY_MS:
+            return
+        filters = dict((k, v if isinstance(v, (int, long, float, list, tuple))
+                        else unicode(v)) for k, v in kwargs.items()
+                       if v not in (None, ''))
+        slow_log.warning(json.dumps(dict(
+            term=term, filters=filters, total_found=self.total_found,
+            hydration=self.hydration,
+            timings=dict((k, int(v)) for k, v in self.timings.items()))))
+
+    def result_set(self, rows, offset, ids_only=False):
+        """
+        Build the ResultSet for ``rows``, a page of ``(id, created)`` tuples
+        in the order the backend returned them.  With ``ids_only``, the
+        ResultSet holds opinion ids instead of Opinions.
+        """
+        direction = self.cursor[0] if self.cursor else None
+        if direction == CURSOR_PREV:
+            rows = list(reversed(rows))
+
+        if ids_only:
+            opinions = [id for id, _ in rows]
+        else:
+            with metrics.timer('search.hydrate', self.timings):
+                opinions, self.hydration = hydrate([id for id, _ in rows])
+            log.debug('Hydrated %d opinions: %d cache hits, %d misses.' % (
+                len(opinions), self.hydration['hits'],
+                self.hydration['misses']))
+
+        # Is there anything beyond this page (in either direction)?
+        more = self.total_found > len(rows)
+        if direction == CURSOR_NEXT:
+            has_next, has_prev = more, True
+        elif direction == CURSOR_PREV:
+            has_next, has_prev = True, more
+        else:
+            has_next = offset + len(rows) < self.total_found
+            has_prev = offset > 0
+
+        # Past a cursor, total_found only counts what's left: the count of
+        # the whole query comes with the cursor.
+        count = self.cursor[3] if self.cursor else self.total_found
+
+        next_cursor = prev_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(CURSOR_NEXT, rows[-1][1], rows[-1][0],
+                                        count)
+        if rows and has_prev:
+            prev_cursor = encode_cursor(CURSOR_PREV, rows[0][1], rows[0][0],
+                                        count)
+
+        return ResultSet(opinions, self.total_found, offset, count=count,
+                         next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+
+class Client(BaseClient):
+    """Sphinx search backend."""
+
+    def __init__(self):
+        super(Client, self).__init__()
+        test = os.environ.get('DJANGO_ENVIRONMENT') == 'test'
+        if settings.SPHINX_SHARDS:  # pragma: nocover
+            self.sphinx = ShardedClient(settings.SPHINX_SHARDS)
+        elif settings.SPHINX_TRANSPORT == 'sphinxql':
+            self.sphinx = SphinxQLClient(settings.SPHINX_HOST,
+                                         settings.TEST_SPHINXQL_PORT if test
+                                         else settings.SPHINXQL_PORT)
+        else:
+            self.sphinx = sphinx.SphinxClient()
+
+            if test:
+                self.sphinx.SetServer(settings.SPHINX_HOST,
+                                      settings.TEST_SPHINX_PORT)
+            else:  # pragma: nocover
+                self.sphinx.SetServer(settings.SPHINX_HOST,
+                                      settings.SPHINX_PORT)
+
+        # Later indexes win: the delta index (and its kill-list) overrides
+        # what is in the main index.
+        self.index = 'opinions, opinions_delta'
         self.queries = {}
         self.query_index = 0
         self.meta_filters = {}
-        self.total_found = 0
 
     def add_meta_query(self, field, term):
         """Adds a 'meta' query to the client, this is an aggregate of some
@@ -169,14 +489,20 @@ class Client(object):
 
         self.sphinx.SetFilter(field, values)
 
-    def query(self, term, limit=20, offset=0, **kwargs):
-        """Submits formatted query, retrieves ids, returns Opinions."""
+    def _query(self, term, limit=20, offset=0, **kwargs):
         sc = self.sphinx
         term = sanitize_query(term)
 
         # Extract and apply various filters.
         (includes, ranges, metas) = extract_filters(kwargs)
 
+        url_re = re.compile(r'\burl:\*\B')
+
+        if url_re.search(term):
+            parts = url_re.split(term)
+            includes['has_url'] = 1
+            term = ''.join(parts)
+
         for filter, value in includes.iteritems():
             self.add_filter(filter, value)
 
@@ -186,27 +512,64 @@ class Client(object):
         for filter, value in metas.iteritems():
             self.add_filter(filter, value, meta=True)
 
-        url_re = re.compile(r'\burl:\*\B')
+        # Facets only depend on the filter set, not on the page we are on.
+        facets = facet_key = None
+        if kwargs.get('meta') and settings.SEARCH_FACET_CACHE:
+            facet_key = facet_cache_key(term, includes, ranges, metas,
+                                        kwargs['meta'])
+            facets = cache.get(facet_key)
 
-        if url_re.search(term):
-            parts = url_re.split(term)
-            sc.SetFilter('has_url', (1,))
-            term = ''.join(parts)
-
-        if 'meta' in kwargs:
+        if 'meta' in kwargs and facets is None:
             for meta in kwargs['meta']:
                 self.add_meta_query(meta, term)
 
-        sc.SetLimits(min(SPHINX_HARD_LIMIT - limit, offset), limit)
-
-        # Always sort in reverse chronological order.
-        sc.SetSortMode(sphinx.SPH_SORT_EXTENDED, 'created DESC')
-        sc.AddQuery(term, self.index)
-        self.queries['primary'] = self.query_index
-        self.query_index += 1
+        mode = kwargs.get('mode')
+        if mode == FACETS_ONLY and not self.queries:
+            # All facets came from the cache: nothing to ask searchd.
+            self.meta.update(facets or {})
+            return self.meta
+
+        # Always sort in reverse chronological order (ties broken by id, so
+        # cursors are stable).
+        cursor = decode_cursor(kwargs.get('cursor'))
+        if mode == FACETS_ONLY:
+            cursor = None
+        elif mode == COUNT_ONLY:
+            # We only need total_found; one match is as cheap as it gets.
+            cursor = None
+            sc.SetSelect('*')
+            sc.SetLimits(0, 1)
+        elif cursor:
+            # Keyset pagination: instead of skipping ``offset`` matches, only
+            # match opinions past the cursor's (created, id).
+            direction, created, id = cursor[:3]
+            op, order = (('<', 'DESC') if direction == CURSOR_NEXT else
+                         ('>', 'ASC'))
+            sc.SetSelect('*, created %s %d OR (created = %d AND @id %s %d) '
+                         'AS keyset' % (op, created, created, op, id))
+            sc.SetFilter('keyset', (1,))
+            sc.SetLimits(0, limit)
+            sc.SetSortMode(sphinx.SPH_SORT_EXTENDED,
+                           'created %s, @id %s' % (order, order))
+            offset = 0
+        else:
+            sc.SetSelect('*')
+            sc.SetLimits(min(SPHINX_HARD_LIMIT - limit, offset), limit)
+            sc.SetSortMode(sphinx.SPH_SORT_EXTENDED, 'created DESC, @id DESC')
+        self.cursor = cursor
+        if mode != FACETS_ONLY:
+            sc.AddQuery(term, self.index)
+            self.queries['primary'] = self.query_index
+            self.query_index += 1
         try:
-            results = sc.RunQueries()
+            with metrics.timer('search.sphinx.run_queries', self.timings):
+                if isinstance(sc, sphinx.SphinxClient):
+                    results = pool.run_queries(sc)
+                else:
+                    # Sharded and SphinxQL clients do their own pooling.
+                    results = sc.RunQueries()
         except socket.timeout:
+            metrics.incr('search.sphinx.timeouts')
             raise SearchError(_("Query has timed out."))
         except Exception, e:
             # L10n: Sphinx is the name of the search engine software.
@@ -215,16 +578,40 @@ class Client(object):
         if sc.GetLastError():
             raise SearchError(sc.GetLastError())
 
-        result = results[self.queries['primary']]
-        self.total_found = result.get('total_found', 0) if result else 0
+        # searchd's own time for each sub-query (primary and metas).
+        for name, i in self.queries.items():
+            if results[i]:
+                ms = float(results[i].get('time') or 0) * 1000
+                metrics.timing('search.sphinx.query.%s' % name, ms)
+                self.timings['search.sphinx.query.%s' % name] = ms
 
+        # Without a primary query, the first facet query has to do.
+        result = results[self.queries.get('primary', 0)]
         if result['error']:
             raise SearchError(result['error'])
 
-        self.handle_metas(results, kwargs.get('meta', {}), kwargs)
+        if mode != FACETS_ONLY:
+            self.total_found = result.get('total_found', 0) if result else 0
+            metrics.histogram('search.total_found', self.total_found)
 
-        if result and 'total' in result:
-            return self.get_result_set(term, result, offset, limit)
+        if facets is not None:
+            metrics.incr('search.facets.cache_hits')
+            self.meta.update(facets)
+        else:
+            with metrics.timer('search.metas', self.timings):
+                self.handle_metas(results, kwargs.get('meta', {}), kwargs)
+            if facet_key:
+                cache.set(facet_key, self.meta,
+                          settings.SEARCH_FACET_CACHE_TIMEOUT)
+
+        if mode == FACETS_ONLY:
+            return self.meta
+        elif mode == COUNT_ONLY:
+            return self.total_found
+        elif result and 'total' in result:
+            with metrics.timer('search.result_set', self.timings):
+                return self.get_result_set(term, result, offset, limit,
+                                           ids_only=(mode == IDS_ONLY))
         else:
             return []
 
@@ -254,45 +641,51 @@ class Client(object):
 
     def _platform_meta(self, results, **kwargs):
         result = results[self.queries['platform']]
-        t = dict(((crc32(f.short), f.short) for f in PLATFORM_USAGE))
+        known = lambda p: p if p in PLATFORMS else None
         return [dict(count=f['attrs']['count'],
-                     platform=t.get(f['attrs']['platform']))
+                     platform=known(attributes.decode(f['attrs']['platform'])))
                 for f in result['matches']]
 
     def _manufacturer_meta(self, results, **kwargs):
         result = results[self.queries['manufacturer']]
-        t = dict(((crc32(m), m) for m in KNOWN_MANUFACTURERS))
-        return collapsed(result['matches'], t, 'manufacturer')
+        return collapsed(result['matches'], attributes.decode, 'manufacturer')
 
     def _device_meta(self, results, **kwargs):
         result = results[self.queries['device']]
-        t = dict(((crc32(d), d) for d in KNOWN_DEVICES))
-        return collapsed(result['matches'], t, 'device')
+        return collapsed(result['matches'], attributes.decode, 'device')
 
     def _locale_meta(self, results, **kwargs):
         result = results[self.queries['locale']]
         if 'matches' in result:
-            t = dict(((crc32(f), f) for f in product_details.languages))
+            known = lambda l: l if l in product_details.languages else None
             return [dict(count=f['attrs']['count'],
-                         locale=t.get(f['attrs']['locale']))
+                         locale=known(attributes.decode(f['attrs']['locale'])))
                     for f in result['matches']]
 
-    def get_result_set(self, term, result, offset, limit):
+    def get_result_set(self, term, result, offset, limit, ids_only=False):
         # Return results as a ResultSet of opinions
-        opinion_ids = [m['id'] for m in result['matches']]
-        opinions = manual_order(Opinion.objects.all(), opinion_ids)
-        return ResultSet(opinions, self.total_found, offset)
+        return self.result_set([(m['id'], m['attrs']['created'])
+                                for m in result['matches']], offset,
+                               ids_only=ids_only)
 
 
 class ResultSet(object):
     """
-    ResultSet wraps around a query set and provides meta data used for
-    pagination.
+    ResultSet wraps around the opinions of the current page and provides meta
+    data used for pagination: either offset based, or through opaque
+    ``next_cursor`` (older) and ``prev_cursor`` (newer) cursors.
+
+    ``count`` is the number of matches of the whole query; past a cursor,
+    ``total`` only covers the matches from the cursor on.
     """
-    def __init__(self, queryset, total, offset):
+    def __init__(self, queryset, total, offset, next_cursor=None,
+                 prev_cursor=None, count=None):
         self.queryset = queryset
         self.total = total
         self.offset = offset
+        self.count = total if count is None else count
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
 
     def __len__(self):
         return self.total
@@ -1,24 +1,73 @@
+import sys
+import time
+
+from django.conf import settings
+
 import commonware.log
 import cronjobs
-from celery.messaging import establish_connection
-from celeryutils import chunked
 
 import input
-from feedback.models import Opinion
-from search import tasks
+from search import elastic, reindex, tasks
+from search.client import Client, invalidate_facets
 
 log = commonware.log.getLogger('i.cron')
 
 
 @cronjobs.register
-def index_all():
+def index_all(processes=4):
+    """
+    This reindexes all the Opinions in usage into a new ElasticSearch index
+    and then makes that the live one; searches keep using the old index
+    until then.  An interrupted run picks up where it left off.
+    Usage: ``cron index_all [processes]``
+    """
+    index = elastic.start_rebuild()
+    print 'Building %s.' % index
+    reindex.reindex(index, types=[i.id for i in input.OPINION_USAGE],
+                    processes=int(processes), out=sys.stdout)
+    elastic.finish_rebuild(index)
+
+
+@cronjobs.register
+def rotate_facets():
+    """
+    Invalidate cached search facets.  Run this whenever the Sphinx index was
+    rotated outside of Django (e.g. ``indexer --all --rotate``).
+    """
+    invalidate_facets()
+
+
+@cronjobs.register
+def merge_delta_index():
+    """
+    Merge the delta Sphinx index into the main one.  Run this periodically
+    (e.g. hourly) on the Sphinx box to keep the delta index small.
+    """
+    tasks.merge_delta()
+
+
+@cronjobs.register
+def benchmark_sphinxql(runs=50):
     """
-    This reindexes all the Opinions in usage.  This is not intended to be run
-    other than to initially seed Elastic Search.
+    Compare the binary API and SphinxQL transports on the dashboard query
+    (primary query plus six facets).  Usage: ``cron benchmark_sphinxql [runs]``
     """
-    ids = (Opinion.objects
-           .filter(_type__in=[i.id for i in input.OPINION_USAGE])
-           .values_list('id', flat=True))
-    with establish_connection() as conn:
-        for chunk in chunked(ids, 1000):
-            tasks.add_to_index.apply_async(args=[chunk], connection=conn)
+    meta = ('type', 'locale', 'platform', 'day_sentiment', 'manufacturer',
+            'device')
+    old = settings.SPHINX_TRANSPORT, settings.SEARCH_FACET_CACHE
+    settings.SEARCH_FACET_CACHE = False
+    try:
+        for transport in ('api', 'sphinxql'):
+            settings.SPHINX_TRANSPORT = transport
+            times = []
+            for i in xrange(int(runs)):
+                c = Client()
+                start = time.time()
+                c.query('', meta=meta, product=input.FIREFOX.id)
+                times.append((time.time() - start) * 1000)
+            times.sort()
+            print '%-8s  mean %6.1fms  p50 %6.1fms  p95 %6.1fms' % (
+                transport, sum(times) / len(times), times[len(times) / 2],
+                times[int(len(times) * .95)])
+    finally:
+        settings.SPHINX_TRANSPORT, settings.SEARCH_FACET_CACHE = old
@@ -0,0 +1,332 @@
+"""
+ElasticSearch search backend.
+
+Opinions are pushed to ElasticSearch by ``Opinion.update_index`` (see
+``feedback.models``).  ``ElasticClient`` answers the same queries as the
+Sphinx ``search.client.Client`` from that index; pick it with::
+
+    SEARCH_BACKEND = 'search.elastic.ElasticClient'
+"""
+import re
+import time
+from calendar import timegm
+from collections import defaultdict
+from datetime import date, timedelta
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+
+import commonware.log
+from elasticutils import get_es
+from product_details import product_details
+from pyes.exceptions import IndexMissingException
+from tower import ugettext as _
+
+from input import (OPINION_PRAISE, OPINION_ISSUE, OPINION_IDEA,
+                   PLATFORM_USAGE)
+from input import metrics
+from search.client import (BaseClient, SearchError, CURSOR_NEXT,
+                           COUNT_ONLY, DEFAULT_PERIOD, FACETS_ONLY, IDS_ONLY,
+                           decode_cursor, sanitize_query)
+
+log = commonware.log.getLogger('i.elastic')
+
+DOC_TYPE = 'opinion'
+
+# Facets are over the whole filtered set, not just one page of it.
+FACET_SIZE = 1000
+
+# Keyword fields must not be analyzed, or facets would count tokens.
+MAPPING = {
+    DOC_TYPE: {
+        'properties': {
+            'id': {'type': 'long'},
+            'type': {'type': 'integer'},
+            'product': {'type': 'integer'},
+            'version': {'type': 'string', 'index': 'not_analyzed'},
+            'platform': {'type': 'string', 'index': 'not_analyzed'},
+            'locale': {'type': 'string', 'index': 'not_analyzed'},
+            'manufacturer': {'type': 'string', 'index': 'not_analyzed'},
+            'device': {'type': 'string', 'index': 'not_analyzed'},
+            'url': {'type': 'string', 'index': 'not_analyzed'},
+            'has_url': {'type': 'boolean'},
+            'description': {'type': 'string', 'analyzer': 'snowball'},
+            'created': {'type': 'date'},
+        },
+    },
+}
+
+
+# Index settings while bulk loading a new index, and once it's live.
+BULK_SETTINGS = {'index': {'refresh_interval': '-1',
+                           'number_of_replicas': 0}}
+LIVE_SETTINGS = lambda: {'index': {'refresh_interval': '1s',
+                                   'number_of_replicas': settings.ES_REPLICAS}}
+
+# While an index is rebuilt, this alias points at it.  Writers look the alias
+# up at most every REBUILD_CACHE_TIMEOUT seconds.
+REBUILD_ALIAS = lambda: '%s-rebuild' % settings.ES_INDEX
+REBUILD_CACHE = '%ssearch:elastic:write_indexes' % settings.CACHE_PREFIX
+REBUILD_CACHE_TIMEOUT = 60
+
+
+def create_index(es=None, index=None, index_settings=None):
+    """Create the opinions index with our mapping."""
+    es = es or get_es()
+    index = index or settings.ES_INDEX
+    if index_settings:
+        es.create_index(index, settings=index_settings)
+    else:
+        es.create_index_if_missing(index)
+    es.put_mapping(DOC_TYPE, MAPPING[DOC_TYPE], [index])
+
+
+def rebuilding(es=None):
+    """The name of the index being rebuilt, or None."""
+    es = es or get_es()
+    try:
+        indexes = es.get_alias(REBUILD_ALIAS())
+    except IndexMissingException:
+        return None
+    return indexes[0] if indexes else None
+
+
+def write_indexes():
+    """
+    The indexes updates go to: the live one (``ES_INDEX``, an alias), and
+    the one being rebuilt, if any.
+    """
+    indexes = cache.get(REBUILD_CACHE)
+    if indexes is None:
+        rebuild = rebuilding()
+        indexes = [settings.ES_INDEX] + ([rebuild] if rebuild else [])
+        cache.set(REBUILD_CACHE, indexes, REBUILD_CACHE_TIMEOUT)
+    return indexes
+
+
+def start_rebuild(es=None):
+    """
+    Create a new, versioned index to rebuild into and return its name.  An
+    unfinished rebuild is picked up instead.  Until ``finish_rebuild``, new
+    updates go to both the live index and the new one.
+
+    The rebuild is recorded in ElasticSearch itself (``REBUILD_ALIAS``), so
+    nothing short of ``finish_rebuild`` ends it.
+    """
+    es = es or get_es()
+    index = rebuilding(es)
+    if index:
+        return index
+    index = '%s-%s' % (settings.ES_INDEX, time.strftime('%Y%m%d%H%M%S'))
+    create_index(es, index, BULK_SETTINGS)
+    es.change_aliases([('add', index, REBUILD_ALIAS())])
+    cache.delete(REBUILD_CACHE)
+    return index
+
+
+def finish_rebuild(index, es=None):
+    """
+    Make the rebuilt ``index`` live: restore refreshes and replicas, point
+    the ``ES_INDEX`` alias at it (atomically) and drop the old index.
+    """
+    es = es or get_es()
+    alias = settings.ES_INDEX
+    es.update_settings(index, LIVE_SETTINGS())
+    es.refresh([index])
+
+    try:
+        current = es.get_alias(alias)
+    except IndexMissingException:
+        current = []
+    old = [i for i in current if i != index]
+    if not current:
+        # There may be a plain index by the alias' name (from before
+        # versioned indexes); it has to go before the alias can be created.
+        try:
+            es.delete_index(alias)
+        except IndexMissingException:
+            pass
+
+    es.change_aliases([('remove', i, alias) for i in old] +
+                      [('add', index, alias),
+                       ('remove', index, REBUILD_ALIAS())])
+    cache.delete(REBUILD_CACHE)
+    for i in old:
+        es.delete_index(i)
+    log.info('Index %s is live as %s.' % (index, alias))
+
+
+def _millis(d):
+    """Milliseconds since the epoch for the start of day ``d``."""
+    return timegm(d.timetuple()) * 1000
+
+
+def extract_filters(kwargs):
+    """
+    The ElasticSearch counterpart of ``search.client.extract_filters``:
+    returns a list of filters for the given search options.
+    """
+    filters = []
+    term = lambda field, value: filters.append({'term': {field: value}})
+
+    if isinstance(kwargs.get('product'), int):
+        term('product', kwargs['product'])
+
+    if kwargs.get('version'):
+        term('version', kwargs['version'])
+
+    if kwargs.get('type'):
+        term('type', kwargs['type'])
+
+    for field in ('platform', 'manufacturer', 'device', 'locale'):
+        val = kwargs.get(field)
+        if val and val.lower() == 'unknown':
+            # In this situation 'unknown' usually means empty.
+            term(field, '')
+        elif val:
+            term(field, val)
+
+    start = kwargs.get('date_start') or date.today() - DEFAULT_PERIOD
+    end = (kwargs.get('date_end') or date.today()) + timedelta(days=1)
+    filters.append({'range': {'created': {
+        'gte': _millis(start),
+        'lt': _millis(end)}}})
+
+    return filters
+
+
+class ElasticClient(BaseClient):
+    """ElasticSearch search backend."""
+
+    def __init__(self):
+        super(ElasticClient, self).__init__()
+        self.es = get_es()
+        self.index = settings.ES_INDEX
+
+    def _query(self, term, limit=20, offset=0, **kwargs):
+        term = sanitize_query(term)
+        filters = extract_filters(kwargs)
+
+        url_re = re.compile(r'\burl:\*\B')
+        if url_re.search(term):
+            filters.append({'term': {'has_url': True}})
+            term = ''.join(url_re.split(term))
+
+        # Always sort in reverse chronological order (ties broken by id, so
+        # cursors are stable).
+        order = 'desc'
+        mode = kwargs.get('mode')
+        cursor = decode_cursor(kwargs.get('cursor'))
+        if mode in (COUNT_ONLY, FACETS_ONLY):
+            # Counts and facets come with any search; skip the hits.
+            cursor = None
+            limit = offset = 0
+        elif cursor:
+            # Keyset pagination: only match opinions past the cursor.
+            direction, created, id = cursor[:3]
+            op, order = (('lt', 'desc') if direction == CURSOR_NEXT else
+                         ('gt', 'asc'))
+            created *= 1000
+            filters.append({'or': [
+                {'range': {'created': {op: created}}},
+                {'and': [{'term': {'created': created}},
+                         {'range': {'id': {op: id}}}]}]})
+            offset = 0
+        self.cursor = cursor
+
+        if term.strip():
+            query = {'query_string': {'query': term,
+                                      'default_field': 'description',
+                                      'default_operator': 'AND'}}
+        else:
+            query = {'match_all': {}}
+
+        body = {
+            'query': {'filtered': {'query': query,
+                                   'filter': {'and': filters}}},
+            'sort': [{'created': order}, {'id': order}],
+            'fields': ['id'],
+            'from': offset,
+            'size': limit,
+            'facets': self.facets(kwargs.get('meta', [])),
+        }
+
+        try:
+            with metrics.timer('search.elastic.search', self.timings):
+                result = self.es.search(body, [self.index], [DOC_TYPE])
+        except Exception, e:
+            log.error('ElasticSearch query failed: %s' % e)
+            # L10n: ElasticSearch is the name of the search engine software.
+            raise SearchError(_('ElasticSearch threw an unknown exception: '
+                                '%s') % e)
+
+        self.total_found = result['hits']['total']
+        metrics.histogram('search.total_found', self.total_found)
+        with metrics.timer('search.metas', self.timings):
+            self.handle_facets(result.get('facets', {}),
+                               kwargs.get('meta', []))
+
+        if mode == FACETS_ONLY:
+            return self.meta
+        elif mode == COUNT_ONLY:
+            return self.total_found
+
+        # The first sort value is ``created`` in milliseconds.
+        rows = [(int(hit['_id']), hit['sort'][0] // 1000)
+                for hit in result['hits']['hits']]
+        with metrics.timer('search.result_set', self.timings):
+            return self.result_set(rows, offset, ids_only=(mode == IDS_ONLY))
+
+    def facets(self, metas):
+        facets = {}
+        for meta in metas:
+            if meta == 'day_sentiment':
+                # One histogram per opinion type.
+                for type in (OPINION_PRAISE, OPINION_ISSUE, OPINION_IDEA):
+                    facets['day_sentiment_%s' % type.id] = {
+                        'date_histogram': {'field': 'created',
+                                           'interval': 'day'},
+                        'facet_filter': {'term': {'type': type.id}}}
+            else:
+                facets[meta] = {'terms': {'field': meta, 'size': FACET_SIZE}}
+        return facets
+
+    def handle_facets(self, facets, metas):
+        for meta in metas:
+            self.meta[meta] = getattr(self, '_%s_meta' % meta)(facets, meta)
+
+    def _terms(self, facets, name, known=None):
+        """
+        Counts from a terms facet, as [{name: value, 'count': n}, ...].
+        Values not in ``known`` (if given) are lumped together as None.
+        """
+        data = defaultdict(int)
+        for t in facets[name]['terms']:
+            value = t['term']
+            if known is not None and value not in known:
+                value = None
+            data[value] += t['count']
+        return [{name: key, 'count': val} for key, val in
+                sorted(data.items(), key=itemgetter(1), reverse=True)]
+
+    def _day_sentiment_meta(self, facets, name):
+        days = lambda type: [(e['time'] // 1000, e['count']) for e in
+                             facets['day_sentiment_%s' % type.id]['entries']]
+        return dict(praise=days(OPINION_PRAISE), issue=days(OPINION_ISSUE),
+                    idea=days(OPINION_IDEA))
+
+    def _type_meta(self, facets, name):
+        return self._terms(facets, name)
+
+    def _platform_meta(self, facets, name):
+        return self._terms(facets, name, set(p.short for p in PLATFORM_USAGE))
+
+    def _manufacturer_meta(self, facets, name):
+        return self._terms(facets, name)
+
+    def _device_meta(self, facets, name):
+        return self._terms(facets, name)
+
+    def _locale_meta(self, facets, name):
+        return self._terms(facets, name, product_details.languages)
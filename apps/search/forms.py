@@ -7,9 +7,9 @@ from product_details import product_details
 from product_details.version_compare import Version
 from tower import ugettext_lazy as _lazy
 
-from input import (FIREFOX, MOBILE, PLATFORM_USAGE, LATEST_BETAS,
-                   KNOWN_DEVICES, KNOWN_MANUFACTURERS)
+from input import FIREFOX, MOBILE, PLATFORM_USAGE, LATEST_BETAS
 from input.fields import DateInput, SearchInput
+from input.urlresolvers import get_site_id
 
 
 PROD_CHOICES = (
@@ -38,12 +38,6 @@ SENTIMENTS = ('happy', 'sad', 'ideas')
 PLATFORM_CHOICES = ([('', _lazy('-- all --', 'platform_choice'))] +
               [(p.short, p.pretty) for p in PLATFORM_USAGE])
 
-MANUFACTURER_CHOICES = [('Unknown', _lazy('Unknown'))] + [(m, m) for m in
-                                                          KNOWN_MANUFACTURERS]
-
-DEVICE_CHOICES = [('Unknown', _lazy('Unknown'))] + [(d, d) for d in
-                                                    KNOWN_DEVICES]
-
 LOCALE_CHOICES = [
     ('', _lazy('-- all --', 'locale_choice')),
     ('Unknown', _lazy('Unknown')),
@@ -63,19 +57,25 @@ class ReporterSearchForm(forms.Form):
                                choices=LOCALE_CHOICES)
     platform = forms.ChoiceField(required=False, label=_lazy('PLATFORM:'),
                            choices=PLATFORM_CHOICES)
-    manufacturer = forms.ChoiceField(required=False,
-                                     choices=MANUFACTURER_CHOICES)
-    device = forms.ChoiceField(required=False, choices=DEVICE_CHOICES)
+    # Any manufacturer or device the search index knows about ('Unknown' for
+    # none), not just KNOWN_MANUFACTURERS/KNOWN_DEVICES.
+    manufacturer = forms.CharField(required=False, max_length=255)
+    device = forms.CharField(required=False, max_length=255)
     date_start = forms.DateField(required=False, widget=DateInput(
         attrs={'class': 'datepicker'}), label=_lazy('Date range:'))
     date_end = forms.DateField(required=False, widget=DateInput(
         # L10n: This indicates the second part of a date range.
         attrs={'class': 'datepicker'}), label=_lazy('to'))
     page = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    cursor = forms.CharField(widget=forms.HiddenInput, required=False)
 
     # TODO(davedash): Make this prettier.
     def __init__(self, *args, **kwargs):
-        """Pick version choices and initial product based on site ID."""
+        """
+        Pick version choices and initial product based on site ID (the
+        ``site_id`` argument, or that of the current request).
+        """
+        site_id = kwargs.pop('site_id', None) or get_site_id()
         super(ReporterSearchForm, self).__init__(*args, **kwargs)
         self.fields['version'].choices = VERSION_CHOICES[FIREFOX]
 
@@ -87,7 +87,7 @@ class ReporterSearchForm(forms.Form):
             except forms.ValidationError:
                 pass
         if (picked == MOBILE.short or not self.is_bound and
-            settings.SITE_ID == settings.MOBILE_SITE_ID):
+            site_id == settings.MOBILE_SITE_ID):
             # We default to Firefox. Only change if this is the mobile site.
             self.fields['product'].initial = MOBILE.short
             self.fields['version'].choices = VERSION_CHOICES[MOBILE]
@@ -106,9 +106,12 @@ class ReporterSearchForm(forms.Form):
             (cleaned['date_start'], cleaned['date_end']) = (
                     cleaned['date_end'], cleaned['date_start'])
 
-        # Ensure page is a natural number.
+        # Ensure page is a natural number.  Offset paging stops at
+        # SEARCH_MAX_PAGES (Sphinx only gives out so many matches); cursors go
+        # on from there.
         try:
-            cleaned['page'] = int(cleaned.get('page'))
+            cleaned['page'] = min(int(cleaned.get('page')),
+                                  settings.SEARCH_MAX_PAGES)
             assert cleaned['page'] > 0
         except (TypeError, AssertionError):
             cleaned['page'] = 1
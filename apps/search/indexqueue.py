@@ -0,0 +1,51 @@
+"""
+Coalescing queue of ElasticSearch index updates.
+
+Saving or deleting an opinion only queues an INDEX or DELETE of it (see
+``input.cachequeue``).  The ``search.tasks.flush_index_queue`` task sends
+what's queued as a single bulk request, once ``SEARCH_INDEX_BATCH_SIZE``
+updates are waiting or ``SEARCH_INDEX_BATCH_MS`` after the first one came in.
+Repeated updates of the same opinion are only sent once.
+"""
+from django.conf import settings
+
+from input.cachequeue import CacheQueue
+
+INDEX = 'index'
+DELETE = 'delete'
+
+queue = CacheQueue('search.indexqueue', 'search.tasks.flush_index_queue',
+                   'SEARCH_INDEX_BATCH_SIZE', 'SEARCH_INDEX_BATCH_MS')
+
+
+def enqueue(action, id):
+    """Queue an INDEX or DELETE of opinion ``id``."""
+    if settings.ES_DISABLED:
+        return
+    queue.push(id, action)
+
+
+def enqueue_many(action, ids):
+    """Queue an INDEX or DELETE of each of the opinion ``ids``."""
+    if settings.ES_DISABLED:
+        return
+    queue.push_many(ids, action)
+
+
+def flush(es):
+    """Send all queued updates to ElasticSearch in one bulk request."""
+    def send(updates):
+        from feedback.models import Opinion
+        from search.elastic import write_indexes
+        index = [id for id, (action, _) in updates.items() if action == INDEX]
+        delete = [id for id, (action, _) in updates.items()
+                  if action == DELETE]
+
+        indexes = write_indexes()
+        for opinion in Opinion.objects.filter(pk__in=index):
+            opinion.update_index(bulk=True, indexes=indexes)
+        for id in delete:
+            Opinion(id=id).remove_from_index(bulk=True, indexes=indexes)
+        es.force_bulk()
+
+    return queue.flush(send)
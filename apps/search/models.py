@@ -0,0 +1,149 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.db.models import signals
+
+from feedback.models import Opinion, opinions_created
+
+
+class DirtyOpinionManager(models.Manager):
+    def mark(self, opinion_id):
+        """Flag an opinion for (re)indexing by the next delta index run."""
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO search_dirtyopinion (opinion_id, modified) '
+            'VALUES (%s, NOW()) ON DUPLICATE KEY UPDATE modified = NOW()',
+            [opinion_id])
+        transaction.commit_unless_managed()
+
+
+class DirtyOpinion(models.Model):
+    """
+    An opinion changed or deleted since the main Sphinx index was built.
+
+    The delta index picks these up, and its kill-list hides their stale
+    copies in the main index (c.f. configs/sphinx/sphinx.conf).
+    """
+    opinion_id = models.PositiveIntegerField(primary_key=True)
+    modified = models.DateTimeField(db_index=True)
+
+    objects = DirtyOpinionManager()
+
+
+class IndexCounter(models.Model):
+    """
+    Bookkeeping for the main and delta Sphinx indexes, one row per (shard of
+    the) main index, maintained by the indexer through sphinx.conf.  The main
+    index covers opinions up to ``max_id`` as of ``indexed``; the delta index
+    was last built at ``delta_indexed`` when the newest opinion was
+    ``delta_max_id``.
+    """
+    id = models.PositiveIntegerField(primary_key=True)
+    max_id = models.PositiveIntegerField(default=0)
+    indexed = models.DateTimeField(null=True)
+    delta_max_id = models.PositiveIntegerField(default=0)
+    delta_indexed = models.DateTimeField(null=True)
+
+
+# String attributes of opinions that the Sphinx index stores as integer ids.
+ATTRIBUTE_FIELDS = ('platform', 'version', 'locale', 'manufacturer', 'device')
+
+
+class Attribute(models.Model):
+    """
+    Integer id for one value of a string attribute (platform, locale, ...).
+
+    The Sphinx index stores these ids instead of the strings; the indexer
+    adds new values (c.f. configs/sphinx/sphinx.conf) and ``attributes``
+    translates between ids and values.
+    """
+    field = models.CharField(max_length=30)
+    value = models.CharField(max_length=255)
+
+    class Meta:
+        unique_together = ('field', 'value')
+
+
+class AttributeDictionary(object):
+    """
+    Process-wide two-way map between attribute values and their ids, loaded
+    from the Attribute table.  Unknown ids or values trigger a reload, at
+    most every ``reload_interval`` seconds.
+    """
+
+    def __init__(self, reload_interval=60):
+        self.reload_interval = reload_interval
+        self.values = []  # id -> value
+        self.ids = {}  # (field, value) -> id
+        self.loaded = 0
+        self._lock = threading.Lock()
+
+    def load(self):
+        rows = list(Attribute.objects.values_list('id', 'field', 'value'))
+        values = [None] * (max([r[0] for r in rows] or [0]) + 1)
+        ids = {}
+        for id, field, value in rows:
+            values[id] = value
+            ids[(field, value)] = id
+        self.values, self.ids = values, ids
+        self.loaded = time.time()
+
+    def _maybe_reload(self):
+        with self._lock:
+            if time.time() - self.loaded > self.reload_interval:
+                self.load()
+
+    def encode(self, field, value):
+        """The id of ``value``; 0 (which matches nothing) if there is none."""
+        key = (field, value)
+        if key not in self.ids:
+            self._maybe_reload()
+        return self.ids.get(key, 0)
+
+    def decode(self, id):
+        """The value for an id, or None."""
+        if id >= len(self.values) or self.values[id] is None:
+            self._maybe_reload()
+        try:
+            return self.values[id]
+        except IndexError:
+            return None
+
+attributes = AttributeDictionary()
+
+
+DELTA_PENDING = settings.CACHE_PREFIX + 'search:delta:pending'
+
+
+def schedule_delta():
+    """
+    Rebuild the delta index SPHINX_DELTA_DELAY seconds from now, unless a
+    rebuild is already scheduled: any number of saves within that window
+    lead to a single indexer run.
+    """
+    if settings.SPHINX_DELTA_DELAY is None:
+        return
+    if cache.add(DELTA_PENDING, 1, settings.SPHINX_DELTA_DELAY + 60):
+        from search import tasks
+        tasks.index_delta.apply_async(countdown=settings.SPHINX_DELTA_DELAY)
+
+
+def opinion_changed(sender, instance, created=False, **kw):
+    # New opinions are beyond the main index anyway.
+    if not created:
+        DirtyOpinion.objects.mark(instance.id)
+    schedule_delta()
+
+
+def opinions_added(sender, opinions, **kw):
+    schedule_delta()
+
+signals.post_save.connect(opinion_changed, sender=Opinion,
+                          dispatch_uid='search_opinion_changed')
+opinions_created.connect(opinions_added, sender=Opinion,
+                         dispatch_uid='search_opinion_changed')
+signals.post_delete.connect(opinion_changed, sender=Opinion,
+                            dispatch_uid='search_opinion_changed')
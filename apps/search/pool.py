@@ -0,0 +1,178 @@
+"""
+Per-process pool of persistent searchd connections.
+
+``sphinxapi`` supports persistent connections: ``SphinxClient.Open()`` sends
+``SEARCHD_COMMAND_PERSIST`` and keeps the socket on the client until
+``Close()`` is called.  Instead of opening (and tearing down) a new TCP
+connection for every ``RunQueries()``, we keep a few of those sockets around
+per searchd and hand them to short-lived ``SphinxClient`` objects.
+"""
+import os
+import select
+import socket
+import threading
+import time
+
+from django.conf import settings
+
+import commonware.log
+
+import sphinxapi as sphinx
+
+log = commonware.log.getLogger('i.sphinx')
+
+
+def _is_alive(sock):
+    """
+    A pooled socket is healthy if it is writable and has nothing to read.
+    searchd never talks first, so a readable socket means it was closed (or
+    left with garbage from an aborted request).
+    """
+    try:
+        readable, writable, _ = select.select([sock], [sock], [], 0)
+    except (select.error, socket.error, ValueError):
+        return False
+    return not readable and bool(writable)
+
+
+def _close(sock):
+    try:
+        sock.close()
+    except socket.error:
+        pass
+
+
+class ConnectionPool(object):
+    """A bounded LIFO pool of persistent connections to one searchd."""
+
+    def __init__(self, host, port, size=None, max_idle=None):
+        self.host = host
+        self.port = port
+        self.size = size if size is not None else settings.SPHINX_POOL_SIZE
+        self.max_idle = (max_idle if max_idle is not None else
+                         settings.SPHINX_POOL_MAX_IDLE)
+        self.pid = os.getpid()
+        self._idle = []  # [(socket, last used), ...]
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """Open a new persistent connection, or return None."""
+        sc = sphinx.SphinxClient()
+        sc.SetServer(self.host, self.port)
+        sc.Open()
+        if sc.GetLastError():
+            log.warning('Could not open persistent connection to %s:%s: %s' %
+                        (self.host, self.port, sc.GetLastError()))
+            return None
+        return sc._socket
+
+    def get(self):
+        """Borrow a healthy connection, opening a new one if needed."""
+        self._check_pid()
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                sock, last_used = self._idle.pop()
+                if now - last_used > self.max_idle or not self.alive(sock):
+                    self.close(sock)
+                    continue
+                return sock
+        return self.connect()
+
+    def put(self, sock):
+        """Return a connection to the pool, closing it if the pool is full."""
+        if sock is None:
+            return
+        self._check_pid()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((sock, time.time()))
+                return
+        self.close(sock)
+
+    def discard(self, sock):
+        """Drop a connection that failed mid-request."""
+        if sock is not None:
+            self.close(sock)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock, _ in idle:
+            self.close(sock)
+
+    def alive(self, sock):
+        return _is_alive(sock)
+
+    def close(self, sock):
+        _close(sock)
+
+    def _check_pid(self):
+        """Sockets inherited through fork() must not be shared: start over."""
+        if self.pid != os.getpid():
+            with self._lock:
+                self._idle = []
+                self.pid = os.getpid()
+
+    def __len__(self):
+        return len(self._idle)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, port, cls=ConnectionPool):
+    """Return the process-wide pool of ``cls`` connections to host:port."""
+    key = (cls, host, port)
+    if key not in _pools:
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = cls(host, port)
+    return _pools[key]
+
+
+def run_queries(sc):
+    """
+    Run the queries batched up on ``sc`` over a pooled persistent connection.
+
+    If the borrowed connection turns out to be broken, it is thrown away and
+    the batch is retried once on a fresh one.  Without pooling
+    (``SPHINX_POOL_SIZE = 0``) this is a plain ``sc.RunQueries()``.
+    """
+    if not settings.SPHINX_POOL_SIZE:
+        return sc.RunQueries()
+
+    pool = get_pool(sc._host, sc._port)
+    # RunQueries() resets the request list, keep it around for a retry.
+    reqs = list(sc._reqs)
+
+    for attempt in (1, 2):
+        sc._socket = pool.get()
+        borrowed = sc._socket
+        try:
+            results = sc.RunQueries()
+        except:
+            pool.discard(borrowed)
+            raise
+        finally:
+            # sphinxapi drops sockets it finds dead and falls back to a
+            # one-off connection; only reuse the socket if it is still ours.
+            if sc._socket is not borrowed:
+                borrowed = None
+            sc._socket = None
+
+        if results is None and borrowed is not None and attempt == 1:
+            # Stale connection: sphinxapi already gave up on it.
+            pool.discard(borrowed)
+            log.info('Reconnecting to searchd at %s:%s: %s' %
+                     (pool.host, pool.port, sc.GetLastError()))
+            sc._reqs = list(reqs)
+            sc._error = ''
+            continue
+
+        if results is None:
+            pool.discard(borrowed)
+        else:
+            pool.put(borrowed)
+        return results
@@ -0,0 +1,131 @@
+"""
+Streaming full reindex of opinions into ElasticSearch.
+
+The opinions table is walked in id order (``WHERE id > last ORDER BY id``, so
+every batch is an index range scan however deep we are) and only the raw
+column values are fetched.  Batches go to a pool of worker processes, which
+turn them into documents and send them to ElasticSearch as bulk requests.
+
+Progress is checkpointed to a file after every batch that (with all batches
+before it) made it into the index.  A reindex that dies resumes from there
+when run again; a finished one removes the checkpoint.
+"""
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+
+from django.conf import settings
+from django.db import connection
+
+import commonware.log
+from elasticutils import get_es
+
+log = commonware.log.getLogger('i.elastic')
+
+
+def fields():
+    from feedback.models import Opinion
+    return [f.attname for f in Opinion._meta.fields]
+
+
+def batches(types=None, start=0, size=1000):
+    """Yield lists of opinion values, ``size`` at a time, from id ``start``."""
+    from feedback.models import Opinion
+    qs = Opinion.objects.no_cache().order_by('id')
+    if types:
+        qs = qs.filter(_type__in=types)
+    names = fields()
+    while True:
+        rows = list(qs.filter(id__gt=start).values(*names)[:size])
+        if not rows:
+            return
+        yield rows
+        start = rows[-1]['id']
+
+
+def index_batch(rows, index):
+    """Index one batch of opinion values.  Runs in the worker processes."""
+    from feedback.models import opinion_document
+    es = get_es()
+    for row in rows:
+        es.index(opinion_document(row), index, 'opinion', row['id'],
+                 bulk=True)
+    es.force_bulk()
+    return rows[-1]['id'], len(rows)
+
+
+class Checkpoint(object):
+    """The last opinion id indexed into ``index``, kept in ``path``."""
+
+    def __init__(self, path, index):
+        self.path, self.index = path, index
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return 0
+        if data.get('index') != self.index:
+            # Left over from a reindex into another index.
+            return 0
+        return data['last_id']
+
+    def save(self, last_id):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'index': self.index, 'last_id': last_id}, f)
+        os.rename(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def reindex(index=None, types=None, processes=4, size=1000,
+            checkpoint=None, out=None):
+    """
+    Index all opinions (of ``types``, if given) into ``index``.  Returns the
+    number of documents sent.  ``out`` (a file) gets progress reports.
+    """
+    index = index or settings.ES_INDEX
+    checkpoint = Checkpoint(checkpoint or settings.SEARCH_REINDEX_CHECKPOINT,
+                            index)
+    start = checkpoint.load()
+    if start:
+        log.info('Resuming reindex of %s after opinion %d.' % (index, start))
+
+    report = lambda msg: out and out.write(msg + '\n')
+
+    # Don't share the database connection with the workers.
+    connection.close()
+    pool = Pool(processes)
+    # Bound the batches in flight, so we don't read the table into memory.
+    pending = deque()
+    done, began = 0, time.time()
+
+    def wait():
+        last_id, count = pending.popleft().get()
+        checkpoint.save(last_id)
+        return count
+
+    try:
+        for rows in batches(types, start, size):
+            pending.append(pool.apply_async(index_batch, (rows, index)))
+            if len(pending) > processes * 2:
+                done += wait()
+                report('%d documents, %.0f docs/sec' %
+                       (done, done / (time.time() - began)))
+        while pending:
+            done += wait()
+    finally:
+        pool.close()
+        pool.join()
+
+    checkpoint.clear()
+    elapsed = time.time() - began
+    report('Indexed %d documents in %.1fs (%.0f docs/sec).' %
+           (done, elapsed, done / elapsed if elapsed else 0))
+    return done
@@ -0,0 +1,179 @@
+"""
+Scatter-gather over a sharded Sphinx index.
+
+With ``settings.SPHINX_SHARDS`` set, the opinions index is split over several
+searchd processes (see ``configs/sphinx/sphinx.conf``).  ``ShardedClient``
+looks like a ``sphinxapi.SphinxClient`` to ``search.client.Client``: every
+call is repeated on one client per shard, the batched queries run on all
+shards concurrently and the per-shard results are merged back into what a
+single searchd would have returned.
+"""
+import threading
+from operator import itemgetter
+
+import sphinxapi as sphinx
+
+from search import pool
+
+
+def _sort_key(clause):
+    """Turn an extended sort clause into [(getter, descending), ...]."""
+    keys = []
+    for part in clause.split(','):
+        bits = part.split()
+        if not bits:
+            continue
+        attr = bits[0]
+        desc = len(bits) > 1 and bits[1].upper() == 'DESC'
+        if attr == '@id':
+            getter = itemgetter('id')
+        elif attr == '@weight':
+            getter = itemgetter('weight')
+        else:
+            getter = (lambda a: lambda m: m['attrs'].get(a, 0))(attr)
+        keys.append((getter, desc))
+    return keys
+
+
+def sort_matches(matches, clause):
+    """Sort matches like searchd would for an extended sort ``clause``."""
+    matches = list(matches)
+    # Stable sorts, least significant key first.
+    for getter, desc in reversed(_sort_key(clause)):
+        matches.sort(key=getter, reverse=desc)
+    return matches
+
+
+def merge_results(results, offset, limit, sort, groupby=None):
+    """Merge the results of one query from all shards."""
+    merged = dict(results[0])
+    merged['error'] = ''.join(r.get('error') or '' for r in results)
+    merged['warning'] = ''.join(r.get('warning') or '' for r in results)
+    merged['time'] = max(float(r.get('time', 0)) for r in results)
+
+    words = {}
+    for r in results:
+        for w in r.get('words', []):
+            if w['word'] in words:
+                words[w['word']]['docs'] += w['docs']
+                words[w['word']]['hits'] += w['hits']
+            else:
+                words[w['word']] = dict(w)
+    merged['words'] = words.values()
+
+    if groupby:
+        # Group-by queries: add up the per-group counts. Only additive
+        # aggregates (COUNT, SUM) survive this.
+        groups = {}
+        for r in results:
+            for m in r.get('matches', []):
+                key = m['attrs'][groupby]
+                if key not in groups:
+                    groups[key] = dict(m, attrs=dict(m['attrs']))
+                    continue
+                attrs = groups[key]['attrs']
+                for attr in ('count', '@count'):
+                    if attr in attrs:
+                        attrs[attr] += m['attrs'][attr]
+        matches = sort_matches(groups.values(), sort or '@count DESC')
+        merged['total_found'] = len(matches)
+    else:
+        matches = sort_matches(
+            (m for r in results for m in r.get('matches', [])), sort)
+        merged['total_found'] = sum(r.get('total_found', 0) for r in results)
+
+    merged['total'] = min(len(matches), sum(r.get('total', 0)
+                                            for r in results))
+    merged['matches'] = matches[offset:offset + limit]
+    return merged
+
+
+class ShardedClient(object):
+    """A SphinxClient lookalike querying all shards at once."""
+
+    def __init__(self, servers):
+        self.shards = []
+        for host, port in servers:
+            sc = sphinx.SphinxClient()
+            sc.SetServer(host, port)
+            self.shards.append(sc)
+
+        self._offset, self._limit = 0, 20
+        self._sort = '@id ASC'
+        self._groupby = None
+        self._groupsort = None
+        self._reqs = []
+        self._error = ''
+
+    def __getattr__(self, name):
+        """Anything we don't need to track is simply done on every shard."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def broadcast(*args, **kwargs):
+            return [getattr(sc, name)(*args, **kwargs) for sc in self.shards]
+        return broadcast
+
+    def SetLimits(self, offset, limit, maxmatches=0, cutoff=0):
+        # Every shard may hold the whole page; we cut it down when merging.
+        self._offset, self._limit = offset, limit
+        for sc in self.shards:
+            sc.SetLimits(0, offset + limit, maxmatches, cutoff)
+
+    def SetSortMode(self, mode, clause=''):
+        self._sort = clause
+        for sc in self.shards:
+            sc.SetSortMode(mode, clause)
+
+    def SetGroupBy(self, attribute, func, groupsort='@group desc'):
+        self._groupby, self._groupsort = attribute, groupsort
+        for sc in self.shards:
+            sc.SetGroupBy(attribute, func, groupsort)
+
+    def ResetGroupBy(self):
+        self._groupby = self._groupsort = None
+        for sc in self.shards:
+            sc.ResetGroupBy()
+
+    def AddQuery(self, query, index='*', comment=''):
+        self._reqs.append(dict(offset=self._offset, limit=self._limit,
+                               sort=self._groupsort or self._sort,
+                               groupby=self._groupby))
+        for sc in self.shards:
+            sc.AddQuery(query, index, comment)
+        return len(self._reqs) - 1
+
+    def GetLastError(self):
+        return self._error
+
+    def RunQueries(self):
+        """Run the batch on all shards in parallel and merge the results."""
+        reqs, self._reqs = self._reqs, []
+        self._error = ''
+        results = [None] * len(self.shards)
+        errors = []
+
+        def run(i, sc):
+            try:
+                results[i] = pool.run_queries(sc)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i, sc))
+                   for i, sc in enumerate(self.shards)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+
+        for sc, result in zip(self.shards, results):
+            if result is None:
+                self._error = '%s:%s: %s' % (sc._host, sc._port,
+                                             sc.GetLastError())
+                return None
+
+        return [merge_results([r[i] for r in results], **req)
+                for i, req in enumerate(reqs)]
@@ -0,0 +1,209 @@
+"""
+SphinxQL transport for ``search.client.Client``.
+
+searchd also speaks the MySQL protocol (the ``mysql41`` listener in
+``configs/sphinx/sphinx.conf``).  ``SphinxQLClient`` looks like a
+``sphinxapi.SphinxClient`` to ``Client`` -- it takes the same filter, sort and
+group-by calls -- but sends the whole batch of queries (the primary query and
+all meta queries) as one multi-statement SphinxQL request, each query followed
+by ``SHOW META`` for its totals.  Connections are kept in a ``search.pool``
+pool.  Select it with ``SPHINX_TRANSPORT = 'sphinxql'``.
+"""
+import re
+
+import commonware.log
+import MySQLdb
+from MySQLdb.constants import CLIENT
+
+from search import pool
+
+log = commonware.log.getLogger('i.sphinx')
+
+CONNECT_TIMEOUT = 1  # seconds, like sphinxapi's default.
+
+# Characters with a meaning in the extended query syntax.  SphinxQL always
+# uses the extended syntax; escaping them matches the binary API's default
+# SPH_MATCH_ALL mode.
+_special = re.compile(r'([=\(\)|\-!@~"&/\\\^\$])')
+
+
+# sphinxapi's name for the document id; SphinxQL calls it ``id``.
+_at_id = re.compile(r'@id\b')
+
+
+def escape_query(term):
+    if isinstance(term, unicode):
+        term = term.encode('utf-8')
+    return _special.sub(r'\\\1', term)
+
+
+class SphinxQLPool(pool.ConnectionPool):
+    """A pool of MySQL protocol connections to searchd."""
+
+    def connect(self):
+        try:
+            return MySQLdb.connect(host=self.host, port=self.port,
+                                   connect_timeout=CONNECT_TIMEOUT,
+                                   client_flag=CLIENT.MULTI_STATEMENTS)
+        except MySQLdb.Error, e:
+            log.warning('Could not connect to searchd at %s:%s: %s' %
+                        (self.host, self.port, e))
+            return None
+
+    def alive(self, conn):
+        try:
+            conn.ping()
+        except MySQLdb.Error:
+            return False
+        return True
+
+    def close(self, conn):
+        try:
+            conn.close()
+        except MySQLdb.Error:
+            pass
+
+
+def _value(v):
+    """searchd sends some attribute values as strings."""
+    if isinstance(v, basestring) and v.isdigit():
+        return int(v)
+    return v
+
+
+class SphinxQLClient(object):
+    """
+    The subset of the ``sphinxapi.SphinxClient`` interface ``Client`` uses,
+    spoken over SphinxQL.
+    """
+
+    def __init__(self, host, port):
+        self._host, self._port = host, port
+        self._select = '*'
+        self._offset, self._limit, self._maxmatches = 0, 20, 0
+        self._sort = None
+        self._groupby = self._groupsort = None
+        self._filters = []
+        self._reqs = []
+        self._error = ''
+
+    def SetServer(self, host, port):
+        self._host, self._port = host, port
+
+    def SetSelect(self, select):
+        self._select = select
+
+    def SetLimits(self, offset, limit, maxmatches=0, cutoff=0):
+        self._offset, self._limit = offset, limit
+        self._maxmatches = maxmatches
+
+    def SetSortMode(self, mode, clause=''):
+        self._sort = clause
+
+    def SetFilter(self, attribute, values, exclude=0):
+        values = ', '.join(str(int(v)) for v in values)
+        self._filters.append('%s %sIN (%s)' % (
+            attribute, 'NOT ' if exclude else '', values))
+
+    def SetFilterRange(self, attribute, min_, max_):
+        self._filters.append('%s BETWEEN %d AND %d' % (attribute, min_, max_))
+
+    def ResetFilters(self):
+        self._filters = []
+
+    def SetGroupBy(self, attribute, func, groupsort='@group desc'):
+        self._groupby, self._groupsort = attribute, groupsort
+
+    def ResetGroupBy(self):
+        self._groupby = self._groupsort = None
+
+    def GetLastError(self):
+        return self._error
+
+    def AddQuery(self, query, index='*', comment=''):
+        """Build the SELECT statement for the current settings."""
+        where = list(self._filters)
+        if query:
+            where.insert(0, "MATCH('%s')" %
+                         MySQLdb.escape_string(escape_query(query)))
+
+        sql = 'SELECT %s FROM %s' % (_at_id.sub('id', self._select), index)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if self._groupby:
+            sql += ' GROUP BY %s' % self._groupby
+        order = self._groupsort or self._sort
+        if order:
+            sql += ' ORDER BY %s' % _at_id.sub('id', order)
+        sql += ' LIMIT %d, %d' % (self._offset, self._limit)
+        if self._maxmatches:
+            sql += ' OPTION max_matches=%d' % self._maxmatches
+
+        self._reqs.append(sql)
+        return len(self._reqs) - 1
+
+    def RunQueries(self):
+        """
+        Run all queries in one round trip over a pooled connection.  Returns
+        a list of results in sphinxapi's format, or None on error.
+        """
+        reqs, self._reqs = self._reqs, []
+        self._error = ''
+        if not reqs:
+            self._error = 'no queries defined, issue AddQuery() first'
+            return None
+
+        batch = ''.join('%s; SHOW META; ' % sql for sql in reqs)
+        p = pool.get_pool(self._host, self._port, SphinxQLPool)
+
+        for attempt in (1, 2):
+            conn = p.get()
+            if conn is None:
+                self._error = 'connection to %s:%s failed' % (self._host,
+                                                              self._port)
+                return None
+            try:
+                results = self._execute(conn, batch, len(reqs))
+            except MySQLdb.OperationalError, e:
+                # Stale pooled connection (or searchd went away): retry once.
+                p.discard(conn)
+                if attempt == 1:
+                    log.info('Reconnecting to searchd at %s:%s: %s' %
+                             (self._host, self._port, e))
+                    continue
+                self._error = str(e)
+                return None
+            except MySQLdb.Error, e:
+                p.discard(conn)
+                self._error = str(e)
+                return None
+            p.put(conn)
+            return results
+
+    def _execute(self, conn, batch, count):
+        cursor = conn.cursor()
+        try:
+            cursor.execute(batch)
+            results = []
+            for i in xrange(count):
+                fields = [d[0] for d in cursor.description]
+                rows = cursor.fetchall()
+                cursor.nextset()
+                meta = dict(cursor.fetchall())
+                cursor.nextset()
+                results.append(self._result(fields, rows, meta))
+            return results
+        finally:
+            cursor.close()
+
+    def _result(self, fields, rows, meta):
+        matches = []
+        for row in rows:
+            attrs = dict((f, _value(v)) for f, v in zip(fields, row))
+            matches.append(dict(id=attrs.pop('id'),
+                                weight=attrs.pop('weight', 1), attrs=attrs))
+        return dict(matches=matches, error='', warning='', status=0,
+                    fields=[], attrs=fields, words=[],
+                    total=int(meta.get('total', 0)),
+                    total_found=int(meta.get('total_found', 0)),
+                    time=meta.get('time', '0'))
@@ -1,7 +1,11 @@
+from django.core.cache import cache
+
 from celeryutils import task
 
 from feedback.models import Opinion
 from elasticutils import get_es, es_required
+from search import indexqueue, utils
+from search.client import invalidate_facets
 
 
 @task
@@ -10,3 +14,28 @@ def add_to_index(pks, es, **kw):
     for opinion in Opinion.objects.filter(pk__in=pks):
         opinion.update_index(bulk=True)
     es.force_bulk()
+
+
+@task
+@es_required
+def flush_index_queue(es, **kw):
+    """Send queued index updates to ElasticSearch (see search.indexqueue)."""
+    indexqueue.flush(es)
+
+
+@task
+def index_delta(**kw):
+    """Rebuild the delta Sphinx index (see search.models.schedule_delta)."""
+    from search.models import DELTA_PENDING
+    # Saves from now on need another run.
+    cache.delete(DELTA_PENDING)
+    if utils.index_delta():
+        # Cached facets don't count what was just indexed.
+        invalidate_facets()
+
+
+@task
+def merge_delta(**kw):
+    """Merge the delta Sphinx index into the main one."""
+    if utils.merge_delta():
+        invalidate_facets()
@@ -1,12 +1,21 @@
 import datetime
+import json
 import socket
 
+from django.conf import settings
+from django.core.cache import cache
+
 from mock import patch
 from nose.tools import eq_
+import test_utils
 
 import input
 from feedback.models import Opinion
-from search.client import Client, SearchError, extract_filters
+from search.client import (Client, ResultSet, SearchError, extract_filters,
+                           facet_cache_key, hydrate, invalidate_facets,
+                           encode_cursor, decode_cursor, result_cache_key,
+                           COUNT_ONLY, CURSOR_NEXT, FACETS_ONLY, IDS_ONLY)
+from search.models import Attribute, attributes
 from search.tests import SphinxTestCase
 
 query = lambda x='', **kwargs: Client().query(x, **kwargs)
@@ -24,6 +33,42 @@ class SearchTest(SphinxTestCase):
         dates = [o.created for o in r]
         eq_(dates, sorted(dates, reverse=True), "These aren't revchron.")
 
+    @patch('search.client.hydrate')
+    def test_modes(self, hydrate):
+        """Aggregate-only queries never hydrate opinions."""
+        total = len(query())
+        hydrate.reset_mock()
+
+        eq_(query(mode=COUNT_ONLY), total)
+
+        ids = query(limit=5, mode=IDS_ONLY)
+        eq_(len(list(ids)), 5)
+        assert all(isinstance(id, (int, long)) for id in ids)
+
+        c = Client()
+        meta = c.query('', meta=('type',), mode=FACETS_ONLY)
+        eq_(sum(t['count'] for t in meta['type']), total)
+        assert 'primary' not in c.queries
+
+        assert not hydrate.called
+
+    def test_timings(self):
+        c = Client()
+        c.query('', meta=('type',))
+        for step in ('search.query', 'search.sphinx.run_queries',
+                     'search.sphinx.query.primary', 'search.sphinx.query.type',
+                     'search.metas', 'search.result_set', 'search.hydrate'):
+            assert step in c.timings, step
+
+    @patch.object(settings, 'SEARCH_SLOW_QUERY_MS', 0)
+    @patch('search.client.slow_log')
+    def test_slow_query_log(self, slow_log):
+        query('Firefox', product=1)
+        assert slow_log.warning.called
+        logged = json.loads(slow_log.warning.call_args[0][0])
+        eq_(logged['term'], 'Firefox')
+        eq_(logged['filters']['product'], 1)
+
     @patch('search.client.sphinx.SphinxClient.RunQueries')
     def test_errors(self, sphinx):
         for error in (socket.timeout(), Exception(),):
@@ -95,11 +140,144 @@ class SearchTest(SphinxTestCase):
         rs = query(date_start=start)
         assert isinstance(rs[0], Opinion)
 
+    def test_cursor(self):
+        """Cursors page through results without overlap, past the limit."""
+        start = datetime.datetime(2010, 5, 27)
+        first = query(date_start=start, limit=10)
+        second = query(date_start=start, limit=10,
+                       cursor=first.next_cursor)
+        eq_([o.id for o in second],
+            [o.id for o in query(date_start=start, limit=10, offset=10)])
+
+        back = query(date_start=start, limit=10, cursor=second.prev_cursor)
+        eq_([o.id for o in back], [o.id for o in first])
+        eq_(back.prev_cursor, None)
+
+    def test_cursor_count(self):
+        """Past a cursor, the count still covers the whole query."""
+        start = datetime.datetime(2010, 5, 27)
+        first = query(date_start=start, limit=5)
+        second = query(date_start=start, limit=5, cursor=first.next_cursor)
+        assert len(second) < len(first)
+        eq_(second.count, first.count)
+        eq_(first.count, len(first))
+
+    def test_deep_cursor(self):
+        """Cursors page on past SEARCH_MAX_PAGES (i.e. result 1000)."""
+        start = datetime.datetime(2010, 5, 27)
+        with patch.object(settings, 'SEARCH_MAX_PAGES', 2):
+            rs = query(date_start=start, limit=2)
+            for depth in xrange(4):
+                assert rs.next_cursor, depth
+                rs = query(date_start=start, limit=2, cursor=rs.next_cursor)
+        assert rs.prev_cursor
+
     def test_url_search(self):
         start = datetime.datetime(2010, 5, 27)
         eq_(num_results('url:*', date_start=start), 7)
 
 
+class HydrateTest(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_order_and_stats(self):
+        ids = list(Opinion.objects.values_list('id', flat=True)[:5])
+        ids.reverse()
+
+        opinions, stats = hydrate(ids)
+        eq_([o.id for o in opinions], ids)
+        eq_(stats, dict(hits=0, misses=5))
+
+        opinions, stats = hydrate(ids[:3] + [ids[4]])
+        eq_([o.id for o in opinions], ids[:3] + [ids[4]])
+        eq_(stats, dict(hits=4, misses=0))
+
+    def test_missing_and_invalidated(self):
+        ids = list(Opinion.objects.values_list('id', flat=True)[:2])
+        hydrate(ids)
+        Opinion.objects.get(pk=ids[0]).delete()
+
+        opinions, stats = hydrate(ids + [999999])
+        eq_([o.id for o in opinions], ids[1:])
+        eq_(stats, dict(hits=1, misses=2))
+
+
+class CachedQueryTest(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    def setUp(self):
+        cache.clear()
+        self.old_setting = settings.SEARCH_RESULT_CACHE
+        settings.SEARCH_RESULT_CACHE = True
+        self.ids = list(Opinion.objects.values_list('id', flat=True)[:3])
+
+    def tearDown(self):
+        settings.SEARCH_RESULT_CACHE = self.old_setting
+
+    def fake_query(self, term, limit=20, offset=0, **kwargs):
+        opinions = list(Opinion.objects.filter(pk__in=self.ids))
+        return ResultSet(opinions, len(opinions), offset)
+
+    @patch('search.client.Client.query')
+    def test_fresh(self, query):
+        query.side_effect = self.fake_query
+        r = Client().cached_query('foo')
+        eq_(sorted(o.id for o in Client().cached_query('foo')),
+            sorted(o.id for o in r))
+        eq_(query.call_count, 1)
+
+    @patch('search.client.Client.query')
+    @patch('search.client.time.time')
+    def test_stale_while_locked(self, time, query):
+        """Only the lock holder refreshes; everybody else gets stale data."""
+        query.side_effect = self.fake_query
+        time.return_value = 1000
+        Client().cached_query('foo')
+
+        time.return_value = 1000 + settings.SEARCH_RESULT_CACHE_TIMEOUT + 1
+        key = result_cache_key('foo', 20, 0, {})
+        cache.add(key + ':lock', 1)
+        eq_(len(Client().cached_query('foo')), 3)
+        eq_(query.call_count, 1)
+
+    @patch('search.client.Client.query')
+    def test_expired_lock_is_kept(self, query):
+        """A refresh that outlived its lock leaves the next holder's alone."""
+        lock = result_cache_key('foo', 20, 0, {}) + ':lock'
+
+        def slow_query(*args, **kwargs):
+            # Our lock timed out and another worker took it.
+            cache.set(lock, 'theirs')
+            return self.fake_query(*args, **kwargs)
+        query.side_effect = slow_query
+        Client().cached_query('foo')
+        eq_(cache.get(lock), 'theirs')
+
+        cache.delete(lock)
+        query.side_effect = self.fake_query
+        cache.delete(result_cache_key('foo', 20, 0, {}))
+        Client().cached_query('foo')
+        eq_(cache.get(lock), None)
+
+    @patch('search.client.Client.query')
+    @patch('search.client.time.time')
+    def test_stale_on_error(self, time, query):
+        query.side_effect = self.fake_query
+        time.return_value = 1000
+        Client().cached_query('foo')
+
+        query.side_effect = SearchError('Query has timed out.')
+        time.return_value = 1000 + settings.SEARCH_RESULT_CACHE_TIMEOUT + 1
+        eq_(len(Client().cached_query('foo')), 3)
+
+        # ... but not forever.
+        time.return_value += settings.SEARCH_RESULT_CACHE_GRACE
+        self.assertRaises(SearchError, Client().cached_query, 'foo')
+
+
 def test_date_filter_timezone():
     """Ensure date filters are applied in app time (= PST), not UTC."""
     dates = dict(date_start=datetime.date(2010, 1, 1),
@@ -110,9 +288,40 @@ def test_date_filter_timezone():
     eq_(ranges['created'][1], 1265011200)
 
 
-def test_extract_filters_unknown():
-    """
-    Test that we return the proper value of unknown that sphinx is expecting.
-    """
-    _, _, metas = extract_filters(dict(platform='unknown'))
-    eq_(metas['platform'], 0)
+class ExtractFiltersTest(test_utils.TestCase):
+    def test_unknown(self):
+        """
+        Test that we return the proper value of unknown that sphinx is
+        expecting.
+        """
+        empty = Attribute.objects.create(field='platform', value='')
+        attributes.load()
+        _, _, metas = extract_filters(dict(platform='unknown'))
+        eq_(metas['platform'], empty.id)
+
+    def test_missing_value(self):
+        """Values the index has never seen match nothing."""
+        attributes.load()
+        _, filters, _ = extract_filters(dict(version='99.0'))
+        eq_(filters['version'], 0)
+
+
+def test_facet_cache_key():
+    """Facet keys are independent of ordering and change on rotation."""
+    filters, ranges, metas = extract_filters(dict(platform='mac', type=1))
+    key = facet_cache_key('foo', filters, ranges, metas, ('type', 'locale'))
+    eq_(key, facet_cache_key('foo', dict(filters), dict(ranges),
+                             dict(metas), ('locale', 'type')))
+    assert key != facet_cache_key('bar', filters, ranges, metas,
+                                  ('type', 'locale'))
+
+    invalidate_facets()
+    assert key != facet_cache_key('foo', filters, ranges, metas,
+                                  ('type', 'locale'))
+
+
+def test_cursor_roundtrip():
+    cursor = encode_cursor(CURSOR_NEXT, 1262332800, 42, 200)
+    eq_(decode_cursor(cursor), (CURSOR_NEXT, 1262332800, 42, 200))
+    eq_(decode_cursor('garbage'), None)
+    eq_(decode_cursor(''), None)
@@ -55,10 +55,25 @@ class TestDashboard(SphinxTestCase):
 
         pag_link = doc('.pager a.newer')
         eq_(len(pag_link), 1)
-        assert pag_link.attr('href').endswith(
-            '?product=firefox&version=%s&page=2' % (
-                getattr(input.FIREFOX, 'default_version', None) or
-                input.LATEST_BETAS[input.FIREFOX]))
+        assert 'product=firefox&version=%s' % (
+            getattr(input.FIREFOX, 'default_version', None) or
+            input.LATEST_BETAS[input.FIREFOX]) in pag_link.attr('href')
+        assert 'cursor=' in pag_link.attr('href')
+
+    def test_cursor_pagination(self):
+        """Following the cursors walks through distinct pages."""
+        r = self.client.get(reverse('search'))
+        first = [o.id for o in r.context['opinions']]
+        count = r.context['opinion_count']
+        r = self.client.get(reverse('search'),
+                            {'cursor': r.context['next_cursor']})
+        second = [o.id for o in r.context['opinions']]
+        assert second and not set(first) & set(second)
+        eq_(r.context['opinion_count'], count)
+
+        r = self.client.get(reverse('search'),
+                            {'cursor': r.context['prev_cursor']})
+        eq_([o.id for o in r.context['opinions']], first)
 
 
 class TestMobileDashboard(SphinxTestCase):
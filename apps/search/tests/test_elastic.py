@@ -8,10 +8,19 @@ Specifically:
 """
 
 from elasticutils.tests import ESTestCase
+from django.conf import settings
+from django.core.cache import cache
+
 from elasticutils import S
+from mock import patch
 from nose.tools import eq_
+import test_utils
 
 from feedback.models import Opinion
+from input import OPINION_PRAISE, OPINION_ISSUE, OPINION_IDEA
+from search.client import SearchError, get_client
+from search import elastic
+from search.elastic import ElasticClient
 
 
 class TestElastic(ESTestCase):
@@ -28,3 +37,90 @@ class TestElastic(ESTestCase):
         a.delete()
         self.es.refresh()
         eq_(len(S('chocolate')), 0, 'We deleted this... WTF?')
+
+
+class TestElasticClient(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    @patch('search.elastic.get_es')
+    def test_query(self, get_es):
+        """Hits and facets come back in the same shape as from Sphinx."""
+        ids = list(Opinion.objects.values_list('id', flat=True)[:2])
+        get_es.return_value.search.return_value = {
+            'hits': {'total': 5, 'hits': [
+                {'_id': str(id), 'sort': [1286409600000, id]} for id in ids]},
+            'facets': {
+                'type': {'terms': [{'term': OPINION_PRAISE.id, 'count': 3},
+                                   {'term': OPINION_ISSUE.id, 'count': 2}]},
+                'platform': {'terms': [{'term': 'win7', 'count': 4},
+                                       {'term': 'beos', 'count': 1}]},
+                'day_sentiment_%s' % OPINION_PRAISE.id: {'entries': [
+                    {'time': 1286409600000, 'count': 3}]},
+                'day_sentiment_%s' % OPINION_ISSUE.id: {'entries': []},
+                'day_sentiment_%s' % OPINION_IDEA.id: {'entries': []},
+            }}
+
+        c = ElasticClient()
+        r = c.query('', limit=2,
+                    meta=('type', 'platform', 'day_sentiment'))
+        eq_([o.id for o in r], ids)
+        eq_(c.total_found, 5)
+        assert r.next_cursor
+        eq_(c.meta['type'], [{'type': OPINION_PRAISE.id, 'count': 3},
+                             {'type': OPINION_ISSUE.id, 'count': 2}])
+        eq_(c.meta['platform'], [{'platform': 'win7', 'count': 4},
+                                 {'platform': None, 'count': 1}])
+        eq_(c.meta['day_sentiment']['praise'], [(1286409600, 3)])
+
+    @patch('search.elastic.get_es')
+    def test_errors(self, get_es):
+        get_es.return_value.search.side_effect = Exception()
+        self.assertRaises(SearchError, ElasticClient().query, '')
+
+
+@patch('search.client.settings.SEARCH_BACKEND', 'search.elastic.ElasticClient')
+@patch('search.elastic.get_es')
+def test_get_client(get_es):
+    assert isinstance(get_client(), ElasticClient)
+
+
+class RebuildTest(test_utils.TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @patch('search.elastic.get_es')
+    def test_rebuild(self, get_es):
+        es = get_es.return_value
+        aliases = {settings.ES_INDEX: ['input-1']}
+        es.get_alias.side_effect = lambda alias: aliases.get(alias, [])
+
+        def change_aliases(actions):
+            for action, index, alias in actions:
+                if action == 'add':
+                    aliases.setdefault(alias, []).append(index)
+                else:
+                    aliases[alias].remove(index)
+        es.change_aliases.side_effect = change_aliases
+
+        eq_(elastic.write_indexes(), [settings.ES_INDEX])
+
+        index = elastic.start_rebuild(es)
+        assert index.startswith(settings.ES_INDEX + '-')
+        es.create_index.assert_called_with(index,
+                                           settings=elastic.BULK_SETTINGS)
+        # Updates go to both indexes while rebuilding, even if the cache
+        # forgot about it...
+        eq_(elastic.write_indexes(), [settings.ES_INDEX, index])
+        cache.clear()
+        eq_(elastic.write_indexes(), [settings.ES_INDEX, index])
+        # ... and a restarted rebuild continues with the same index.
+        eq_(elastic.start_rebuild(es), index)
+        eq_(es.create_index.call_count, 1)
+
+        elastic.finish_rebuild(index, es)
+        es.change_aliases.assert_called_with([
+            ('remove', 'input-1', settings.ES_INDEX),
+            ('add', index, settings.ES_INDEX),
+            ('remove', index, elastic.REBUILD_ALIAS())])
+        es.delete_index.assert_called_with('input-1')
+        eq_(elastic.write_indexes(), [settings.ES_INDEX])
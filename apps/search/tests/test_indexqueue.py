@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from mock import Mock, patch
+from nose.tools import eq_
+import test_utils
+
+from feedback.models import Opinion
+from search import indexqueue
+from search.indexqueue import DELETE, INDEX
+
+
+@patch.object(settings, 'ES_DISABLED', False)
+@patch('search.tasks.flush_index_queue')
+class IndexQueueTest(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_saves_and_deletes_are_queued(self, flush_task):
+        o = Opinion.objects.create(product=1, description='Queued.')
+        o.delete()
+        eq_(flush_task.apply_async.call_count, 1)
+        updates = indexqueue.queue.pending()[0]
+        eq_(updates[o.id][0], DELETE)
+
+    @patch.object(Opinion, 'update_index')
+    @patch.object(Opinion, 'remove_from_index')
+    def test_flush(self, remove, update, flush_task):
+        ids = list(Opinion.objects.values_list('id', flat=True)[:2])
+        indexqueue.enqueue(INDEX, ids[0])
+        indexqueue.enqueue(INDEX, ids[0])
+        indexqueue.enqueue(DELETE, ids[1])
+
+        es = Mock()
+        eq_(indexqueue.flush(es), 2)
+        eq_(update.call_count, 1)
+        eq_(remove.call_count, 1)
+        eq_(es.force_bulk.call_count, 1)
@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from mock import patch
+from nose.tools import eq_
+import test_utils
+
+from feedback.models import Opinion
+from search import tasks
+from search.models import (Attribute, AttributeDictionary, DirtyOpinion,
+                           schedule_delta)
+
+
+class DirtyOpinionTest(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    def setUp(self):
+        DirtyOpinion.objects.all().delete()
+
+    def test_changes_are_marked(self):
+        o = Opinion.objects.create(product=1, description='Fresh.')
+        eq_(DirtyOpinion.objects.count(), 0)
+
+        o.description = 'Not so fresh.'
+        o.save()
+        eq_(list(DirtyOpinion.objects.values_list('opinion_id', flat=True)),
+            [o.id])
+
+        # Marking again just bumps the timestamp.
+        o.delete()
+        eq_(DirtyOpinion.objects.count(), 1)
+
+
+@patch.object(settings, 'SPHINX_DELTA_DELAY', 10)
+@patch('search.tasks.index_delta')
+def test_schedule_delta_is_debounced(index_delta):
+    cache.clear()
+    for i in xrange(3):
+        schedule_delta()
+    eq_(index_delta.apply_async.call_count, 1)
+    index_delta.apply_async.assert_called_with(countdown=10)
+
+
+@patch('search.tasks.invalidate_facets')
+@patch('search.utils.indexer')
+def test_delta_invalidates_facets(indexer, invalidate_facets):
+    """Facets are only invalidated once the delta index was rotated in."""
+    for task in (tasks.index_delta, tasks.merge_delta):
+        indexer.return_value = False
+        task()
+        eq_(invalidate_facets.call_count, 0)
+
+        indexer.return_value = True
+        with patch('search.utils.connection'):
+            task()
+        eq_(invalidate_facets.call_count, 1)
+        invalidate_facets.reset_mock()
+
+
+class AttributeDictionaryTest(test_utils.TestCase):
+    def test_encode_decode(self):
+        a = Attribute.objects.create(field='device', value='Nexus One')
+        d = AttributeDictionary()
+        eq_(d.encode('device', 'Nexus One'), a.id)
+        eq_(d.decode(a.id), 'Nexus One')
+        # Same value, different field.
+        eq_(d.encode('manufacturer', 'Nexus One'), 0)
+
+    def test_reload_is_throttled(self):
+        d = AttributeDictionary(reload_interval=60)
+        d.load()
+        a = Attribute.objects.create(field='device', value='Epic')
+        eq_(d.decode(a.id), None)
+
+        d.loaded = 0
+        eq_(d.decode(a.id), 'Epic')
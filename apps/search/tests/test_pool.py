@@ -0,0 +1,78 @@
+from mock import Mock, patch
+from nose.tools import eq_
+
+from search import pool
+
+
+def fake_socket():
+    return Mock(name='socket')
+
+
+class TestConnectionPool(object):
+    def setUp(self):
+        self.pool = pool.ConnectionPool('127.0.0.1', 1, size=2, max_idle=60)
+
+    @patch('search.pool._is_alive', lambda s: True)
+    def test_reuse(self):
+        """Returned connections are handed out again."""
+        sock = fake_socket()
+        self.pool.put(sock)
+        eq_(len(self.pool), 1)
+        eq_(self.pool.get(), sock)
+        eq_(len(self.pool), 0)
+
+    def test_bounded(self):
+        """Connections beyond the pool size are closed."""
+        socks = [fake_socket() for i in xrange(3)]
+        for sock in socks:
+            self.pool.put(sock)
+        eq_(len(self.pool), 2)
+        assert socks[2].close.called
+
+    @patch('search.pool._is_alive', lambda s: False)
+    @patch('search.pool.ConnectionPool.connect')
+    def test_dead_connections_evicted(self, connect):
+        sock = fake_socket()
+        self.pool.put(sock)
+        connect.return_value = 'fresh'
+        eq_(self.pool.get(), 'fresh')
+        assert sock.close.called
+
+    @patch('search.pool._is_alive', lambda s: True)
+    @patch('search.pool.ConnectionPool.connect')
+    @patch('search.pool.time.time')
+    def test_idle_connections_evicted(self, time, connect):
+        sock = fake_socket()
+        time.return_value = 1000
+        self.pool.put(sock)
+        time.return_value = 1061
+        connect.return_value = 'fresh'
+        eq_(self.pool.get(), 'fresh')
+        assert sock.close.called
+
+    @patch('search.pool.os.getpid')
+    def test_fork_safety(self, getpid):
+        """A forked child never reuses its parent's sockets."""
+        getpid.return_value = self.pool.pid
+        self.pool.put(fake_socket())
+        getpid.return_value = self.pool.pid + 1
+        self.pool._check_pid()
+        eq_(len(self.pool), 0)
+
+
+@patch('search.pool.get_pool')
+def test_run_queries_retries_broken_connection(get_pool):
+    """A broken pooled connection is dropped and the batch retried once."""
+    stale, fresh = fake_socket(), fake_socket()
+    p = Mock()
+    p.get.side_effect = [stale, fresh]
+    get_pool.return_value = p
+
+    sc = Mock()
+    sc._reqs = ['query']
+    sc.RunQueries.side_effect = [None, ['result']]
+
+    eq_(pool.run_queries(sc), ['result'])
+    p.discard.assert_called_with(stale)
+    p.put.assert_called_with(fresh)
+    eq_(sc._socket, None)
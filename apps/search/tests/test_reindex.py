@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from mock import Mock, patch
+from nose.tools import eq_
+import test_utils
+
+from feedback.models import Opinion, opinion_document
+from search import reindex
+
+
+class ReindexTest(test_utils.TestCase):
+    fixtures = ('feedback/opinions',)
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_batches(self):
+        ids = sorted(Opinion.objects.values_list('id', flat=True))
+        got = [[r['id'] for r in rows] for rows in reindex.batches(size=2)]
+        eq_(sum(got, []), ids)
+        assert all(len(rows) <= 2 for rows in got)
+
+        # Resuming skips what was done.
+        got = [r['id'] for rows in reindex.batches(start=ids[1])
+               for r in rows]
+        eq_(got, ids[2:])
+
+    def test_documents_match_opinions(self):
+        o = Opinion.objects.all()[0]
+        row = [r for rows in reindex.batches() for r in rows
+               if r['id'] == o.id][0]
+        eq_(opinion_document(row), o.search_document())
+
+    def test_checkpoint(self):
+        c = reindex.Checkpoint(self.path, 'input')
+        eq_(c.load(), 0)
+        c.save(42)
+        eq_(c.load(), 42)
+        # Only good for the same index.
+        eq_(reindex.Checkpoint(self.path, 'input-2').load(), 0)
+        c.clear()
+        eq_(c.load(), 0)
+
+    @patch('search.reindex.Pool')
+    def test_reindex_resumes(self, Pool):
+        def run(f, args):
+            rows = args[0]
+            return Mock(**{'get.return_value': (rows[-1]['id'], len(rows))})
+        Pool.return_value.apply_async.side_effect = run
+        ids = sorted(Opinion.objects.values_list('id', flat=True))
+        reindex.Checkpoint(self.path, 'input').save(ids[0])
+
+        eq_(reindex.reindex('input', checkpoint=self.path, size=2),
+            len(ids) - 1)
+        assert not os.path.exists(self.path)
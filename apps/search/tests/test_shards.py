@@ -0,0 +1,34 @@
+from nose.tools import eq_
+
+from search.shards import merge_results
+
+
+def match(id, created, **attrs):
+    attrs['created'] = created
+    return dict(id=id, weight=1, attrs=attrs)
+
+
+def test_merge_primary():
+    """Matches are interleaved by created DESC, then paged."""
+    shard1 = dict(error='', total=2, total_found=2,
+                  matches=[match(4, 40), match(1, 10)])
+    shard2 = dict(error='', total=2, total_found=2,
+                  matches=[match(3, 30), match(2, 30)])
+    merged = merge_results([shard1, shard2], offset=1, limit=2,
+                           sort='created DESC, @id DESC')
+    eq_([m['id'] for m in merged['matches']], [3, 2])
+    eq_(merged['total_found'], 4)
+
+
+def test_merge_groups():
+    """Group-by counts are added up across shards."""
+    group = lambda type, count: dict(id=0, weight=1, attrs={
+        'type': type, 'count': count, '@count': count})
+    shard1 = dict(error='', total=2, total_found=2,
+                  matches=[group(1, 5), group(2, 1)])
+    shard2 = dict(error='', total=1, total_found=1, matches=[group(2, 7)])
+    merged = merge_results([shard1, shard2], offset=0, limit=1000,
+                           sort='@count DESC', groupby='type')
+    eq_([(m['attrs']['type'], m['attrs']['count'])
+         for m in merged['matches']], [(2, 8), (1, 5)])
+    eq_(merged['total_found'], 2)
@@ -0,0 +1,71 @@
+from mock import Mock, patch
+from nose.tools import eq_
+
+import sphinxapi as sphinx
+
+from search.sphinxql import SphinxQLClient, escape_query
+
+
+def test_escape_query():
+    eq_(escape_query('foo -bar (baz)'), r'foo \-bar \(baz\)')
+    eq_(escape_query(u'caf\xe9'), 'caf\xc3\xa9')
+
+
+def test_statements():
+    sc = SphinxQLClient('127.0.0.1', 3309)
+    sc.SetFilter('product', (1,))
+    sc.SetFilterRange('created', 10, 20)
+    sc.SetLimits(0, 20)
+    sc.SetSortMode(sphinx.SPH_SORT_EXTENDED, 'created DESC, @id DESC')
+    sc.AddQuery("it's slow", 'opinions')
+
+    sc.SetSelect('type, SUM(1) as count')
+    sc.SetLimits(0, 1000)
+    sc.SetGroupBy('type', sphinx.SPH_GROUPBY_ATTR, '@count DESC')
+    sc.AddQuery('', 'opinions')
+
+    eq_(sc._reqs, [
+        "SELECT * FROM opinions WHERE MATCH('it\\'s slow') AND "
+        "product IN (1) AND created BETWEEN 10 AND 20 "
+        "ORDER BY created DESC, id DESC LIMIT 0, 20",
+        "SELECT type, SUM(1) as count FROM opinions WHERE product IN (1) AND "
+        "created BETWEEN 10 AND 20 GROUP BY type ORDER BY @count DESC "
+        "LIMIT 0, 1000"])
+
+
+def test_keyset_statement():
+    """Cursor pages select by (created, id), which SphinxQL calls ``id``."""
+    sc = SphinxQLClient('127.0.0.1', 3309)
+    sc.SetSelect('*, created < 100 OR (created = 100 AND @id < 7) AS keyset')
+    sc.SetFilter('keyset', (1,))
+    sc.SetLimits(0, 20)
+    sc.SetSortMode(sphinx.SPH_SORT_EXTENDED, 'created DESC, @id DESC')
+    sc.AddQuery('', 'opinions')
+
+    eq_(sc._reqs, [
+        "SELECT *, created < 100 OR (created = 100 AND id < 7) AS keyset "
+        "FROM opinions WHERE keyset IN (1) "
+        "ORDER BY created DESC, id DESC LIMIT 0, 20"])
+
+
+@patch('search.sphinxql.pool.get_pool')
+def test_run_queries(get_pool):
+    """Result sets are turned into sphinxapi style results."""
+    cursor = Mock()
+    cursor.description = [('id',), ('weight',), ('created',)]
+    cursor.fetchall.side_effect = [
+        [(3, 1, 300), (2, 1, 200)],
+        [('total', '2'), ('total_found', '2'), ('time', '0.001')]]
+    conn = Mock()
+    conn.cursor.return_value = cursor
+    get_pool.return_value.get.return_value = conn
+
+    sc = SphinxQLClient('127.0.0.1', 3309)
+    sc.AddQuery('', 'opinions')
+    results = sc.RunQueries()
+
+    assert cursor.execute.call_args[0][0].endswith('; SHOW META; ')
+    eq_([m['id'] for m in results[0]['matches']], [3, 2])
+    eq_(results[0]['matches'][0]['attrs'], {'created': 300})
+    eq_(results[0]['total_found'], 2)
+    get_pool.return_value.put.assert_called_with(conn)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import datetime
 
+from django.conf import settings
 from django.contrib.sites.models import Site
 from django.test.client import Client as TestClient
 
@@ -26,6 +27,14 @@ def test_forms_product_chooser():
     eq_(f.fields['product'].initial, 'mobile')
 
 
+def test_forms_site_id():
+    """Unbound forms default to the product of the request's site."""
+    f = forms.ReporterSearchForm(site_id=settings.MOBILE_SITE_ID)
+    eq_(f.fields['product'].initial, 'mobile')
+    f = forms.ReporterSearchForm(site_id=settings.DESKTOP_SITE_ID)
+    eq_(f.fields['product'].initial, 'firefox')
+
+
 def test_get_period():
     """Let's make sure we can get the right number of days."""
     yesterday = (datetime.date.today() - datetime.timedelta(1)).strftime(
@@ -63,9 +72,13 @@ class PaginationTest(SphinxTestCase):
         assert pq(r.content)('.pager a.newer')
 
     def test_no_next_page(self):
-        """Once we're on page 50, let's not show an older messages link."""
+        """
+        Page numbers stop at page 50; older messages are only a cursor away.
+        """
         for page in (50, 51, 100, 200):
             r = search_request(page=page)
+            eq_(r.context['form'].cleaned_data['page'],
+                settings.SEARCH_MAX_PAGES)
             doc = pq(r.content)
             assert not doc('.pager a.next')
 
@@ -273,6 +286,20 @@ class FeedTest(SphinxTestCase):
         eq_(doc('entry link').attr['href'],
             '%s%s' % (url_base, 'opinion/29'))
 
+    def test_mobile_links(self):
+        """Feeds on the mobile site link to the mobile site."""
+        site, _ = Site.objects.get_or_create(pk=settings.MOBILE_SITE_ID)
+        site.domain = 'm.example.com'
+        site.save()
+        r = self.client.get(reverse('search.feed'),
+                            dict(version='--', date_start='01/01/2000',
+                                 date_end='01/01/2031'),
+                            SITE_ID=settings.MOBILE_SITE_ID)
+        links = [l.get('href') for l in self._pq(r)('link')]
+        assert links
+        for link in links:
+            assert link.startswith('http://m.example.com/'), link
+
     def test_item_title(self):
         """
         If we don't convert opinion type names to unicode, the world will end.
@@ -1,8 +1,14 @@
 # TODO(davedash): liberate from zamboni
 
+import os
 import subprocess
 
 from django.conf import settings
+from django.db import connection, transaction
+
+import commonware.log
+
+log = commonware.log.getLogger('i.sphinx')
 
 call = lambda x: subprocess.Popen(x, stdout=subprocess.PIPE).communicate()
 
@@ -20,6 +26,10 @@ def reindex(rotate=False):
 
     call(calls)[0]
 
+    if rotate:  # pragma: no cover
+        from search.client import invalidate_facets
+        invalidate_facets()
+
 
 def start_sphinx():
     """
@@ -37,3 +47,56 @@ def stop_sphinx():
 
     call([settings.SPHINX_SEARCHD, '--stop', '--config',
           settings.SPHINX_CONFIG_PATH])[0]
+
+
+def _shard():
+    """(i, n) if this box serves shard i of n (c.f. SPHINX_SHARD)."""
+    if os.environ.get('SPHINX_SHARD'):
+        return map(int, os.environ['SPHINX_SHARD'].split('/'))
+
+
+def indexer(*args):
+    """Run Sphinx' indexer with ``args``.  Returns whether it succeeded."""
+    p = subprocess.Popen([settings.SPHINX_INDEXER] + list(args) +
+                         ['--config', settings.SPHINX_CONFIG_PATH],
+                         stdout=subprocess.PIPE)
+    output = p.communicate()[0]
+    if p.returncode:
+        log.error('indexer %s failed (%s): %s' % (' '.join(args),
+                                                  p.returncode, output))
+    return not p.returncode
+
+
+def index_delta():
+    """
+    Rebuild the delta index (new, changed and deleted opinions since the
+    main index was built) and rotate it in.  Returns whether that worked.
+    """
+    return indexer('opinions_delta', '--rotate')
+
+
+def merge_delta():
+    """
+    Fold the delta index into the main index, so the delta (and the work of
+    rebuilding it) stays small.  Returns whether that worked.
+    """
+    if not indexer('--merge', 'opinions', 'opinions_delta', '--rotate'):
+        # The counters still describe the indexes as they are.
+        return False
+
+    # The main index now covers what the delta index covered.
+    shard = _shard()
+    counter = shard[0] + 1 if shard else 0
+    cursor = connection.cursor()
+    cursor.execute('UPDATE search_indexcounter '
+                   'SET max_id = delta_max_id, indexed = delta_indexed '
+                   'WHERE id = %s', [counter])
+    cursor.execute('DELETE FROM search_dirtyopinion WHERE modified < '
+                   '(SELECT delta_indexed FROM search_indexcounter '
+                   ' WHERE id = %s)' +
+                   (' AND opinion_id %%%% %d = %d' % (shard[1], shard[0])
+                    if shard else ''), [counter])
+    transaction.commit_unless_managed()
+    log.info('Merged delta index into the main index.')
+
+    return index_delta()
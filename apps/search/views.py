@@ -3,21 +3,24 @@ import json
 import time
 
 from django.conf import settings
-from django.contrib.sites.models import Site
+from django.contrib.sites.models import Site, SITE_CACHE
 from django.contrib.syndication.views import Feed
 from django.core.paginator import Paginator, InvalidPage, EmptyPage
 from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import urlencode
 
 import commonware.log
 import jingo
 from product_details.version_compare import Version
 from tower import ugettext as _, ugettext_lazy as _lazy
 
+from input import metrics
 from input import (PRODUCTS, PRODUCT_IDS, FIREFOX, LATEST_BETAS,
                    OPINION_PRAISE, OPINION_ISSUE, OPINION_IDEA, OPINION_TYPES)
 from input.decorators import cache_page, forward_mobile
-from input.urlresolvers import reverse
-from search.client import Client, SearchError
+from input.urlresolvers import get_site_id, reverse
+from feedback.models import OpinionCount
+from search.client import get_client, SearchError, DEFAULT_PERIOD
 from search.forms import ReporterSearchForm, PROD_CHOICES, VERSION_CHOICES
 
 log = commonware.log.getLogger('i.search')
@@ -25,9 +28,12 @@ log = commonware.log.getLogger('i.search')
 
 unixtime = lambda s: int(time.mktime(time.strptime(s, '%Y-%m-%d')))
 
+# Aggregates that can be read from the daily OpinionCount rollups.
+ROLLUP_METAS = ('type', 'locale', 'platform', 'day_sentiment')
+
 
 def _get_results(request, meta=[], client=None):
-    form = ReporterSearchForm(request.GET)
+    form = ReporterSearchForm(request.GET, site_id=request.site_id)
     if form.is_valid():
         data = form.cleaned_data
         query = data.get('q', '')
@@ -35,9 +41,27 @@ def _get_results(request, meta=[], client=None):
         version = data.get('version')
         search_opts = _get_results_opts(request, data, product, meta)
         type_filter = search_opts['type'] if 'type' in search_opts else None
-        c = client or Client()
-        opinions = c.query(query, **search_opts)
+
+        # Without a search term the rollups know all about the aggregates.
+        rollup_meta = []
+        if not (query or data.get('manufacturer') or data.get('device')):
+            rollup_meta = [m for m in meta if m in ROLLUP_METAS]
+            search_opts['meta'] = [m for m in meta if m not in rollup_meta]
+
+        c = client or get_client()
+        opinions = c.cached_query(query, **search_opts)
         metas = c.meta
+        if rollup_meta:
+            with metrics.timer('search.rollups'):
+                metas.update(OpinionCount.objects.metas(
+                    rollup_meta,
+                    date_start=(search_opts.get('date_start') or
+                                datetime.date.today() - DEFAULT_PERIOD),
+                    date_end=(search_opts.get('date_end') or
+                              datetime.date.today()),
+                    **dict((k, search_opts.get(k)) for k in
+                           ('type', 'product', 'version', 'platform',
+                            'locale'))))
     else:
         opinions = []
         type_filter = None
@@ -57,8 +81,11 @@ def _get_results_opts(request, data, product, meta=[]):
     search_opts = data
     search_opts['product'] = PRODUCTS[product].id
     search_opts['meta'] = meta
-    search_opts['offset'] = ((data.get('page', 1) - 1) *
-                             settings.SEARCH_PERPAGE)
+    if data.get('cursor'):
+        search_opts['offset'] = 0
+    else:
+        search_opts['offset'] = ((data.get('page', 1) - 1) *
+                                 settings.SEARCH_PERPAGE)
 
     sentiment = data.get('sentiment', '')
     if sentiment == 'happy':
@@ -90,9 +117,37 @@ def get_sentiment(data=[]):
     return r
 
 
+def _site_url(path):
+    """
+    Absolute URL of ``path`` on the current request's site (desktop or
+    mobile).  Sites are cached per process like Site.objects.get_current().
+    """
+    site_id = get_site_id()
+    if site_id not in SITE_CACHE:
+        SITE_CACHE[site_id] = Site.objects.get(pk=site_id)
+    return u'http://%s%s' % (SITE_CACHE[site_id].domain, path)
+
+
+class CursorAtom1Feed(Atom1Feed):
+    """Atom feed linking to the next (older) and previous (newer) pages."""
+
+    def add_root_elements(self, handler):
+        super(CursorAtom1Feed, self).add_root_elements(handler)
+        for rel in ('next', 'previous'):
+            if self.feed.get('%s_url' % rel):
+                handler.addQuickElement(u'link', '', {
+                    u'rel': rel, u'href': self.feed['%s_url' % rel]})
+
+
 class SearchFeed(Feed):
+    """
+    Search results as an Atom feed.
+
+    Feed makes relative links absolute with Site.objects.get_current(), which
+    is always settings.SITE_ID, so all our links are absolute already.
+    """
     # TODO(davedash): Gracefully degrade for unavailable search.
-    feed_type = Atom1Feed
+    feed_type = CursorAtom1Feed
 
     author_name = _lazy('Firefox Input')
     subtitle = _lazy("Search Results in Firefox Beta Feedback.")
@@ -103,8 +158,27 @@ class SearchFeed(Feed):
 
     def link(self, obj):
         """Global feed link. Also used as GUID."""
-        return u'%s?%s' % (reverse('search'),
-                           obj['request'].META['QUERY_STRING'])
+        return _site_url(u'%s?%s' % (reverse('search'),
+                                     obj['request'].META['QUERY_STRING']))
+
+    def feed_url(self, obj):
+        """Link to this very feed."""
+        return _site_url(obj['request'].path)
+
+    def feed_extra_kwargs(self, obj):
+        """Cursor links to the neighbouring pages of this feed."""
+        request = obj['request']
+        extra = {}
+        for rel, attr in (('next', 'next_cursor'),
+                          ('previous', 'prev_cursor')):
+            cursor = getattr(obj['opinions'], attr, None)
+            if cursor:
+                query = dict((k, v) for k, v in request.GET.items()
+                             if k not in ('page', 'cursor'))
+                query['cursor'] = cursor
+                extra['%s_url' % rel] = _site_url(
+                    u'%s?%s' % (reverse('search.feed'), urlencode(query)))
+        return extra
 
     def title(self, obj):
         """Global feed title."""
@@ -137,7 +211,7 @@ class SearchFeed(Feed):
 
     def item_link(self, item):
         """Permalink per item. Also used as GUID."""
-        return item.get_url_path()
+        return _site_url(item.get_url_path())
 
     def item_pubdate(self, item):
         """Publishing date of a comment."""
@@ -152,10 +226,11 @@ class SearchFeed(Feed):
 def get_defaults(form):
     """
     Keep form data as default options for further searches, but remove page
-    from defaults so that every parameter change returns to page 1.
+    and cursor from defaults so that every parameter change returns to page
+    1.
     """
     return dict((k, v) for k, v in form.data.items()
-                if k != 'page' and k in form.fields)
+                if k not in ('page', 'cursor') and k in form.fields)
 
 
 def get_period(form):
@@ -203,7 +278,8 @@ def index(request):
         return jingo.render(request, 'search/unavailable.html',
                            {'search_error': e}, status=500)
 
-    page = form.data.get('page', 1)
+    # Cursor pages always start at the cursor.
+    page = 1 if form.data.get('cursor') else form.data.get('page', 1)
 
     # Get the desktop site's absolute URL for use in the settings tab
     desktop_site = Site.objects.get(id=settings.DESKTOP_SITE_ID)
@@ -239,7 +315,11 @@ def index(request):
             data['page'] = pager.page(pager.num_pages)
 
         data['opinions'] = data['page'].object_list
+        data['next_cursor'] = getattr(results, 'next_cursor', None)
+        data['prev_cursor'] = getattr(results, 'prev_cursor', None)
         data['sent'] = get_sentiment(metas.get('type', {}))
+        # Past a cursor, the pager only counts what's left.
+        data['opinion_count'] = getattr(results, 'count', pager.count)
         data['demo'] = dict(locale=metas.get('locale'),
                             platform=metas.get('platform'),
                             manufacturer=metas.get('manufacturer'),
@@ -269,4 +349,5 @@ def index(request):
     data['defaults'] = get_defaults(form)
     template = 'search/%ssearch.html' % (
         'mobile/' if request.mobile_site else '')
-    return jingo.render(request, template, data)
+    with metrics.timer('search.render'):
+        return jingo.render(request, template, data)
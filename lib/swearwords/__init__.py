@@ -1,19 +1,245 @@
 """
 (Incomplete) bad words list, not to filter every conceivable swear word but
 to encourage constructive feedback.
+
+A word in the list matches a whole word of the text; ``*`` stands for any
+(possibly empty) run of word characters.  Matching is done with tries built
+once from the list: exact words are looked up directly, ``word*`` and
+``*word`` in a prefix and a suffix trie, and ``*word*`` with an Aho-Corasick
+automaton over each word of the text.  The few list entries spanning several
+words (e.g. containing spaces or punctuation) are matched with small regexes,
+only when their literal parts occur in the text at all.
+
+The results are the same as those of matching the text against one
+alternation of all list entries (``badword_re``) with ``findall``.
 """
 import os
 import re
+import string
 
 
 root = os.path.dirname(os.path.realpath(__file__))
 
 WORDLIST = set(
     open(os.path.join(root, 'badwords.txt'), 'r').read().splitlines())
-BADWORD_RE = re.compile(r'(?:[^\w]|^)(%s)(?:[^\w]|$)' % (
-    '|'.join([ r for r in [ '\w*'.join(map(re.escape, w.split('*'))) for
-                            w in WORDLIST ] ])))
+
+# ``\w`` without re.UNICODE.
+WORDCHARS = frozenset(string.ascii_letters + string.digits + '_')
+WORD_RE = re.compile(r'\w+')
+
+# Results for this many distinct words of the text are remembered.
+MEMO_SIZE = 10000
+
+
+def _pattern(word):
+    return '\w*'.join(map(re.escape, word.split('*')))
+
+
+def badword_re(words=WORDLIST):
+    """The regex equivalent of ``Matcher(words)``."""
+    return re.compile(r'(?:[^\w]|^)(%s)(?:[^\w]|$)' % (
+        '|'.join(_pattern(w) for w in words)))
+
+
+def _best(*priorities):
+    """The best (lowest) of the given priorities; None stands for no match."""
+    found = [p for p in priorities if p is not None]
+    return min(found) if found else None
+
+
+def _add(trie, word, priority):
+    node = trie
+    for c in word:
+        node = node.setdefault(c, {})
+    node[None] = _best(priority, node.get(None))
+
+
+def _walk(trie, word):
+    """Priorities of all trie entries that ``word`` starts with."""
+    found = []
+    node = trie
+    for c in word:
+        node = node.get(c)
+        if node is None:
+            break
+        if None in node:
+            found.append(node[None])
+    return found
+
+
+class AhoCorasick(object):
+    """Find which of a set of strings occur in a text, in one pass."""
+
+    def __init__(self, words):
+        # State 0 is the root.  ``out[s]`` is the best priority of all words
+        # ending in state s (following failure links).
+        self.goto, self.fail, self.out = [{}], [0], [None]
+        for word, priority in words:
+            state = 0
+            for c in word:
+                if c not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(None)
+                    self.goto[state][c] = len(self.goto) - 1
+                state = self.goto[state][c]
+            self.out[state] = _best(self.out[state], priority)
+
+        # Breadth first, so failure targets are done before their users.
+        queue = list(self.goto[0].values())
+        while queue:
+            state = queue.pop(0)
+            for c, next in self.goto[state].items():
+                queue.append(next)
+                f = self.fail[state]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[next] = self.goto[f].get(c, 0)
+                if self.fail[next] == next:
+                    self.fail[next] = 0
+                self.out[next] = _best(self.out[next],
+                                       self.out[self.fail[next]])
+
+    def search(self, text):
+        """Best priority of all words occurring in ``text``, or None."""
+        goto, fail, out = self.goto, self.fail, self.out
+        best = None
+        state = 0
+        for c in text:
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if out[state] is not None:
+                best = _best(best, out[state])
+        return best
+
+
+class Matcher(object):
+    """
+    Finds the words of a bad words list in a (lowercase) text.
+
+    Like the alternation regex, list entries are tried in order at every
+    start of a word and the first one matching wins; each entry's position
+    in ``words`` is its priority.
+    """
+
+    def __init__(self, words):
+        self.exact = {}
+        self.prefixes, self.suffixes = {}, {}
+        contains = []
+        # Entries with non-word characters: [(priority, parts, regex)].
+        self.phrases = []
+
+        for priority, word in enumerate(words):
+            parts = word.split('*')
+            literal = ''.join(parts)
+            if not literal or not WORDCHARS.issuperset(literal):
+                self.phrases.append((priority, [p for p in parts if p],
+                    re.compile(r'(%s)(?:[^\w]|$)' % _pattern(word))))
+            elif len(parts) == 1:
+                self.exact[word] = _best(priority, self.exact.get(word))
+            elif len(parts) == 2 and not parts[1]:
+                _add(self.prefixes, parts[0], priority)
+            elif len(parts) == 2 and not parts[0]:
+                _add(self.suffixes, parts[1][::-1], priority)
+            elif len(parts) == 3 and not parts[0] and not parts[2]:
+                contains.append((parts[1], priority))
+            else:
+                # Wildcards elsewhere: treat it like a phrase.
+                self.phrases.append((priority, [p for p in parts if p],
+                    re.compile(r'(%s)(?:[^\w]|$)' % _pattern(word))))
+
+        self.contains = AhoCorasick(contains)
+        self._memo = {}
+
+    def word_priority(self, word):
+        """
+        Best priority of the single-word entries matching ``word`` (a run of
+        word characters), or None.
+        """
+        try:
+            return self._memo[word]
+        except KeyError:
+            pass
+        best = _best(self.exact.get(word), self.contains.search(word),
+                     *(_walk(self.prefixes, word) +
+                       _walk(self.suffixes, word[::-1])))
+
+        if len(self._memo) >= MEMO_SIZE:
+            self._memo.clear()
+        self._memo[word] = best
+        return best
+
+    def find(self, text):
+        """All bad words in ``text``, like ``badword_re().findall(text)``."""
+        phrases = [(priority, regex) for priority, parts, regex in
+                   self.phrases if all(p in text for p in parts)]
+        if phrases:
+            return self._find_with_phrases(text, phrases)
+
+        # Only single words can match, i.e. whole runs of word characters
+        # right after the start of the text or a non-word character.  The
+        # regex consumes the non-word character on either side of a match, so
+        # of two bad words separated by just one of them only the first counts.
+        found = []
+        pos = 0
+        for m in WORD_RE.finditer(text):
+            start, end = m.span()
+            if start - 1 < pos and not start == pos == 0:
+                continue
+            word = m.group()
+            if self.word_priority(word) is not None:
+                found.append(word)
+                pos = end + 1
+        return found
+
+    def _find_with_phrases(self, text, phrases):
+        """Scan ``text`` position by position, exactly like the regex."""
+        found = []
+        n = len(text)
+        pos = 0
+        while pos < n:
+            match = None
+            if text[pos] not in WORDCHARS:
+                match = self._match_at(text, pos + 1, phrases)
+            if match is None and pos == 0:
+                match = self._match_at(text, 0, phrases)
+            if match is None:
+                pos += 1
+                continue
+            start, end = match
+            found.append(text[start:end])
+            # Skip the non-word character after the match, too.
+            pos = end + 1 if end < n else end
+        return found
+
+    def _match_at(self, text, start, phrases):
+        """Span of the best entry matching at ``start``, or None."""
+        best, span = None, None
+        if start < len(text) and text[start] in WORDCHARS:
+            end = WORD_RE.match(text, start).end()
+            best = self.word_priority(text[start:end])
+            if best is not None:
+                span = start, end
+        for priority, regex in phrases:
+            if best is not None and priority > best:
+                break
+            m = regex.match(text, start)
+            if m:
+                return m.span(1)
+        return span
+
+
+_matcher = None
+
+
+def get_matcher():
+    global _matcher
+    if _matcher is None:
+        _matcher = Matcher(list(WORDLIST))
+    return _matcher
+
 
 def find_swearwords(str):
     """Find swearwords in a string."""
-    return BADWORD_RE.findall(str.lower())
+    return get_matcher().find(str.lower())
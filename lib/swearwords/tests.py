@@ -1,3 +1,6 @@
+from nose.tools import eq_
+
+
 def test_swearwords():
     """
     >>> from swearwords import find_swearwords
@@ -5,3 +8,17 @@ def test_swearwords():
     ['shit', 'piss', 'fuck', 'cunt', 'cocksucker', 'motherfucker', 'tits']
     """
     pass
+
+
+def test_matches_regex():
+    """The matcher finds exactly what the alternation regex finds."""
+    from swearwords import Matcher, badword_re
+    words = ['ass', '*cock*', 'arse*', '*dyke', 'blow job', 'blow', '@$$',
+             'sh!t', '*sh!t*', 'shi+', 'jerk-off']
+    regex, matcher = badword_re(words), Matcher(words)
+    for text in ['ass', 'ass ass', 'ass  ass', 'ass, ass', 'badass ass',
+                 'cocky', 'peacock!', 'arsehole arse', 'bulldyke dykes',
+                 'a blow job', 'blow jobs', '@$$ and @$$$', '-@$$',
+                 'sh!t sh!ts sh!tty', 'shi+ shit', 'jerk-offs jerk-off',
+                 u'caf\xe9 ass\xe9', 'x_ass ass_ 2ass ass2', '', ' ', '!!']:
+        eq_(matcher.find(text), regex.findall(text), text)
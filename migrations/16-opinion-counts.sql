@@ -0,0 +1,18 @@
+CREATE TABLE `feedback_opinioncount` (
+    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `day` date NOT NULL,
+    `type` smallint UNSIGNED NOT NULL,
+    `product` smallint UNSIGNED NOT NULL,
+    `version` varchar(30) NOT NULL,
+    `platform` varchar(30) NOT NULL,
+    `locale` varchar(30) NOT NULL,
+    `count` integer NOT NULL,
+    UNIQUE (`day`, `type`, `product`, `version`, `platform`, `locale`)
+) ENGINE=InnoDB CHARSET=utf8;
+
+INSERT INTO `feedback_opinioncount`
+    (`day`, `type`, `product`, `version`, `platform`, `locale`, `count`)
+SELECT DATE(`created`), `type`, `product`, `version`, `platform`, `locale`,
+       COUNT(*)
+FROM `feedback_opinion`
+GROUP BY DATE(`created`), `type`, `product`, `version`, `platform`, `locale`;
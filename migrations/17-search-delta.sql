@@ -0,0 +1,13 @@
+CREATE TABLE `search_dirtyopinion` (
+    `opinion_id` integer UNSIGNED NOT NULL PRIMARY KEY,
+    `modified` datetime NOT NULL,
+    KEY (`modified`)
+) ENGINE=InnoDB CHARSET=utf8;
+
+CREATE TABLE `search_indexcounter` (
+    `id` integer UNSIGNED NOT NULL PRIMARY KEY,
+    `max_id` integer UNSIGNED NOT NULL,
+    `indexed` datetime,
+    `delta_max_id` integer UNSIGNED NOT NULL,
+    `delta_indexed` datetime
+) ENGINE=InnoDB CHARSET=utf8;
@@ -0,0 +1,6 @@
+CREATE TABLE `search_attribute` (
+    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `field` varchar(30) NOT NULL,
+    `value` varchar(255) CHARACTER SET utf8 COLLATE utf8_bin NOT NULL,
+    UNIQUE (`field`, `value`)
+) ENGINE=InnoDB CHARSET=utf8;
@@ -0,0 +1,7 @@
+-- Duplicate detection looks up recent opinions by this hash (see
+-- feedback.utils.description_hash).  Older opinions don't need one: only the
+-- last few minutes are checked.
+ALTER TABLE `feedback_opinion`
+    ADD COLUMN `description_hash` varchar(40) NOT NULL DEFAULT '',
+    ADD INDEX `feedback_opinion_description_hash_created`
+        (`description_hash`, `created`);
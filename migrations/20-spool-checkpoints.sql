@@ -0,0 +1,5 @@
+CREATE TABLE `input_spoolcheckpoint` (
+    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,
+    `name` varchar(255) NOT NULL UNIQUE,
+    `offset` integer UNSIGNED NOT NULL
+) ENGINE=InnoDB CHARSET=utf8;
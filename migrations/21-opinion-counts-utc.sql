@@ -0,0 +1,16 @@
+-- Count opinions by UTC day and by the locale the search index files them
+-- under (c.f. feedback.models.OpinionCount), like OpinionCount.objects.rebuild.
+DELETE FROM `feedback_opinioncount`;
+
+INSERT INTO `feedback_opinioncount`
+    (`day`, `type`, `product`, `version`, `platform`, `locale`, `count`)
+SELECT DATE('1970-01-01') + INTERVAL UNIX_TIMESTAMP(`created`) DIV 86400 DAY,
+       `type`, `product`, `version`, `platform`,
+       IF(`locale` IN ('zh-TW', 'pa-IN', 'ne-NP', 'en-GB', 'bn-IN', 'en-NZ',
+                       'pt-BR', 'nb-NO', 'gu-IN', 'zh-CN', 'tt-RU', 'fur-IT',
+                       'pt-PT', 'nn-NO', 'fy-NL', 'en-CA', 'fj-FJ', 'en-US',
+                       'en-ZA', 'bn-BD', 'sv-SE', 'en-AU', 'hy-AM'),
+          `locale`, SUBSTRING_INDEX(`locale`, '-', 1)) AS `index_locale`,
+       COUNT(*)
+FROM `feedback_opinion`
+GROUP BY 1, `type`, `product`, `version`, `platform`, `index_locale`;
@@ -287,9 +287,33 @@ INSTALLED_APPS = [
 # Where to store product details
 PROD_DETAILS_DIR = path('lib/product_details_json')
 
+# How many parsed user agent strings each process keeps.
+UA_PARSE_CACHE_SIZE = 1000
+
+# How many Accept-Language headers each process remembers the negotiated
+# locales for (see input.urlresolvers.negotiate_language).
+ACCEPT_LANGUAGE_CACHE_SIZE = 1000
+
 # Term filter options
 MIN_TERM_LENGTH = 3
 MAX_TERM_LENGTH = 25
+# Terms are extracted in the background, in batches: once this many opinions
+# are waiting, or this many milliseconds after the first one.
+TERM_BATCH_SIZE = 100
+TERM_BATCH_MS = 5000
+
+# The same feedback submitted again within this many seconds is rejected.
+FEEDBACK_DEDUPE_WINDOW = 60 * 5
+
+# Write-behind mode: new feedback is appended to a local spool file and
+# written to the database in batches by `./manage.py cron drain_spool 1`,
+# which must run on every web head (see input.spool).
+FEEDBACK_SPOOL = False
+FEEDBACK_SPOOL_DIR = path('tmp/spool')
+FEEDBACK_SPOOL_BATCH_SIZE = 100
+
+# Most opinions accepted by one request to the bulk feedback endpoint.
+BULK_FEEDBACK_MAX_ITEMS = 500
 
 # Number of items to show in the "Trends" box and Messages box.
 MESSAGES_COUNT = 10
@@ -305,15 +329,65 @@ SPHINX_CATALOG_PATH = path('tmp/data/sphinx')
 SPHINX_LOG_PATH = path('tmp/log/searchd')
 SPHINX_CONFIG_PATH = path('configs/sphinx/sphinx.conf')
 
+# Persistent searchd connections kept per process (0 disables pooling), and
+# how long (in seconds) an idle connection may sit in the pool.
+SPHINX_POOL_SIZE = 4
+SPHINX_POOL_MAX_IDLE = 60
+
+# Changed opinions are reindexed into the delta index this many seconds after
+# a save (None: only on merge_delta_index/full rebuilds).
+SPHINX_DELTA_DELAY = 10
+
+# How Client talks to searchd: 'api' (sphinxapi's binary protocol) or
+# 'sphinxql' (one multi-statement batch over the mysql41 listener).
+SPHINX_TRANSPORT = 'api'
+
+# Split the opinions index over several searchd processes and query them in
+# parallel. Shard i of n is built and served by running the sphinx config
+# with SPHINX_SHARD=i/n in the environment; it listens on SPHINX_PORT +
+# 1000 * (i + 1), e.g. for four shards:
+# SPHINX_SHARDS = [(SPHINX_HOST, SPHINX_PORT + 1000 * (i + 1))
+#                  for i in range(4)]
+SPHINX_SHARDS = []
+
 TEST_SPHINX_PORT = 3414
 TEST_SPHINXQL_PORT = 3409
 TEST_SPHINX_CATALOG_PATH = path('tmp/test/data/sphinx')
 TEST_SPHINX_LOG_PATH = path('tmp/test/log/searchd')
 
+# Search backend used for reads: Sphinx (search.client.Client) or
+# ElasticSearch (search.elastic.ElasticClient).
+SEARCH_BACKEND = 'search.client.Client'
+
 SEARCH_MAX_RESULTS = 1000
 SEARCH_PERPAGE = 20  # results per page
 SEARCH_MAX_PAGES = SEARCH_MAX_RESULTS / SEARCH_PERPAGE
 
+# Cache facet (meta query) results per filter set until the index rotates.
+SEARCH_FACET_CACHE = True
+SEARCH_FACET_CACHE_TIMEOUT = CACHE_DEFAULT_PERIOD
+
+# Cache whole search results (see BaseClient.cached_query).  Results are
+# fresh for SEARCH_RESULT_CACHE_TIMEOUT seconds; after that one worker
+# refreshes them while the others keep serving the stale copy.  Stale results
+# are also served for up to SEARCH_RESULT_CACHE_GRACE seconds when the search
+# backend errors out.
+SEARCH_RESULT_CACHE = True
+SEARCH_RESULT_CACHE_TIMEOUT = CACHE_DEFAULT_PERIOD
+SEARCH_RESULT_CACHE_GRACE = 60 * 30
+SEARCH_RESULT_CACHE_LOCK_TIMEOUT = 30
+
+# Search queries taking longer than this (in ms) are logged to i.search.slow.
+SEARCH_SLOW_QUERY_MS = 1000
+
+## Metrics
+# Where input.metrics sends timings and counters: NullSink, LocalSink (in
+# memory) or StatsdSink.
+METRICS_BACKEND = 'input.metrics.NullSink'
+STATSD_HOST = '127.0.0.1'
+STATSD_PORT = 8125
+STATSD_PREFIX = 'input.'
+
 TEST_RUNNER = 'test_utils.runner.RadicalTestSuiteRunner'
 
 CLUSTER_SIM_THRESHOLD = 2
@@ -340,8 +414,17 @@ ARECIBO_SERVER_URL = ""
 
 ## ElasticSearch
 ES_HOSTS = []
+# An alias for the live index; ``cron index_all`` builds versioned indexes
+# (``input-<timestamp>``) behind it.
 ES_INDEX = 'input'
+ES_REPLICAS = 1
 ES_DISABLED = True
+# Saved and deleted opinions are sent to ElasticSearch in bulk: once this many
+# updates are queued, or this many milliseconds after the first one.
+SEARCH_INDEX_BATCH_SIZE = 100
+SEARCH_INDEX_BATCH_MS = 2000
+# Where ``cron index_all`` keeps track of how far it got.
+SEARCH_REINDEX_CHECKPOINT = path('tmp/reindex.json')
 ## FEATURE FLAGS:
 # Setting this to False allows feedback to be collected from any user agent.
 # (good for testing)
@@ -1,2 +1,6 @@
 DISABLE_TERMS = True
 ES_DISABLED = True
+SEARCH_FACET_CACHE = False
+SEARCH_RESULT_CACHE = False
+METRICS_BACKEND = 'input.metrics.LocalSink'
+SPHINX_DELTA_DELAY = None